@@ -17,6 +17,10 @@ import RecentDetections from "./RecentDetections";
 import PriorityChart from "./PriorityChart";
 import LiveFeed from "./LiveFeed";
 
+const API_URL = "http://localhost:5000"; // Update with your actual backend URL
+const MAX_RECENT = 20;
+const STREAM_URL = "http://localhost:8081/stream?width=960"; // Annotated MJPEG re-stream (config.RESTREAM_PORT)
+
 const Dashboard = () => {
     const [stats, setStats] = useState({
         totalDetections: 0,
@@ -31,83 +35,61 @@ const Dashboard = () => {
     const [isConnected, setIsConnected] = useState(false);
     const [lastUpdate, setLastUpdate] = useState(null);
 
-    // Simulate real-time data updates (replace with actual API calls)
+    const fetchData = async () => {
+        try {
+            const [statsResponse, detectionsResponse] = await Promise.all([
+                fetch(`${API_URL}/api/stats`),
+                fetch(`${API_URL}/api/detections?limit=${MAX_RECENT}`),
+            ]);
+            const statsData = await statsResponse.json();
+            setStats(statsData);
+            setRecentDetections(await detectionsResponse.json());
+            // Connected = API reachable and a detector is publishing
+            setIsConnected(Boolean(statsData.live));
+            setLastUpdate(new Date());
+        } catch (error) {
+            console.error("Failed to fetch detection data:", error);
+            setIsConnected(false);
+        }
+    };
+
+    // Live updates pushed by the API (server-sent events); EventSource reconnects on its own
     useEffect(() => {
-        // Simulated data - replace with actual fetch from your Python backend
-        const mockData = {
-            totalDetections: 147,
-            highPriority: 12,
-            mediumPriority: 45,
-            lowPriority: 90,
-            withPlates: 98,
-            withoutPlates: 49,
-        };
-
-        const mockDetections = [
-            {
-                id: 1,
-                timestamp: "2025-11-05 14:30:15",
-                vehicle: "car",
-                priority: "LOW",
-                plate: "ABC1234",
-                confidence: 0.85,
-            },
-            {
-                id: 2,
-                timestamp: "2025-11-05 14:30:18",
-                vehicle: "truck",
-                priority: "MEDIUM",
-                plate: "XYZ9876",
-                confidence: 0.92,
-            },
-            {
-                id: 3,
-                timestamp: "2025-11-05 14:30:22",
-                vehicle: "ambulance",
-                priority: "HIGH",
-                plate: "EMG911",
-                confidence: 0.88,
-            },
-            {
-                id: 4,
-                timestamp: "2025-11-05 14:30:25",
-                vehicle: "bus",
-                priority: "MEDIUM",
-                plate: "BUS456",
-                confidence: 0.79,
-            },
-            {
-                id: 5,
-                timestamp: "2025-11-05 14:30:28",
-                vehicle: "motorcycle",
-                priority: "LOW",
-                plate: "N/A",
-                confidence: 0.91,
-            },
-        ];
-
-        setStats(mockData);
-        setRecentDetections(mockDetections);
-        setIsConnected(true);
-        setLastUpdate(new Date());
-
-        // Simulate periodic updates
-        const interval = setInterval(() => {
+        const source = new EventSource(`${API_URL}/api/stream`);
+
+        source.addEventListener("snapshot", (event) => {
+            const data = JSON.parse(event.data);
+            setStats(data.stats);
+            setRecentDetections(data.detections.slice(0, MAX_RECENT));
+            setIsConnected(Boolean(data.stats.live));
+            setLastUpdate(new Date());
+        });
+        source.addEventListener("detections", (event) => {
+            // Oldest first; the table shows newest first
+            const detections = JSON.parse(event.data).reverse();
+            setRecentDetections((previous) =>
+                detections.concat(previous).slice(0, MAX_RECENT)
+            );
+            setLastUpdate(new Date());
+        });
+        source.addEventListener("stats", (event) => {
+            setStats(JSON.parse(event.data));
+            setIsConnected(true);
             setLastUpdate(new Date());
-        }, 5000);
+        });
+        source.onerror = () => setIsConnected(false);
 
-        return () => clearInterval(interval);
+        return () => source.close();
     }, []);
 
     const handleRefresh = () => {
-        // Implement actual data refresh
-        setLastUpdate(new Date());
+        fetchData();
     };
 
     const handleExport = () => {
         // Export Excel file and open in new tab
         // Assuming your Python backend has an endpoint that serves the Excel file
-        const exportUrl = "http://localhost:5000/api/export"; // Update with your actual backend URL
+        const exportUrl = `${API_URL}/api/export`;
 
         // Option 1: If backend returns file path, open it directly
         window.open(exportUrl, "_blank");
@@ -208,7 +190,7 @@ const Dashboard = () => {
                 </div>
 
                 {/* Live Feed */}
-                <LiveFeed isConnected={isConnected} />
+                <LiveFeed isConnected={isConnected} streamUrl={STREAM_URL} />
             </div>
 
             {/* Footer */}
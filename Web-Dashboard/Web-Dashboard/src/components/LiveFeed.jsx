@@ -1,7 +1,20 @@
-import React from "react";
+import React, { useState, useEffect } from "react";
 import { Video, WifiOff } from "lucide-react";
 
-const LiveFeed = ({ isConnected }) => {
+const LiveFeed = ({ isConnected, streamUrl }) => {
+    const [streamError, setStreamError] = useState(false);
+    const [attempt, setAttempt] = useState(0);
+
+    // Reconnect the <img> when the detector comes back
+    useEffect(() => {
+        if (isConnected) {
+            setStreamError(false);
+            setAttempt((n) => n + 1);
+        }
+    }, [isConnected]);
+
+    const showStream = isConnected && streamUrl && !streamError;
+
     return (
         <div className="card live-feed-card">
             <div className="card-header">
@@ -9,37 +22,33 @@ const LiveFeed = ({ isConnected }) => {
                 <Video size={20} className="card-icon" />
             </div>
             <div className="live-feed-content">
-                {isConnected ? (
+                {showStream ? (
                     <div className="video-placeholder">
                         <div className="video-frame">
-                            <div className="video-overlay">
-                                <div className="detection-box box-green">
-                                    <span className="detection-label">
-                                        car [LOW] | ABC1234
-                                    </span>
-                                </div>
-                                <div className="detection-box box-orange">
-                                    <span className="detection-label">
-                                        truck [MEDIUM] | XYZ9876
-                                    </span>
-                                </div>
-                            </div>
+                            {/* Annotated MJPEG re-stream served by the detector */}
+                            <img
+                                key={attempt}
+                                src={streamUrl}
+                                alt="Annotated camera feed"
+                                style={{ width: "100%", display: "block" }}
+                                onError={() => setStreamError(true)}
+                            />
                             <div className="video-info">
                                 <span>🟢 Live</span>
-                                <span>1920x1080</span>
-                                <span>30 FPS</span>
                             </div>
                         </div>
-                        <p className="feed-note">
-                            Connect to ESP32-CAM or video source to view live
-                            feed
-                        </p>
                     </div>
                 ) : (
                     <div className="disconnected-state">
                         <WifiOff size={48} />
                         <p>Camera disconnected</p>
-                        <button className="btn btn-primary">
+                        <button
+                            className="btn btn-primary"
+                            onClick={() => {
+                                setStreamError(false);
+                                setAttempt((n) => n + 1);
+                            }}
+                        >
                             Connect Camera
                         </button>
                     </div>
@@ -64,22 +64,26 @@ const RecentDetections = ({ detections }) => {
                                     <code>{detection.plate}</code>
                                 </td>
                                 <td className="confidence-cell">
-                                    <div className="confidence-bar">
-                                        <div
-                                            className="confidence-fill"
-                                            style={{
-                                                width: `${
+                                    {detection.confidence == null ? (
+                                        <span className="confidence-text">—</span>
+                                    ) : (
+                                        <div className="confidence-bar">
+                                            <div
+                                                className="confidence-fill"
+                                                style={{
+                                                    width: `${
+                                                        detection.confidence * 100
+                                                    }%`,
+                                                }}
+                                            ></div>
+                                            <span className="confidence-text">
+                                                {(
                                                     detection.confidence * 100
-                                                }%`,
-                                            }}
-                                        ></div>
-                                        <span className="confidence-text">
-                                            {(
-                                                detection.confidence * 100
-                                            ).toFixed(0)}
-                                            %
-                                        </span>
-                                    </div>
+                                                ).toFixed(0)}
+                                                %
+                                            </span>
+                                        </div>
+                                    )}
                                 </td>
                             </tr>
                         ))}
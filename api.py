@@ -1,12 +1,41 @@
-from flask import Flask, send_file, jsonify
+from flask import Flask, Response, send_file, jsonify, request
 from flask_cors import CORS
 import os
 import glob
-from datetime import datetime
+import json
+import time
+
+import config
+from detection_store import DetectionStore
+from live_stats import SnapshotFeed, read_snapshot
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
+EXPORT_MIMETYPES = {
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.csv': 'text/csv',
+}
+
+# Shared by every /api/stream client
+live_feed = SnapshotFeed()
+
+_latest_export = {'dir_mtime': None, 'file': None}
+
+def find_latest_export():
+    """Most recent log export written by the detection system (config.EXPORT_FORMAT decides xlsx/csv)"""
+    # Only re-glob when a file was added to or removed from the directory
+    dir_mtime = os.stat('.').st_mtime_ns
+    if dir_mtime == _latest_export['dir_mtime'] and (
+            _latest_export['file'] is None or os.path.exists(_latest_export['file'])):
+        return _latest_export['file']
+    files = []
+    for ext in EXPORT_MIMETYPES:
+        files.extend(glob.glob(f'{config.EXCEL_FILENAME_PREFIX}_*{ext}'))
+    latest = max(files, key=os.path.getctime) if files else None
+    _latest_export.update(dir_mtime=dir_mtime, file=latest)
+    return latest
+
 @app.route('/api/export', methods=['GET'])
 def export_excel():
     """
@@ -14,19 +43,16 @@ def export_excel():
     Opens in a new tab in the browser.
     """
     try:
-        # Find the most recent Excel file in the current directory
-        excel_files = glob.glob('vehicle_detections_*.xlsx')
+        # Find the most recent export (xlsx or csv) in the current directory
+        latest_file = find_latest_export()
         
-        if not excel_files:
+        if latest_file is None:
             return jsonify({'error': 'No Excel file found. Please run the detection system first.'}), 404
         
-        # Get the most recent file
-        latest_file = max(excel_files, key=os.path.getctime)
-        
         # Send the file
         return send_file(
             latest_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            mimetype=EXPORT_MIMETYPES[os.path.splitext(latest_file)[1]],
             as_attachment=False,  # Open in browser instead of download
             download_name=os.path.basename(latest_file)
         )
@@ -39,55 +65,121 @@ def download_excel():
     Endpoint to download the most recent Excel file.
     """
     try:
-        # Find the most recent Excel file
-        excel_files = glob.glob('vehicle_detections_*.xlsx')
+        # Find the most recent export
+        latest_file = find_latest_export()
         
-        if not excel_files:
+        if latest_file is None:
             return jsonify({'error': 'No Excel file found. Please run the detection system first.'}), 404
         
-        latest_file = max(excel_files, key=os.path.getctime)
-        
         # Send the file as download
         return send_file(
             latest_file,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            mimetype=EXPORT_MIMETYPES[os.path.splitext(latest_file)[1]],
             as_attachment=True,
             download_name=os.path.basename(latest_file)
         )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+EMPTY_STATS = {
+    'totalDetections': 0,
+    'highPriority': 0,
+    'mediumPriority': 0,
+    'lowPriority': 0,
+    'otherObjects': 0,
+    'withPlates': 0,
+    'withoutPlates': 0,
+    'byClass': {},
+    'byCamera': {},
+    'cameras': {},
+    'timeline': [],
+}
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """
-    Placeholder endpoint for real-time statistics.
-    TODO: Integrate with actual detection system.
+    Live detection statistics, read from the detector's shared-memory snapshot.
+    'live' is false when no detector is running.
     """
-    return jsonify({
-        'totalDetections': 147,
-        'highPriority': 12,
-        'mediumPriority': 45,
-        'lowPriority': 90,
-        'withPlates': 98,
-        'withoutPlates': 49
-    })
+    snapshot = read_snapshot()
+    if snapshot is None:
+        return jsonify(dict(EMPTY_STATS, live=False))
+    return jsonify(dict(snapshot['stats'], live=True, updatedAt=snapshot['updatedAt']))
 
 @app.route('/api/detections', methods=['GET'])
 def get_detections():
     """
-    Placeholder endpoint for recent detections.
-    TODO: Integrate with actual detection system.
+    Most recent detections (newest first) from the detector's shared-memory snapshot.
+    Params: limit (default all, up to config.STATS_RECENT_SIZE)
+    """
+    snapshot = read_snapshot()
+    detections = snapshot['detections'] if snapshot else []
+    limit = request.args.get('limit', type=int)
+    if limit:
+        detections = detections[:limit]
+    return jsonify(detections)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """
+    Server-sent events with live updates, instead of polling /api/stats and /api/detections.
+    Events: 'snapshot' (stats + recent detections, on connect), 'detections' (new ones,
+    oldest first) and 'stats'. All clients share one reader; each is throttled to one
+    message per config.STREAM_CLIENT_INTERVAL, with updates coalesced in between.
     """
-    return jsonify([
-        {
-            'id': 1,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'vehicle': 'car',
-            'priority': 'LOW',
-            'plate': 'ABC1234',
-            'confidence': 0.85
-        }
-    ])
+    subscription, snapshot = live_feed.subscribe()
+
+    def events():
+        try:
+            yield "retry: 2000\n\n"
+            if snapshot is None:
+                yield sse_event('snapshot', {'stats': dict(EMPTY_STATS, live=False), 'detections': []})
+            else:
+                yield sse_event('snapshot', {
+                    'stats': dict(snapshot['stats'], live=True, updatedAt=snapshot['updatedAt']),
+                    'detections': snapshot['detections'],
+                })
+            while True:
+                detections, stats = subscription.get(timeout=config.STREAM_HEARTBEAT)
+                if detections:
+                    yield sse_event('detections', detections)
+                if stats is not None:
+                    yield sse_event('stats', dict(stats, live=True))
+                if not detections and stats is None:
+                    yield ": keep-alive\n\n"  # Also how a closed connection gets noticed
+        finally:
+            live_feed.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # Don't let a reverse proxy buffer the stream
+    })
+
+@app.route('/api/detections/search', methods=['GET'])
+def search_detections():
+    """
+    Query the columnar detection store.
+    Params: plate, camera, days (default 7) or from/to (Unix seconds), limit (default 1000)
+    """
+    try:
+        store = DetectionStore()
+        plate = request.args.get('plate')
+        camera = request.args.get('camera')
+        limit = request.args.get('limit', 1000, type=int)
+        if 'from' in request.args or 'to' in request.args:
+            start = request.args.get('from', type=float)
+            end = request.args.get('to', type=float)
+        else:
+            end = time.time()
+            start = end - request.args.get('days', 7, type=float) * 86400
+        table = store.query(start, end, plate=plate, camera=camera).sort_by('ts')
+        rows = store.to_rows(table.slice(max(0, len(table) - limit)))
+        return jsonify({'count': len(table), 'detections': rows})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -102,6 +194,8 @@ if __name__ == '__main__':
     print("  - GET /api/export/download - Download Excel file")
     print("  - GET /api/stats           - Get detection statistics")
     print("  - GET /api/detections      - Get recent detections")
+    print("  - GET /api/stream          - Live updates (server-sent events)")
+    print("  - GET /api/detections/search?plate=ABC123&days=7 - Search stored detections")
     print("  - GET /api/health          - Health check")
     
-    app.run(debug=True, port=5000, host='0.0.0.0')
+    app.run(debug=True, port=5000, host='0.0.0.0', threaded=True)
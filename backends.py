@@ -0,0 +1,395 @@
+"""
+Pluggable inference backends for the ESP32-CAM detection system
+
+Every backend takes a BGR frame and returns an (N, 6) float32 array of
+x1, y1, x2, y2, conf, cls in that frame's pixel coordinates, plus a `names`
+dict (class id -> label).
+
+  - torch:     ultralytics + PyTorch (default, always available)
+  - onnx:      ONNX Runtime on CPU, optionally INT8 (dynamic) quantised
+  - openvino:  OpenVINO runtime on CPU, reading the same exported ONNX file
+
+All backends share one preprocessing step (Letterbox): each frame is resized
+once straight into a reused, fixed-shape model input buffer, and boxes are
+mapped back to the frame with the inverse transform in one vectorised step.
+
+The ONNX file is exported from the .pt weights once and kept in an on-disk
+cache keyed by the weights' hash, input size and quantisation, so later runs
+start straight from the cached artifact. If the requested backend can't be
+loaded, load_backend() falls back to torch.
+"""
+import ast
+import hashlib
+import os
+import shutil
+
+import cv2
+import numpy as np
+
+import config
+from metrics import timed
+
+try:
+    from ultralytics import YOLO
+except Exception:
+    YOLO = None
+
+try:
+    import onnxruntime as ort
+except Exception:
+    ort = None
+
+try:
+    import openvino as ov
+except Exception:
+    ov = None
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+
+def results_to_array(results):
+    """
+    Pull every box out of ultralytics Results in one go
+
+    Returns:
+        (N, 6) float32 array of x1, y1, x2, y2, conf, cls
+    """
+    chunks = []
+    for r in results:
+        boxes = r.boxes
+        if boxes is None or len(boxes) == 0:
+            continue
+        data = boxes.data
+        data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+        # Tracking results carry an extra id column before conf/cls
+        chunks.append(np.concatenate([data[:, :4], data[:, -2:]], axis=1))
+    if not chunks:
+        return np.empty((0, 6), dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+
+def model_input_size(scale=1.0, base=None, stride=32):
+    """Model input size for a processing scale, rounded to the network stride"""
+    base = base or config.INFERENCE_IMAGE_SIZE
+    return max(stride, int(round(base * scale / stride)) * stride)
+
+
+class Letterbox:
+    """
+    Single-resize preprocessing into a reused model input buffer
+
+    The frame is resized once (keeping aspect ratio) straight into a padded
+    size x size canvas, then written as normalised RGB CHW floats into a
+    preallocated (batch, 3, size, size) tensor. Nothing is reallocated between
+    frames of the same shape.
+    """
+
+    def __init__(self, size, max_batch=1):
+        self.size = size
+        self.canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+        self.tensor = np.empty((max_batch, 3, size, size), dtype=np.float32)
+        self.frame_shape = None
+        self.transform = None
+        self.roi = None
+
+    def _plan(self, frame_shape):
+        """Work out (and cache) the resize + padding for one input shape"""
+        height, width = frame_shape[:2]
+        gain = min(self.size / height, self.size / width)
+        new_w, new_h = int(round(width * gain)), int(round(height * gain))
+        left = int(round((self.size - new_w) / 2 - 0.1))
+        top = int(round((self.size - new_h) / 2 - 0.1))
+        self.frame_shape = frame_shape
+        self.transform = (gain, left, top)
+        self.roi = (top, top + new_h, left, left + new_w, new_w, new_h)
+        self.canvas[:] = 114
+
+    def __call__(self, frame, index=0):
+        """
+        Letterbox one frame into slot `index` of the input tensor
+
+        Returns:
+            (tensor_view, transform) where transform = (gain, pad_x, pad_y)
+        """
+        if index >= len(self.tensor):
+            self._grow(index + 1)
+        if frame.shape != self.frame_shape:
+            self._plan(frame.shape)
+        y1, y2, x1, x2, new_w, new_h = self.roi
+        if (new_w, new_h) == frame.shape[1::-1]:
+            self.canvas[y1:y2, x1:x2] = frame
+        else:
+            cv2.resize(frame, (new_w, new_h), dst=self.canvas[y1:y2, x1:x2], interpolation=cv2.INTER_LINEAR)
+        # BGR HWC uint8 -> RGB CHW float32 in [0, 1], written in place
+        np.multiply(self.canvas[..., ::-1].transpose(2, 0, 1), 1 / 255.0, out=self.tensor[index], casting='unsafe')
+        return self.tensor[index:index + 1], self.transform
+
+    def _grow(self, batch_size):
+        grown = np.empty((batch_size, 3, self.size, self.size), dtype=np.float32)
+        grown[:len(self.tensor)] = self.tensor
+        self.tensor = grown
+
+    def batch(self, frames):
+        """Letterbox several frames into one (N, 3, size, size) tensor"""
+        if len(frames) > len(self.tensor):
+            self._grow(len(frames))
+        transforms = [self(frame, i)[1] for i, frame in enumerate(frames)]
+        return self.tensor[:len(frames)], transforms
+
+
+def scale_boxes(raw, transform, frame_shape):
+    """Map (N, 6) boxes from model-input pixels back to the original frame, in place"""
+    gain, pad_x, pad_y = transform
+    raw[:, [0, 2]] -= pad_x
+    raw[:, [1, 3]] -= pad_y
+    raw[:, :4] /= gain
+    height, width = frame_shape[:2]
+    raw[:, [0, 2]] = np.clip(raw[:, [0, 2]], 0, width)
+    raw[:, [1, 3]] = np.clip(raw[:, [1, 3]], 0, height)
+    return raw
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression, returns kept indices (highest score first)"""
+    order = np.argsort(-scores)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+def decode_yolov8(output, conf_threshold, iou_threshold, max_det=300):
+    """
+    Decode a raw YOLOv8 head output (1, 4 + num_classes, num_anchors)
+
+    Returns:
+        (N, 6) float32 array of x1, y1, x2, y2, conf, cls in model-input pixels
+    """
+    pred = output[0].T  # (anchors, 4 + classes)
+    scores = pred[:, 4:]
+    cls = scores.argmax(axis=1)
+    conf = scores[np.arange(len(cls)), cls]
+    mask = conf > conf_threshold
+    if not mask.any():
+        return np.empty((0, 6), dtype=np.float32)
+    pred, cls, conf = pred[mask], cls[mask], conf[mask]
+
+    boxes = np.empty((len(pred), 4), dtype=np.float32)
+    boxes[:, :2] = pred[:, :2] - pred[:, 2:4] / 2
+    boxes[:, 2:] = pred[:, :2] + pred[:, 2:4] / 2
+
+    # Class-aware NMS: shift each class into its own region
+    offsets = cls[:, None].astype(np.float32) * 7680
+    keep = nms(boxes + offsets, conf, iou_threshold)[:max_det]
+    return np.concatenate([boxes[keep], conf[keep, None], cls[keep, None].astype(np.float32)], axis=1)
+
+
+class ModelCache:
+    """
+    Exported model artifacts on disk, keyed by source weights hash + export settings
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or config.MODEL_CACHE_DIR
+
+    @staticmethod
+    def file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    def path_for(self, weights, imgsz, int8=False):
+        base = os.path.splitext(os.path.basename(weights))[0]
+        suffix = '-int8' if int8 else ''
+        name = f"{base}-{self.file_hash(weights)}-{imgsz}{suffix}.onnx"
+        return os.path.join(self.cache_dir, name)
+
+    def onnx(self, weights, imgsz, int8=False):
+        """
+        Path to an exported (and optionally quantised) ONNX model, exporting on first use
+        """
+        if not os.path.exists(weights):
+            # Let ultralytics download the weights first
+            if YOLO is None:
+                raise RuntimeError("Ultralytics YOLO not available. Install with: pip install ultralytics")
+            weights = YOLO(weights).ckpt_path or weights
+        target = self.path_for(weights, imgsz, int8)
+        if os.path.exists(target):
+            return target
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fp32_target = self.path_for(weights, imgsz, int8=False)
+        if not os.path.exists(fp32_target):
+            if YOLO is None:
+                raise RuntimeError("Ultralytics YOLO not available. Install with: pip install ultralytics")
+            print(f"Exporting {weights} to ONNX ({imgsz}x{imgsz}), this only happens once...")
+            exported = YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+            shutil.move(str(exported), fp32_target)
+
+        if int8:
+            try:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+            except Exception:
+                raise RuntimeError("INT8 quantisation needs onnxruntime. Install with: pip install onnxruntime")
+            print("Quantising ONNX model to INT8...")
+            quantize_dynamic(fp32_target, target, weight_type=QuantType.QUInt8)
+        return target
+
+
+class TorchBackend:
+    """ultralytics YOLO on PyTorch"""
+
+    name = 'torch'
+    metrics = None  # Metrics for preprocess/forward/decode timings (set by the owner)
+
+    def __init__(self, weights, imgsz=None, conf=None):
+        if YOLO is None:
+            raise RuntimeError("Ultralytics YOLO not available. Install with: pip install ultralytics")
+        import torch
+        self.torch = torch
+        self.model = YOLO(weights)
+        self.imgsz = imgsz or config.INFERENCE_IMAGE_SIZE
+        self.conf = conf if conf is not None else config.CONFIDENCE_THRESHOLD
+        self.letterbox = Letterbox(self.imgsz)
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        # A ready-made tensor skips ultralytics' own letterbox/resize
+        with timed(self.metrics, 'preprocess'):
+            batch, transforms = self.letterbox.batch(frames)
+        with timed(self.metrics, 'forward'):
+            results = self.model(self.torch.from_numpy(batch), conf=self.conf, verbose=False)
+        with timed(self.metrics, 'decode'):
+            return [scale_boxes(results_to_array([r]), transform, frame.shape)
+                    for r, transform, frame in zip(results, transforms, frames)]
+
+
+class OnnxBackend:
+    """
+    Exported YOLOv8 ONNX model on ONNX Runtime (or OpenVINO) CPU
+    """
+
+    name = 'onnx'
+    metrics = None  # Metrics for preprocess/forward/decode timings (set by the owner)
+
+    def __init__(self, weights, imgsz=None, conf=None, iou=0.7, int8=False,
+                 intra_threads=None, inter_threads=None, cache=None):
+        self.imgsz = imgsz or config.INFERENCE_IMAGE_SIZE
+        self.conf = conf if conf is not None else config.CONFIDENCE_THRESHOLD
+        self.iou = iou
+        self.intra_threads = config.INFERENCE_INTRA_OP_THREADS if intra_threads is None else intra_threads
+        self.inter_threads = config.INFERENCE_INTER_OP_THREADS if inter_threads is None else inter_threads
+        self.path = (cache or ModelCache()).onnx(weights, self.imgsz, int8=int8)
+        self.letterbox = Letterbox(self.imgsz)
+        self.names = self._load()
+
+    def _load(self):
+        if ort is None:
+            raise RuntimeError("ONNX Runtime not available. Install with: pip install onnxruntime")
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(self.intra_threads)
+        options.inter_op_num_threads = int(self.inter_threads)
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        num_classes = self.session.get_outputs()[0].shape[1] - 4
+        return self.parse_names(metadata.get('names'), num_classes)
+
+    @staticmethod
+    def parse_names(raw, num_classes=80):
+        """ultralytics stores class names as a dict literal in the ONNX metadata"""
+        if raw:
+            try:
+                return {int(k): v for k, v in ast.literal_eval(raw).items()}
+            except Exception:
+                pass
+        print("⚠️ No class names in the ONNX model, using class ids as labels")
+        return {i: str(i) for i in range(num_classes)}
+
+    def forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def detect(self, frame):
+        with timed(self.metrics, 'preprocess'):
+            blob, transform = self.letterbox(frame)
+        with timed(self.metrics, 'forward'):
+            output = self.forward(blob)
+        with timed(self.metrics, 'decode'):
+            return scale_boxes(decode_yolov8(output, self.conf, self.iou), transform, frame.shape)
+
+    def detect_batch(self, frames):
+        # Exported with a fixed batch of 1
+        return [self.detect(frame) for frame in frames]
+
+
+class OpenVINOBackend(OnnxBackend):
+    """Same exported ONNX model, compiled by OpenVINO for CPU"""
+
+    name = 'openvino'
+
+    def _load(self):
+        if ov is None:
+            raise RuntimeError("OpenVINO not available. Install with: pip install openvino")
+        core = ov.Core()
+        ov_config = {}
+        if self.intra_threads:
+            ov_config['INFERENCE_NUM_THREADS'] = int(self.intra_threads)
+        if self.inter_threads:
+            ov_config['NUM_STREAMS'] = int(self.inter_threads)
+        self.compiled = core.compile_model(self.path, 'CPU', ov_config)
+        self.request = self.compiled.create_infer_request()
+        names = None
+        try:
+            import onnx  # Installed alongside the ultralytics ONNX exporter
+            metadata = {p.key: p.value for p in onnx.load(self.path).metadata_props}
+            names = metadata.get('names')
+        except Exception:
+            pass
+        num_classes = self.compiled.output(0).get_partial_shape()[1].get_length() - 4
+        return self.parse_names(names, num_classes)
+
+    def forward(self, blob):
+        return self.request.infer({0: blob})[self.compiled.output(0)]
+
+
+def load_backend(name=None, weights=None, imgsz=None, int8=None, intra_threads=None, inter_threads=None):
+    """
+    Create an inference backend, falling back to torch if it can't be loaded
+    """
+    name = (name or config.INFERENCE_BACKEND).lower()
+    weights = weights or config.YOLO_MODEL
+    int8 = config.INFERENCE_INT8 if int8 is None else int8
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}'. Options: {', '.join(BACKENDS)}")
+
+    if name != 'torch':
+        backend_class = OnnxBackend if name == 'onnx' else OpenVINOBackend
+        try:
+            backend = backend_class(weights, imgsz=imgsz, int8=int8,
+                                    intra_threads=intra_threads, inter_threads=inter_threads)
+            print(f"Inference backend: {name} ({os.path.basename(backend.path)})")
+            return backend
+        except Exception as e:
+            print(f"⚠️ Could not load {name} backend: {e}")
+            print("Falling back to PyTorch.")
+
+    return TorchBackend(weights, imgsz=imgsz)
@@ -0,0 +1,296 @@
+"""
+Offline batch processing for recorded traffic video
+
+Every video is processed exactly once, as fast as the CPU allows: each file is
+split into frame-range chunks that a pool of worker processes work through in
+parallel. Every worker loads its own model (and OCR reader) once and runs a
+headless ESP32CamDetector over one chunk at a time. The chunks' detection logs
+are merged back in frame order and streamed into one write-only Excel file
+with the source video in the first column. A chunk that fails is listed on a
+"Failed Chunks" sheet; the other chunks are still written.
+
+Chunk boundaries come from the container's frame count, which is only an
+estimate for many VFR/MJPEG/AVI files, so each file's last chunk has no end
+and reads to EOF: no frame past the estimate is dropped.
+
+Chunk detectors are headless video detectors, which run without load backoff
+(frame_budget=None in start_capture): which frames are inferred depends only
+on the input, so a rerun gives identical results on any machine.
+
+Tracks restart at chunk boundaries, so a vehicle crossing one can be logged
+twice; larger chunks (config.BATCH_CHUNK_FRAMES) make that rarer.
+"""
+import glob
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import config
+from detection_log import DetectionLog
+
+try:
+    import openpyxl
+    from openpyxl import Workbook
+except Exception:
+    openpyxl = None
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.mpg', '.mpeg', '.wmv')
+
+
+def expand_video_paths(patterns):
+    """
+    Resolve files, directories and glob patterns to a sorted list of video files
+
+    Directories contribute every file with a VIDEO_EXTENSIONS extension
+    (not recursive); duplicates are dropped.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith(VIDEO_EXTENSIONS)
+            )
+        elif glob.has_magic(pattern):
+            matches = sorted(p for p in glob.glob(pattern) if os.path.isfile(p))
+        else:
+            matches = [pattern]
+        paths.extend(matches)
+    return list(dict.fromkeys(paths))
+
+
+def count_frames(path):
+    """Frame count from the container (an estimate), or by decoding headers when it doesn't say"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Failed to open video file at {path}")
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if total <= 0:
+        total = 0
+        while cap.grab():
+            total += 1
+    cap.release()
+    return total
+
+
+def plan_chunks(paths, chunk_frames):
+    """
+    Split every video into (path, chunk_index, start_frame, end_frame) tasks
+
+    A file's last chunk has end_frame None (read to EOF), since the frame
+    count may be short.
+
+    Returns:
+        (tasks, estimated total_frames)
+    """
+    tasks = []
+    total = 0
+    for path in paths:
+        frames = count_frames(path)
+        total += frames
+        starts = list(range(0, frames, chunk_frames)) or [0]
+        for index, start in enumerate(starts):
+            end = start + chunk_frames if index < len(starts) - 1 else None
+            tasks.append((path, index, start, end))
+    return tasks, total
+
+
+# Set in each worker process by _init_worker()
+_worker = {}
+
+
+def _init_worker(options):
+    """Load the model (and OCR reader) once per worker process"""
+    from backends import load_backend
+    from plate_ocr import PlateOCRPool
+
+    # Workers already run in parallel; don't let each one grab every core
+    threads = options['threads']
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+
+    backend_options = dict(options['backend_options'])
+    if not backend_options.get('intra_threads'):
+        backend_options['intra_threads'] = threads
+    _worker['model'] = load_backend(options['backend'], config.YOLO_MODEL, **backend_options)
+
+    _worker['ocr_pool'] = None
+    if not options['general_mode']:
+        try:
+            _worker['ocr_pool'] = PlateOCRPool(workers=config.BATCH_OCR_WORKERS)
+        except Exception as e:
+            print(f"Warning: License plate recognition disabled in batch worker: {e}")
+    _worker['options'] = options
+
+
+def _process_chunk(task):
+    """Run one chunk through a headless detector and return its log"""
+    from new import ESP32CamDetector
+
+    path, index, start, end = task
+    options = _worker['options']
+    detector = ESP32CamDetector(
+        video_path=path,
+        process_scale=options['process_scale'],
+        detect_pedestrians=options['detect_pedestrians'],
+        general_mode=options['general_mode'],
+        backend=options['backend'],
+        backend_options=options['backend_options'],
+        headless=True,
+        frame_range=(start, end),
+        model=_worker['model'],
+        ocr_pool=_worker['ocr_pool'],
+        # A chunk's log is small: keep all of it in memory, nothing on disk
+        log=DetectionLog(timestamps='video', ring_size=0),
+    )
+    detector.run()
+    # Timestamps are seconds into the file, so sorting by them is frame order
+    records = np.sort(detector.log.records(), order='ts', kind='stable')
+    return path, index, detector.frame_count - start, detector.log.decode(records)
+
+
+def write_results(results, filename, detect_pedestrians=False, failures=()):
+    """
+    Stream merged (video, log entry) rows into a write-only Excel file
+
+    Args:
+        results: Iterable of (video path, log entry), consumed once
+        failures: (video path, chunk index, start frame, end frame, error) of chunks that failed
+
+    Returns:
+        (filename, rows written)
+    """
+    wb = Workbook(write_only=True)  # Rows go straight to disk instead of a cell tree in memory
+    ws = wb.create_sheet(config.EXCEL_SHEET_NAME)
+    rows = 0
+    if detect_pedestrians:
+        ws.append(("Video", "Video Time", "Vehicle Type", "Priority", "License Plate", "Pedestrians Nearby"))
+        for path, (ts, label, priority, plate, ped_count) in results:
+            ws.append((os.path.basename(path), ts, label, priority, plate, ped_count))
+            rows += 1
+    else:
+        ws.append(("Video", "Video Time", "Vehicle Type", "Priority", "License Plate"))
+        for path, (ts, label, priority, plate, _) in results:
+            ws.append((os.path.basename(path), ts, label, priority, plate))
+            rows += 1
+    if failures:
+        failed = wb.create_sheet("Failed Chunks")
+        failed.append(("Video", "Chunk", "First Frame", "End Frame", "Error"))
+        for path, index, start, end, error in failures:
+            failed.append((os.path.basename(path), index, start, end if end is not None else "EOF", error))
+    wb.save(filename)
+    return filename, rows
+
+
+def run_batch(patterns, workers=None, chunk_frames=None, output=None, process_scale=1.0,
+              detect_pedestrians=False, general_mode=False, backend=None, backend_options=None):
+    """
+    Process every matching video once across a pool of worker processes
+
+    Args:
+        patterns: Video files, directories or glob patterns
+        workers: Worker processes (default config.BATCH_WORKERS, 0 = CPU count)
+        chunk_frames: Frames per chunk (default config.BATCH_CHUNK_FRAMES)
+        output: Excel file for the merged log (default batch_detections_<time>.xlsx)
+
+    Returns:
+        dict with files, frames, seconds, fps, detections, output and failed
+        (one (path, chunk, start, end, error) per chunk that raised)
+    """
+    if openpyxl is None:
+        raise RuntimeError("openpyxl not installed. Install with: pip install openpyxl")
+    paths = expand_video_paths(patterns)
+    missing = [p for p in paths if not os.path.isfile(p)]
+    if missing:
+        raise RuntimeError(f"Video file not found: {', '.join(missing)}")
+    if not paths:
+        raise RuntimeError(f"No video files matched: {' '.join(patterns)}")
+
+    chunk_frames = max(1, int(chunk_frames or config.BATCH_CHUNK_FRAMES))
+    workers = workers if workers is not None else config.BATCH_WORKERS
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    tasks, total_frames = plan_chunks(paths, chunk_frames)
+    workers = min(workers, max(1, len(tasks)))
+
+    print(f"📼 Batch: {len(paths)} file(s), {total_frames} frames in {len(tasks)} chunk(s) "
+          f"of up to {chunk_frames} frames, {workers} worker(s)")
+
+    options = {
+        'process_scale': process_scale,
+        'detect_pedestrians': detect_pedestrians,
+        'general_mode': general_mode,
+        'backend': backend,
+        'backend_options': dict(backend_options or {}),
+        'threads': max(1, (os.cpu_count() or 1) // workers),
+    }
+
+    logs = {}
+    failures = []
+    done_frames = 0
+    start = time.perf_counter()
+    # spawn: fresh interpreters, each loads its own model in _init_worker
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(options,)
+    ) as pool:
+        futures = {pool.submit(_process_chunk, task): task for task in tasks}
+        for completed, future in enumerate(as_completed(futures), 1):
+            try:
+                path, index, frames, entries = future.result()
+            except Exception as e:
+                # Keep going: one bad chunk shouldn't throw away the others
+                path, index, first, end = futures[future]
+                failures.append((path, index, first, end, f"{type(e).__name__}: {e}"))
+                print(f"[{completed}/{len(tasks)}] ❌ {os.path.basename(path)} chunk {index} "
+                      f"(frames {first}-{end if end is not None else 'EOF'}) failed: {e}")
+                continue
+            logs[(path, index)] = entries
+            done_frames += frames
+            total_frames = max(total_frames, done_frames)  # estimate ran short
+            elapsed = time.perf_counter() - start
+            fps = done_frames / elapsed if elapsed else 0.0
+            eta = (total_frames - done_frames) / fps if fps else 0.0
+            print(f"[{completed}/{len(tasks)}] {os.path.basename(path)} chunk {index}: "
+                  f"{done_frames}/{total_frames} frames, {fps:.1f} frames/s, ETA {eta:.0f}s")
+
+    elapsed = time.perf_counter() - start
+    # Chunks in file then frame order; each chunk's log is already sorted
+    results = (
+        (path, entry)
+        for path, index, _, _ in tasks if (path, index) in logs
+        for entry in logs[(path, index)]
+    )
+
+    if output is None:
+        output = f"batch_detections_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    failures.sort(key=lambda f: (paths.index(f[0]), f[1]))
+    output, detections = write_results(results, output, detect_pedestrians=detect_pedestrians, failures=failures)
+
+    fps = done_frames / elapsed if elapsed else 0.0
+    if failures:
+        print(f"⚠️ Batch done with {len(failures)} of {len(tasks)} chunk(s) failed (listed on the "
+              f"'Failed Chunks' sheet): {done_frames} frames in {elapsed:.1f}s ({fps:.1f} frames/s), "
+              f"{detections} detections -> {output}")
+    else:
+        print(f"✅ Batch done: {done_frames} frames in {elapsed:.1f}s ({fps:.1f} frames/s), "
+              f"{detections} detections -> {output}")
+    return {
+        'files': len(paths),
+        'frames': done_frames,
+        'seconds': round(elapsed, 2),
+        'fps': round(fps, 2),
+        'detections': detections,
+        'output': output,
+        'failed': failures,
+    }
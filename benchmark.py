@@ -0,0 +1,568 @@
+"""
+Reproducible benchmarks for the ESP32-CAM detection pipeline
+
+Runs fixed clips through a headless ESP32CamDetector and reports, per scenario:
+frames per second, end-to-end latency percentiles (frame captured -> frame
+annotated), peak RSS, OCR calls per vehicle and per-stage timings. A separate
+run times the model on batches of each size in config.BENCHMARK_BATCH_SIZES.
+
+  - Synthetic clips are drawn from a fixed seed and cached in BENCHMARK_DIR/clips
+  - Recorded clips are the bundled traffic.mp4 / car1.mp4 (skipped if missing)
+  - The stream scenario serves a clip as MJPEG from a simulated ESP32-CAM
+    (camera_sim.py), so the live path (threaded grabber, dropping queues, LED
+    dispatch) is measured
+  - Every scenario runs in a fresh process, so peak RSS and warm-up are its own
+  - The stub model (default) costs a fixed time per forward pass and returns
+    vehicles driving across the frame, so results measure the pipeline rather
+    than YOLO; --model real runs config.YOLO_MODEL on the chosen backend
+
+Results are written as JSON to BENCHMARK_DIR/results/ and can be compared with
+a stored baseline; anything more than config.BENCHMARK_TOLERANCE worse is a
+regression and makes --compare exit with status 1.
+
+Usage:
+  python benchmark.py                                   # every scenario, stub model
+  python benchmark.py --model real --backend onnx
+  python benchmark.py --scenario synthetic-640x480 --scenario stream-640x480
+  python benchmark.py --save-baseline                   # store these results as the baseline
+  python benchmark.py --compare                         # exit 1 on regressions vs the baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import config
+from camera_sim import VirtualCamera, load_clip, synthetic_frames
+from metrics import timed
+
+try:
+    import resource
+except Exception:
+    resource = None  # Windows: peak RSS is not reported
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCENARIOS = {
+    'synthetic-320x240': {'clip': 'synthetic', 'size': (320, 240)},
+    'synthetic-640x480': {'clip': 'synthetic', 'size': (640, 480)},
+    'synthetic-1280x720': {'clip': 'synthetic', 'size': (1280, 720)},
+    'recorded-traffic': {'clip': 'traffic.mp4'},
+    'recorded-car1': {'clip': 'car1.mp4'},
+    'stream-640x480': {'clip': 'synthetic', 'size': (640, 480), 'stream': True, 'fps': 25},
+}
+
+# Metric -> True if higher is better
+COMPARED_METRICS = {
+    'fps': True,
+    'latency_p50_ms': False,
+    'latency_p99_ms': False,
+    'peak_rss_mb': False,
+    'ocr_calls_per_vehicle': False,
+}
+
+INFERENCE_WARMUP = 3  # Untimed passes per batch size
+INFERENCE_REPEATS = 20  # Timed passes per batch size
+
+
+def synthetic_clip(width, height, frames=None, fps=25, seed=0):
+    """
+    Path of camera_sim's synthetic road scene written as a clip
+
+    Written once per (size, frames, seed) under BENCHMARK_DIR/clips; the same
+    seed always draws the same clip.
+    """
+    frames = frames or config.BENCHMARK_FRAMES
+    directory = os.path.join(config.BENCHMARK_DIR, 'clips')
+    path = os.path.abspath(os.path.join(directory, f"synthetic_{width}x{height}_{frames}_s{seed}.avi"))
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp.avi'
+    writer = cv2.VideoWriter(tmp, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not write synthetic clip {tmp}")
+    for frame in synthetic_frames(width, height, frames, seed):
+        writer.write(frame)
+    writer.release()
+    os.replace(tmp, path)
+    return path
+
+
+class StubModel:
+    """
+    Stand-in for a detection backend with a fixed, known cost
+
+    Each forward pass sleeps batch_ms plus image_ms per image. Boxes are a few
+    vehicles (and a pedestrian) crossing the frame, one step per call, with a
+    gap between crossings long enough for the track to end, so tracking, OCR
+    scheduling and logging get realistic work on any clip.
+    """
+
+    # (class id, calls to cross the frame, first call)
+    VEHICLES = ((2, 40, 0), (7, 60, 15), (5, 80, 35), (3, 30, 50), (2, 50, 80))
+    GAP = 20  # Calls between crossings (longer than the tracker's max_age)
+
+    def __init__(self, batch_ms=None, image_ms=None):
+        from new import COCO_CLASSES
+        self.names = dict(enumerate(COCO_CLASSES))
+        self.batch_cost = (config.BENCHMARK_STUB_BATCH_MS if batch_ms is None else batch_ms) / 1000.0
+        self.image_cost = (config.BENCHMARK_STUB_IMAGE_MS if image_ms is None else image_ms) / 1000.0
+        self.calls = 0
+        self.metrics = None
+
+    def detect(self, frame):
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames):
+        with timed(self.metrics, 'forward'):
+            time.sleep(self.batch_cost + self.image_cost * len(frames))
+        results = []
+        for frame in frames:
+            results.append(self.boxes(frame.shape, self.calls))
+            self.calls += 1
+        return results
+
+    def boxes(self, shape, step):
+        """(N, 6) x1, y1, x2, y2, conf, cls in frame pixels for call number `step`"""
+        height, width = shape[:2]
+        boxes = []
+        for lane, (cls, crossing, first) in enumerate(self.VEHICLES):
+            if step < first:
+                continue
+            progress = (step - first) % (crossing + self.GAP)
+            if progress >= crossing:
+                continue
+            x1 = (progress / crossing * 1.2 - 0.2) * width
+            y1 = height * (0.1 + 0.16 * lane)
+            boxes.append((max(0.0, x1), y1, min(width - 1.0, x1 + 0.2 * width), y1 + 0.14 * height, 0.85, cls))
+        if step % 90 < 45:
+            boxes.append((0.45 * width, 0.8 * height, 0.5 * width, 0.98 * height, 0.7, 0))
+        return np.array(boxes, np.float32).reshape(-1, 6)
+
+
+class StubOCRPool:
+    """
+    In-process stand-in for PlateOCRPool: every read takes a fixed time
+
+    Confidence cycles through low and high values, so PlateScheduler's re-read
+    and voting logic does its usual work.
+    """
+
+    CONFIDENCES = (0.4, 0.8, 0.5, 0.9)
+
+    def __init__(self, workers=None, latency_ms=None):
+        self.workers = max(1, int(workers or config.OCR_WORKERS))
+        self.latency = (config.BENCHMARK_STUB_OCR_MS if latency_ms is None else latency_ms) / 1000.0
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stub-ocr")
+        self.lock = threading.Lock()
+        self.metrics = None
+        self.submitted = 0
+        self.completed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def submit(self, roi, priority='LOW'):
+        with self.lock:
+            n = self.submitted
+            self.submitted += 1
+        return self.executor.submit(self._read, n, time.perf_counter())
+
+    def _read(self, n, submitted_at):
+        time.sleep(self.latency)
+        latency = time.perf_counter() - submitted_at
+        with self.lock:
+            self.completed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+        if self.metrics is not None:
+            self.metrics.observe('ocr', latency)
+            self.metrics.count('ocr_reads')
+        return "BENCH01", self.CONFIDENCES[n % len(self.CONFIDENCES)]
+
+    def stats(self):
+        with self.lock:
+            done = self.completed or 1
+            return {
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': 0,
+                'rejected': 0,
+                'dropped': 0,
+                'pending': self.submitted - self.completed,
+                'in_flight': 0,
+                'avg_latency_ms': round(self.total_latency / done * 1000, 2),
+                'avg_queue_wait_ms': 0.0,
+                'max_latency_ms': round(self.max_latency * 1000, 2),
+            }
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def load_model(options):
+    if options['model'] == 'stub':
+        return StubModel()
+    from backends import load_backend
+    return load_backend(options['backend'], config.YOLO_MODEL)
+
+
+def make_ocr_pool(options):
+    if options['ocr'] == 'stub':
+        return StubOCRPool()
+    from plate_ocr import PlateOCRPool
+    return PlateOCRPool()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_scenario(spec, options):
+    """
+    Run one scenario in this process (call it in a fresh one) and return its results
+
+    The detector runs in a scratch working directory, so logs and exports it
+    writes never touch the real ones.
+    """
+    out = sys.stdout if options['verbose'] else open(os.devnull, 'w')
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir, redirect_stdout(out):
+            os.chdir(workdir)
+            return _run_detector(spec, options)
+    finally:
+        os.chdir(cwd)
+        if out is not sys.stdout:
+            out.close()
+
+
+def _run_detector(spec, options):
+    from detection_log import DetectionLog
+    from new import ESP32CamDetector
+
+    model = load_model(options)
+    ocr_pool = make_ocr_pool(options)
+    camera = None
+    try:
+        if spec.get('stream'):
+            clip = load_clip(spec['path'], quality=80, frames=options['frames'])
+            camera = VirtualCamera(clip, host='127.0.0.1', fps=spec['fps'], loop=False).start()
+            detector = ESP32CamDetector(esp_ip=camera.url, headless=True, model=model, ocr_pool=ocr_pool,
+                                        log=DetectionLog(ring_size=0))
+            runner = threading.Thread(target=detector.run, name="benchmark-detector")
+            runner.start()
+            duration = len(clip) / spec['fps']
+            if not camera.finished.wait(duration * 3 + 30):
+                raise RuntimeError("Stream scenario timed out")
+            time.sleep(0.5)  # Let the last frames through the pipeline
+            detector.stop()
+            runner.join()
+            frames = detector.run_stats['frames']
+            seconds = camera.finished_at - camera.started_at
+        else:
+            detector = ESP32CamDetector(video_path=spec['path'], headless=True, frame_range=(0, options['frames']),
+                                        model=model, ocr_pool=ocr_pool,
+                                        log=DetectionLog(timestamps='video', ring_size=0))
+            detector.run()
+            frames = detector.run_stats['frames']
+            seconds = detector.run_stats['seconds']
+    finally:
+        if camera is not None:
+            camera.close()
+        ocr_pool.close()
+
+    snapshot = detector.metrics.snapshot()
+    latency = snapshot['stages'].get('end_to_end', {})
+    vehicles = detector.tracker.next_id - 1
+    ocr_calls = detector.plate_scheduler.ocr_calls if detector.plate_scheduler else 0
+    return {
+        'frames': frames,
+        'seconds': round(seconds, 3),
+        'fps': round(frames / seconds, 2) if seconds else 0.0,
+        'latency_p50_ms': latency.get('p50_ms'),
+        'latency_p90_ms': latency.get('p90_ms'),
+        'latency_p99_ms': latency.get('p99_ms'),
+        'peak_rss_mb': peak_rss_mb(),
+        'vehicles': vehicles,
+        'ocr_calls': ocr_calls,
+        'ocr_calls_per_vehicle': round(ocr_calls / vehicles, 3) if vehicles else None,
+        'frames_inferred': snapshot['counters'].get('frames_inferred', 0),
+        'frames_dropped': detector.frames_dropped(),
+        'detections_logged': len(detector.log),
+        'stages': snapshot['stages'],
+    }
+
+
+def run_inference(path, options):
+    """Model time per batch for each size in options['batch_sizes'] (run in a fresh process)"""
+    out = sys.stdout if options['verbose'] else open(os.devnull, 'w')
+    with redirect_stdout(out):
+        model = load_model(options)
+    if out is not sys.stdout:
+        out.close()
+
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max(options['batch_sizes']):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"No frames in {path}")
+
+    results = {}
+    for size in options['batch_sizes']:
+        batch = [frames[i % len(frames)] for i in range(size)]
+        for _ in range(INFERENCE_WARMUP):
+            model.detect_batch(batch)
+        times = []
+        for _ in range(INFERENCE_REPEATS):
+            start = time.perf_counter()
+            model.detect_batch(batch)
+            times.append(time.perf_counter() - start)
+        p50, p90 = np.percentile(times, [50, 90]) * 1000
+        results[str(size)] = {
+            'batch_p50_ms': round(float(p50), 3),
+            'batch_p90_ms': round(float(p90), 3),
+            'ms_per_frame': round(float(p50) / size, 3),
+            'frames_per_second': round(size * 1000 / float(p50), 2) if p50 else 0.0,
+        }
+    return results
+
+
+def _in_fresh_process(func, *args):
+    """func(*args) in a new interpreter; {'error': ...} if it raises"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        try:
+            return pool.submit(func, *args).result()
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+
+
+def resolve_clip(spec, frames):
+    """Scenario spec with an absolute 'path' to its clip, or None if the clip is missing or unreadable"""
+    if spec['clip'] == 'synthetic':
+        path = synthetic_clip(*spec['size'], frames=frames)
+    else:
+        path = os.path.join(REPO_DIR, spec['clip'])
+        cap = cv2.VideoCapture(path)
+        readable = cap.isOpened() and cap.read()[0]
+        cap.release()
+        if not readable:
+            return None
+    return dict(spec, path=path)
+
+
+def environment():
+    """What the numbers depend on besides the code"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'commit': commit,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def run_benchmarks(scenarios=None, model='stub', backend=None, ocr='stub', frames=None,
+                   batch_sizes=None, verbose=False):
+    """
+    Run scenarios (default: all) and the per-batch-size inference benchmark
+
+    Args:
+        scenarios: Names from SCENARIOS
+        model: 'stub' or 'real' (config.YOLO_MODEL)
+        backend: Backend for the real model (default config.INFERENCE_BACKEND)
+        ocr: 'stub' or 'easyocr'
+        frames: Frames per scenario (default config.BENCHMARK_FRAMES)
+        batch_sizes: Inference batch sizes (default config.BENCHMARK_BATCH_SIZES)
+        verbose: Show the detectors' own output
+
+    Returns:
+        Results dict (environment, options, scenarios, inference)
+    """
+    options = {
+        'model': model,
+        'backend': (backend or config.INFERENCE_BACKEND) if model == 'real' else None,
+        'ocr': ocr,
+        'frames': int(frames or config.BENCHMARK_FRAMES),
+        'batch_sizes': [int(s) for s in (batch_sizes or config.BENCHMARK_BATCH_SIZES)],
+        'verbose': verbose,
+    }
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'options': {k: v for k, v in options.items() if k != 'verbose'},
+        'scenarios': {},
+        'inference': {},
+    }
+
+    for name in scenarios or SCENARIOS:
+        spec = resolve_clip(SCENARIOS[name], options['frames'])
+        if spec is None:
+            print(f"⏭️  {name}: clip {SCENARIOS[name]['clip']} missing or unreadable, skipped")
+            results['scenarios'][name] = {'skipped': 'clip missing or unreadable'}
+            continue
+        print(f"▶️  {name} ...", flush=True)
+        result = _in_fresh_process(run_scenario, spec, options)
+        results['scenarios'][name] = result
+        if 'error' in result:
+            print(f"❌ {name}: {result['error']}")
+        else:
+            print(f"   {result['frames']} frames, {result['fps']} FPS, latency p50/p99 "
+                  f"{result['latency_p50_ms']}/{result['latency_p99_ms']} ms, peak RSS {result['peak_rss_mb']} MB, "
+                  f"{result['ocr_calls_per_vehicle']} OCR calls/vehicle")
+
+    print("▶️  inference per batch size ...", flush=True)
+    clip = synthetic_clip(640, 480, frames=options['frames'])
+    inference = _in_fresh_process(run_inference, clip, options)
+    if 'error' in inference:
+        print(f"❌ inference: {inference['error']}")
+    else:
+        results['inference'] = inference
+        for size, result in inference.items():
+            print(f"   batch {size}: {result['batch_p50_ms']} ms/batch, {result['ms_per_frame']} ms/frame")
+    return results
+
+
+def compare(results, baseline, tolerance=None):
+    """
+    Compare results with a baseline
+
+    Returns:
+        List of (name, metric, baseline, current, change, regressed) where
+        change is relative and positive means worse
+    """
+    tolerance = config.BENCHMARK_TOLERANCE if tolerance is None else tolerance
+    rows = []
+
+    def check(name, metric, base, now, higher_is_better):
+        if base is None or now is None or not base:
+            return
+        change = (now - base) / base
+        if higher_is_better:
+            change = -change
+        rows.append((name, metric, base, now, change, change > tolerance))
+
+    for name, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base or 'fps' not in base or 'fps' not in result:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            check(name, metric, base.get(metric), result.get(metric), higher_is_better)
+    for size, result in results.get('inference', {}).items():
+        base = baseline.get('inference', {}).get(size)
+        if base:
+            check(f"inference batch {size}", 'ms_per_frame', base['ms_per_frame'], result['ms_per_frame'], False)
+    return rows
+
+
+def comparable(results, baseline):
+    """Reasons the two runs can't be compared (empty if they can)"""
+    problems = []
+    for key in ('model', 'backend', 'ocr', 'frames'):
+        if results['options'].get(key) != baseline.get('options', {}).get(key):
+            problems.append(f"{key} differs ({baseline.get('options', {}).get(key)} vs {results['options'].get(key)})")
+    return problems
+
+
+def print_comparison(rows):
+    print(f"\n{'benchmark':<28} {'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metric, base, now, change, regressed in rows:
+        flag = "  ❌ regression" if regressed else ""
+        print(f"{name:<28} {metric:<22} {base:>10} {now:>10} {change:>+7.1%}{flag}")
+
+
+def save_json(data, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ESP32-CAM detection pipeline")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument('--model', choices=['stub', 'real'], default='stub',
+                        help="Stub model with a fixed cost (default) or config.YOLO_MODEL")
+    parser.add_argument('--backend', type=str, default=None,
+                        help=f"Backend for --model real (default {config.INFERENCE_BACKEND})")
+    parser.add_argument('--ocr', choices=['stub', 'easyocr'], default='stub',
+                        help="Stub plate reader with a fixed cost (default) or the EasyOCR pool")
+    parser.add_argument('--frames', type=int, default=None,
+                        help=f"Frames per scenario (default {config.BENCHMARK_FRAMES})")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=None,
+                        help=f"Inference batch sizes (default {' '.join(map(str, config.BENCHMARK_BATCH_SIZES))})")
+    parser.add_argument('--output', type=str, default=None,
+                        help="Results file (default BENCHMARK_DIR/results/benchmark_<time>.json)")
+    parser.add_argument('--baseline', type=str, default=os.path.join(config.BENCHMARK_DIR, 'baseline.json'),
+                        help="Baseline results file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--compare', action='store_true', help="Compare with the baseline; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help=f"Relative change counted as a regression (default {config.BENCHMARK_TOLERANCE})")
+    parser.add_argument('--verbose', action='store_true', help="Show the detectors' own output")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scenario, model=args.model, backend=args.backend, ocr=args.ocr,
+                             frames=args.frames, batch_sizes=args.batch_sizes, verbose=args.verbose)
+    output = args.output or os.path.join(config.BENCHMARK_DIR, 'results',
+                                         f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    print(f"✅ Results: {save_json(results, output)}")
+    if args.save_baseline:
+        print(f"✅ Baseline: {save_json(results, args.baseline)}")
+
+    if not args.compare:
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"⚠️ No baseline at {args.baseline} (create one with --save-baseline)")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    problems = comparable(results, baseline)
+    if problems:
+        print(f"⚠️ Not comparable with {args.baseline}: {'; '.join(problems)}")
+        return 0
+    for key in ('cpu_count', 'machine', 'python', 'opencv'):
+        if baseline.get('environment', {}).get(key) != results['environment'][key]:
+            print(f"⚠️ Baseline was recorded with a different {key} "
+                  f"({baseline['environment'].get(key)} vs {results['environment'][key]})")
+    rows = compare(results, baseline, args.tolerance)
+    print_comparison(rows)
+    regressions = [row for row in rows if row[5]]
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) vs baseline")
+        return 1
+    print("\n✅ No regressions vs baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
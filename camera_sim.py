@@ -0,0 +1,519 @@
+"""
+ESP32-CAM simulator for testing the live path without hardware
+
+Each VirtualCamera listens on its own port and answers like esp32_cam_stream.ino:
+
+    GET /                          endpoint list
+    GET /stream                    MJPEG (multipart/x-mixed-replace;boundary=frame)
+    GET /capture                   one JPEG
+    GET /led?color=red|yellow|green|off
+
+plus, for tests:
+
+    GET /sim                       camera stats (JSON)
+    GET /sim/outage?seconds=N      go dark for N seconds
+
+Frames come from a video file or a seeded synthetic road scene. They are
+JPEG-encoded once into a clip that every camera with the same source, size and
+quality shares; each camera starts at its own offset into it. Dozens of cameras
+therefore cost one clip of memory and almost no CPU.
+
+Each camera runs its own sensor clock from its first stream request. A viewer
+always gets the camera's current frame, just like the real sensor. These
+network impairments can be switched on:
+
+  - jitter: every frame goes out up to jitter_ms late
+  - loss: that fraction of frames is never sent
+  - stall_rate: stalls per second in which a stream sends nothing for stall_seconds
+  - disconnect_rate: dropped stream connections per second
+  - outage(): the camera drops off the network. Open streams hang, new
+    connections get no response, and every connection is closed when it
+    comes back
+
+Usage:
+  python camera_sim.py                                   # one synthetic camera on port 8100
+  python camera_sim.py --cameras 24 --fps 15 --resolution 640x480
+  python camera_sim.py --video traffic.mp4 --jitter-ms 40 --loss 0.02 --disconnect-rate 0.01
+  python camera_sim.py --cameras 8 --outage-at 30 --outage-for 10   # all cameras drop at once
+  python new.py --ip 127.0.0.1:8100 127.0.0.1:8101 --headless
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+import config
+
+BOUNDARY = "frame"
+LED_COLORS = ('red', 'yellow', 'green', 'off')
+
+_clips = {}  # (source, size, quality, frames) -> list of JPEG bytes
+_clips_lock = threading.Lock()
+
+
+def synthetic_frames(width, height, frames, seed=0):
+    """
+    Yield a seeded road scene: lane markings, boxy vehicles with plates, sensor noise
+
+    The same seed always draws the same frames.
+    """
+    rng = np.random.default_rng(seed)
+
+    # Static scene: asphalt gradient with dashed lane markings
+    lanes = 4
+    background = np.empty((height, width, 3), np.uint8)
+    background[:] = np.linspace(70, 110, height).astype(np.uint8)[:, None, None]
+    dash = max(8, width // 32)
+    for lane in range(1, lanes):
+        y = height * lane // lanes
+        for x in range(0, width, dash * 2):
+            cv2.line(background, (x, y), (x + dash, y), (210, 210, 210), max(1, height // 160))
+
+    vehicles = []
+    for i in range(2 * lanes):
+        lane = i % lanes
+        w = int(width * rng.uniform(0.12, 0.22))
+        h = int(height / lanes * rng.uniform(0.55, 0.8))
+        speed = width * rng.uniform(0.004, 0.015) * (1 if lane % 2 else -1)
+        color = tuple(int(c) for c in rng.integers(30, 230, 3))
+        vehicles.append((lane, w, h, speed, rng.uniform(0, width), color, f"BN{i:02d}{chr(65 + i)}X"))
+
+    scale = max(0.3, height / 1200)
+    for index in range(frames):
+        frame = background.copy()
+        for lane, w, h, speed, start, color, plate in vehicles:
+            x = int((start + speed * index) % (width + w)) - w
+            y = height * lane // lanes + (height // lanes - h) // 2
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, -1)
+            px, py = x + w // 4, y + h - h // 4
+            cv2.rectangle(frame, (px, py), (px + w // 2, py + h // 6), (255, 255, 255), -1)
+            cv2.putText(frame, plate, (px + 2, py + h // 6 - 2), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 1)
+        noise = rng.integers(-4, 5, frame.shape, dtype=np.int16)
+        yield np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def load_clip(video=None, resolution=None, quality=None, frames=None):
+    """
+    JPEG-encoded frames of a video file (or the synthetic scene), cached and shared
+
+    Args:
+        video: Video file, or None for synthetic frames
+        resolution: (width, height) to scale to (default: the video's own, or config.SIM_RESOLUTION)
+        quality: JPEG quality (default config.SIM_JPEG_QUALITY)
+        frames: Frames to keep (default: whole video, or config.SIM_SYNTHETIC_FRAMES)
+
+    Returns:
+        List of JPEG bytes
+    """
+    quality = int(quality or config.SIM_JPEG_QUALITY)
+    if video is None:
+        resolution = tuple(resolution or config.SIM_RESOLUTION)
+        frames = frames or config.SIM_SYNTHETIC_FRAMES
+    key = (video, tuple(resolution) if resolution else None, quality, frames)
+    with _clips_lock:
+        if key in _clips:
+            return _clips[key]
+
+        if video is None:
+            source = synthetic_frames(*resolution, frames)
+        else:
+            source = _video_frames(video, frames)
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        jpegs = []
+        for frame in source:
+            if resolution and (frame.shape[1], frame.shape[0]) != tuple(resolution):
+                frame = cv2.resize(frame, tuple(resolution), interpolation=cv2.INTER_AREA)
+            jpegs.append(cv2.imencode('.jpg', frame, params)[1].tobytes())
+        if not jpegs:
+            raise RuntimeError(f"No frames in {video}")
+        _clips[key] = jpegs
+        return jpegs
+
+
+def _video_frames(path, frames=None):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Failed to open video file at {path}")
+    count = 0
+    try:
+        while frames is None or count < frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            count += 1
+            yield frame
+    finally:
+        cap.release()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ESP32CamSim/1.0"
+
+    def log_message(self, format, *args):
+        pass  # Dozens of cameras would flood the console
+
+    def do_GET(self):
+        camera = self.server.camera
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.startswith('/sim'):
+            self._control(camera, url.path, query)
+            return
+        if not camera.reachable():
+            self.close_connection = True
+            return  # Off the network: never answered
+
+        if url.path == '/stream':
+            self.send_response(200)
+            self.send_header('Content-Type', f'multipart/x-mixed-replace;boundary={BOUNDARY}')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            camera.stream(self.wfile)
+        elif url.path == '/capture':
+            self._send(200, 'image/jpeg', camera.capture())
+        elif url.path == '/led':
+            if 'color' not in query:
+                self._send(400, 'text/plain', b"Missing color parameter. Use: /led?color=red|yellow|green|off")
+                return
+            color = query['color'][0]
+            camera.set_led(color)
+            self._send(200, 'text/plain', f"LED color set to: {color}".encode('utf-8'))
+        elif url.path == '/':
+            self._send(200, 'text/plain', b"ESP32-CAM Vehicle Detection System (simulated)\n\nEndpoints:\n"
+                                          b"/stream - MJPEG video feed\n/capture - Single image capture\n"
+                                          b"/led?color=red|yellow|green|off - LED control")
+        else:
+            self._send(404, 'text/plain', b"Not found")
+
+    def _control(self, camera, path, query):
+        if path == '/sim/outage':
+            try:
+                seconds = float(query.get('seconds', ['10'])[0])
+            except ValueError:
+                self._send(400, 'text/plain', b"seconds must be a number")
+                return
+            camera.outage(seconds)
+        elif path != '/sim':
+            self._send(404, 'text/plain', b"Not found")
+            return
+        self._send(200, 'application/json', json.dumps(camera.stats()).encode('utf-8'))
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class VirtualCamera:
+    """
+    One simulated ESP32-CAM on its own port
+
+    Args:
+        clip: JPEG frames from load_clip()
+        host: Bind address (default config.SIM_HOST)
+        port: Port (0 = any free port)
+        fps: Sensor frame rate (default config.SIM_FPS)
+        offset: First clip frame (cameras sharing a clip should start apart)
+        loop: Restart the clip at the end; if False streams end after the last frame
+        jitter_ms: Each frame is sent up to this much late (default config.SIM_JITTER_MS)
+        loss: Fraction of frames never sent (default config.SIM_LOSS)
+        stall_rate: Stalls per second per stream (default config.SIM_STALL_RATE)
+        stall_seconds: Length of a stall (default config.SIM_STALL_SECONDS)
+        disconnect_rate: Dropped stream connections per second (default config.SIM_DISCONNECT_RATE)
+        seed: Seed for the impairments, so a run can be repeated
+    """
+
+    def __init__(self, clip, host=None, port=0, fps=None, offset=0, loop=True, jitter_ms=None, loss=None,
+                 stall_rate=None, stall_seconds=None, disconnect_rate=None, seed=0):
+        self.clip = clip
+        self.interval = 1.0 / (fps or config.SIM_FPS)
+        self.offset = offset % len(clip)
+        self.loop = loop
+        self.jitter = (config.SIM_JITTER_MS if jitter_ms is None else jitter_ms) / 1000.0
+        self.loss = config.SIM_LOSS if loss is None else loss
+        self.stall_rate = config.SIM_STALL_RATE if stall_rate is None else stall_rate
+        self.stall_seconds = config.SIM_STALL_SECONDS if stall_seconds is None else stall_seconds
+        self.disconnect_rate = config.SIM_DISCONNECT_RATE if disconnect_rate is None else disconnect_rate
+        self.rng = random.Random(seed)  # Seeds each stream's own generator
+
+        self.lock = threading.Lock()
+        self.epoch = None  # Sensor clock start: the first stream request
+        self.dark_until = 0.0
+        self.closing = False
+        self.finished = threading.Event()  # loop=False: the last frame has been sent
+        self.started_at = None
+        self.finished_at = None
+        self.led = 'off'
+
+        # Metrics
+        self.viewers = 0
+        self.connections = 0
+        self.frames_sent = 0
+        self.frames_lost = 0
+        self.stalls = 0
+        self.disconnects = 0
+        self.outages = 0
+        self.captures = 0
+        self.led_commands = 0
+
+        self.httpd = ThreadingHTTPServer((host or config.SIM_HOST, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.camera = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name=f"camera-sim-{self.port}", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    @property
+    def address(self):
+        """host:port, as passed to new.py --ip"""
+        host = self.httpd.server_address[0]
+        return f"{'127.0.0.1' if host in ('0.0.0.0', '') else host}:{self.port}"
+
+    @property
+    def url(self):
+        return f"http://{self.address}/stream"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def reachable(self):
+        """Block while the camera is off the network; False if it was (the connection is then dropped)"""
+        dark = False
+        while not self.closing:
+            remaining = self.dark_until - time.monotonic()
+            if remaining <= 0:
+                return not dark
+            dark = True
+            time.sleep(min(remaining, 0.5))
+        return False
+
+    def outage(self, seconds):
+        """Drop off the network for `seconds`: nothing is answered or sent, then every connection is closed"""
+        with self.lock:
+            self.dark_until = max(self.dark_until, time.monotonic() + seconds)
+            self.outages += 1
+
+    def set_led(self, color):
+        with self.lock:
+            self.led = color if color in LED_COLORS else self.led
+            self.led_commands += 1
+
+    def frame_number(self):
+        """Index of the sensor's current frame since the clock started"""
+        return int((time.perf_counter() - self.epoch) / self.interval)
+
+    def capture(self):
+        with self.lock:
+            self.captures += 1
+            n = self.frame_number() if self.epoch is not None else 0
+        return self.clip[(self.offset + n) % len(self.clip)]
+
+    def stream(self, out):
+        """Write MJPEG parts to `out` until the viewer leaves, the connection is cut or the clip ends"""
+        with self.lock:
+            self.viewers += 1
+            self.connections += 1
+            if self.epoch is None:
+                self.epoch = self.started_at = time.perf_counter()
+            rng = random.Random(self.rng.random())
+        stall_chance = self.stall_rate * self.interval
+        disconnect_chance = self.disconnect_rate * self.interval
+        last = -1
+        try:
+            while not self.closing:
+                if not self.reachable():
+                    return  # Came back from an outage: the old connection is dead
+                n = self.frame_number()
+                if n == last:
+                    due = self.epoch + (n + 1) * self.interval + rng.uniform(0, self.jitter)
+                    time.sleep(max(0.0, due - time.perf_counter()))
+                    continue
+                if not self.loop and n >= len(self.clip):
+                    with self.lock:
+                        if not self.finished.is_set():
+                            self.finished_at = time.perf_counter()
+                            self.finished.set()
+                    return
+                last = n
+
+                if rng.random() < disconnect_chance:
+                    with self.lock:
+                        self.disconnects += 1
+                    return
+                if rng.random() < stall_chance:
+                    with self.lock:
+                        self.stalls += 1
+                    time.sleep(self.stall_seconds)
+                    continue
+                if rng.random() < self.loss:
+                    with self.lock:
+                        self.frames_lost += 1
+                    continue
+
+                jpeg = self.clip[(self.offset + n) % len(self.clip)]
+                out.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n"
+                          .encode('ascii') + jpeg + b"\r\n")
+                out.flush()
+                with self.lock:
+                    self.frames_sent += 1
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass  # Viewer went away
+        finally:
+            with self.lock:
+                self.viewers -= 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'address': self.address,
+                'led': self.led,
+                'dark': self.dark_until > time.monotonic(),
+                'viewers': self.viewers,
+                'connections': self.connections,
+                'frames_sent': self.frames_sent,
+                'frames_lost': self.frames_lost,
+                'stalls': self.stalls,
+                'disconnects': self.disconnects,
+                'outages': self.outages,
+                'captures': self.captures,
+                'led_commands': self.led_commands,
+            }
+
+    def close(self):
+        self.closing = True
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class CameraSimulator:
+    """
+    A fleet of VirtualCameras on consecutive ports (or any free ports with base_port=0)
+
+    Args:
+        cameras: Number of cameras
+        video: Video file to replay, or None for synthetic frames
+        resolution: (width, height) (default config.SIM_RESOLUTION for synthetic frames)
+        quality: JPEG quality (default config.SIM_JPEG_QUALITY)
+        host: Bind address (default config.SIM_HOST)
+        base_port: First camera's port (default config.SIM_BASE_PORT)
+        seed: Camera i uses seed + i
+        **options: VirtualCamera options (fps, jitter_ms, loss, stall_rate, ...)
+    """
+
+    def __init__(self, cameras=1, video=None, resolution=None, quality=None, host=None, base_port=None,
+                 seed=0, **options):
+        base_port = config.SIM_BASE_PORT if base_port is None else base_port
+        clip = load_clip(video, resolution, quality)
+        self.cameras = []
+        try:
+            for i in range(cameras):
+                self.cameras.append(VirtualCamera(
+                    clip, host=host, port=base_port + i if base_port else 0,
+                    offset=i * len(clip) // max(1, cameras), seed=seed + i, **options
+                ))
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def addresses(self):
+        return [camera.address for camera in self.cameras]
+
+    def start(self):
+        for camera in self.cameras:
+            camera.start()
+        return self
+
+    def outage(self, seconds, cameras=None):
+        """Take every camera (or the given indexes) off the network at once"""
+        for i in (range(len(self.cameras)) if cameras is None else cameras):
+            self.cameras[i].outage(seconds)
+
+    def stats(self):
+        per_camera = [camera.stats() for camera in self.cameras]
+        totals = {key: sum(s[key] for s in per_camera)
+                  for key in ('viewers', 'frames_sent', 'frames_lost', 'stalls', 'disconnects', 'connections',
+                              'led_commands')}
+        return {'cameras': per_camera, 'totals': totals}
+
+    def close(self):
+        for camera in self.cameras:
+            camera.close()
+
+
+def parse_resolution(text):
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate ESP32-CAM streams (/stream, /capture, /led)")
+    parser.add_argument('--cameras', type=int, default=1, help="Number of virtual cameras")
+    parser.add_argument('--host', type=str, default=None, help=f"Bind address (default {config.SIM_HOST})")
+    parser.add_argument('--port', type=int, default=None,
+                        help=f"First camera's port, the rest follow (default {config.SIM_BASE_PORT}, 0 = any free)")
+    parser.add_argument('--video', type=str, default=None, help="Video file to replay (default: synthetic frames)")
+    parser.add_argument('--resolution', type=parse_resolution, default=None,
+                        help="Frame size WxH (default: the video's, or "
+                             f"{config.SIM_RESOLUTION[0]}x{config.SIM_RESOLUTION[1]} for synthetic frames)")
+    parser.add_argument('--fps', type=float, default=None, help=f"Frames per second (default {config.SIM_FPS})")
+    parser.add_argument('--quality', type=int, default=None,
+                        help=f"JPEG quality (default {config.SIM_JPEG_QUALITY})")
+    parser.add_argument('--jitter-ms', type=float, default=None, help="Max extra delay per frame")
+    parser.add_argument('--loss', type=float, default=None, help="Fraction of frames dropped")
+    parser.add_argument('--stall-rate', type=float, default=None, help="Stream stalls per second")
+    parser.add_argument('--stall-seconds', type=float, default=None, help="Length of a stall")
+    parser.add_argument('--disconnect-rate', type=float, default=None, help="Dropped connections per second")
+    parser.add_argument('--outage-at', type=float, default=None, help="Take every camera down this many seconds in")
+    parser.add_argument('--outage-for', type=float, default=10.0, help="Length of that outage (seconds)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the impairments")
+    args = parser.parse_args()
+
+    simulator = CameraSimulator(
+        cameras=args.cameras, video=args.video, resolution=args.resolution, quality=args.quality,
+        host=args.host, base_port=args.port, seed=args.seed, fps=args.fps, jitter_ms=args.jitter_ms,
+        loss=args.loss, stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+        disconnect_rate=args.disconnect_rate
+    ).start()
+    print(f"📷 {len(simulator.cameras)} simulated ESP32-CAM(s): {simulator.addresses[0]}"
+          + (f" ... {simulator.addresses[-1]}" if len(simulator.cameras) > 1 else ""))
+    print(f"   python new.py --ip {' '.join(simulator.addresses)}")
+
+    start = time.monotonic()
+    outage_done = args.outage_at is None
+    next_report = 10.0
+    try:
+        while True:
+            time.sleep(1.0)
+            elapsed = time.monotonic() - start
+            if not outage_done and elapsed >= args.outage_at:
+                print(f"📴 Outage: every camera off the network for {args.outage_for:g}s")
+                simulator.outage(args.outage_for)
+                outage_done = True
+            if elapsed >= next_report:
+                next_report += 10.0
+                totals = simulator.stats()['totals']
+                print(f"[{elapsed:.0f}s] viewers {totals['viewers']}, frames sent {totals['frames_sent']}, "
+                      f"lost {totals['frames_lost']}, stalls {totals['stalls']}, "
+                      f"disconnects {totals['disconnects']}, LED commands {totals['led_commands']}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Frame capture helpers for the ESP32-CAM detection system
+
+The live camera path decodes frames on a dedicated thread so that slow work in
+the detection loop (YOLO, OCR, GUI, LED requests) never blocks the MJPEG/RTSP
+reader. Only the newest frames are kept; anything older is dropped and counted.
+
+Video files keep the deterministic mode: every frame is read inline, in order,
+and nothing is ever dropped.
+"""
+import threading
+import time
+from collections import deque
+
+
+class FrameGrabber:
+    """
+    Latest-frame-wins reader wrapped around a cv2.VideoCapture
+
+    Args:
+        cap: Opened cv2.VideoCapture (or anything with read()/release(), e.g. a StreamConnection)
+        threaded: Decode on a background thread and drop stale frames (live streams).
+                  When False every read() goes straight to cap.read() (video files).
+        buffer_size: Number of newest frames kept in the ring (1 = single slot)
+    """
+
+    def __init__(self, cap, threaded=True, buffer_size=1):
+        self.cap = cap
+        self.threaded = threaded
+        self.buffer = deque(maxlen=max(1, int(buffer_size)))
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.last_ok = True
+
+        # Counters
+        self.frames_read = 0      # Frames decoded from the source
+        self.frames_consumed = 0  # Frames handed to the detection loop
+        self.frames_dropped = 0   # Frames overwritten before anyone used them
+        self.read_failures = 0    # cap.read() calls that returned no frame
+
+    def start(self):
+        if not self.threaded or self.running:
+            return self
+        self.running = True
+        self.thread = threading.Thread(target=self._reader, name="frame-grabber", daemon=True)
+        self.thread.start()
+        return self
+
+    def _reader(self):
+        """Decode continuously, keeping only the newest frame(s)"""
+        while self.running:
+            ret, frame = self.cap.read()
+            with self.cond:
+                if not ret:
+                    self.read_failures += 1
+                    self.last_ok = False
+                    self.cond.notify_all()
+                else:
+                    self.frames_read += 1
+                    self.last_ok = True
+                    if len(self.buffer) == self.buffer.maxlen:
+                        self.frames_dropped += 1
+                    self.buffer.append(frame)
+                    self.cond.notify_all()
+            if not ret:
+                # Don't spin on a dead stream
+                time.sleep(0.05)
+
+    def read(self, timeout=1.0):
+        """
+        Get the next frame for processing
+
+        Returns:
+            (ret, frame) just like cv2.VideoCapture.read()
+        """
+        if not self.threaded:
+            ret, frame = self.cap.read()
+            if ret:
+                self.frames_read += 1
+                self.frames_consumed += 1
+            else:
+                self.read_failures += 1
+            return ret, frame
+
+        with self.cond:
+            if not self.buffer:
+                self.cond.wait(timeout)
+            if not self.buffer:
+                return False, None
+            # Newest frame wins, everything older is stale
+            frame = self.buffer.pop()
+            self.frames_dropped += len(self.buffer)
+            self.buffer.clear()
+            self.frames_consumed += 1
+            return True, frame
+
+    def stats(self):
+        return {
+            'frames_read': self.frames_read,
+            'frames_consumed': self.frames_consumed,
+            'frames_dropped': self.frames_dropped,
+            'read_failures': self.read_failures,
+        }
+
+    def stop(self):
+        self.running = False
+        # A reconnecting source (StreamConnection) may be waiting out a backoff
+        interrupt = getattr(self.cap, 'interrupt', None)
+        if interrupt is not None:
+            interrupt()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def release(self):
+        self.stop()
+        try:
+            self.cap.release()
+        except Exception:
+            pass
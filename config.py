@@ -21,6 +21,51 @@ CONFIDENCE_THRESHOLD = 0.25
 # Higher values = faster processing but may miss detections
 DETECTION_INTERVAL = 1
 
+# Adaptive detection (see motion.py)
+# DETECTION_INTERVAL applies while something moves or vehicles are tracked; a
+# static, empty scene is only checked every DETECTION_IDLE_INTERVAL frames.
+# If inference takes longer than a frame, the interval grows on its own up to
+# DETECTION_MAX_INTERVAL.
+DETECTION_IDLE_INTERVAL = 15
+DETECTION_MAX_INTERVAL = 30
+# Mean pixel change (0-1) between downscaled frames that counts as motion
+MOTION_THRESHOLD = 0.01
+# Per-frame time budget for live streams (video files use their own FPS)
+STREAM_FRAME_BUDGET_MS = 66
+
+# Inference Backend
+# Options: "torch" (ultralytics/PyTorch), "onnx" (ONNX Runtime), "openvino"
+# onnx/openvino export the YOLO model once into MODEL_CACHE_DIR and fall back
+# to torch if they can't be loaded
+INFERENCE_BACKEND = "torch"
+MODEL_CACHE_DIR = "model_cache"
+
+# Model input size (square, pixels)
+INFERENCE_IMAGE_SIZE = 640
+
+# Use an INT8-quantised ONNX model (smaller/faster on CPU, slightly less accurate)
+INFERENCE_INT8 = False
+
+# CPU threads for onnx/openvino (0 = let the runtime decide)
+INFERENCE_INTRA_OP_THREADS = 0
+INFERENCE_INTER_OP_THREADS = 1
+
+# ============================================================================
+# REGIONS OF INTEREST (LANE MASKS)
+# ============================================================================
+
+# Polygons per camera; YOLO only runs on the bounding crops of these regions
+# and detections whose bottom-centre point is outside them are ignored.
+# Keys: stream id, camera IP/URL, video path or video file name, or 'default'.
+# Points are (x, y) in pixels, or fractions of the frame size (0-1).
+# Empty = whole frame.
+# Example:
+# ROI_POLYGONS = {
+#     '192.168.1.50': [[(0.05, 0.45), (0.55, 0.45), (0.60, 1.0), (0.0, 1.0)]],
+#     'traffic.mp4': [[(100, 300), (600, 300), (640, 480), (0, 480)]],
+# }
+ROI_POLYGONS = {}
+
 # ============================================================================
 # VEHICLE PRIORITY CLASSIFICATION
 # ============================================================================
@@ -70,6 +115,14 @@ LED_CONTROL_ENABLED = True
 # LED HTTP Request Timeout (seconds)
 LED_REQUEST_TIMEOUT = 1
 
+# LED commands are sent from a background thread (see led.py)
+# Higher priorities show at once; a drop to a lower one (or off) must hold for
+# LED_RELEASE_DELAY seconds first, so LEDs don't flap between detection frames
+LED_RELEASE_DELAY = 1.0  # seconds
+# Failed commands are retried after LED_RETRY_BACKOFF seconds, doubling up to the max
+LED_RETRY_BACKOFF = 0.5  # seconds
+LED_RETRY_MAX_BACKOFF = 10  # seconds
+
 # ============================================================================
 # ESP32-CAM SETTINGS
 # ============================================================================
@@ -78,11 +131,24 @@ LED_REQUEST_TIMEOUT = 1
 DEFAULT_STREAM_PATH = "/stream"
 
 # Connection timeout for stream (seconds)
+# Also the read watchdog: a stream with no frame for this long is reopened
 STREAM_TIMEOUT = 5
 
 # Retry attempts for stream connection
+# (at startup; once connected, a lost stream is reconnected for as long as the detector runs)
 STREAM_RETRY_ATTEMPTS = 3
 
+# Reconnecting (see connection.py)
+# A stream is dropped after STREAM_TIMEOUT without a frame or STREAM_MAX_READ_FAILURES
+# failed reads in a row, then reopened after a random delay of up to
+# STREAM_RETRY_BACKOFF * 2^attempt seconds (capped at STREAM_RETRY_MAX_BACKOFF).
+# At most STREAM_MAX_CONCURRENT_CONNECTS opens run at once, so cameras that drop
+# off Wi-Fi together come back spread out instead of all at the same moment.
+STREAM_MAX_READ_FAILURES = 3
+STREAM_RETRY_BACKOFF = 0.5  # seconds
+STREAM_RETRY_MAX_BACKOFF = 15  # seconds
+STREAM_MAX_CONCURRENT_CONNECTS = 2
+
 # ============================================================================
 # VIDEO PROCESSING SETTINGS
 # ============================================================================
@@ -134,6 +200,55 @@ STATUS_TEXT_POSITION = (10, 30)
 # Older entries will be removed when limit is reached
 MAX_LOG_ENTRIES = 10000
 
+# Detection log on disk (see detection_log.py)
+# Binary records are written in batches to LOG_DIR/<camera>/<run>/ segment
+# files that rotate at LOG_SEGMENT_MB; only the newest LOG_MAX_SEGMENTS are kept
+LOG_DIR = "detection_logs"
+LOG_SEGMENT_MB = 16
+LOG_MAX_SEGMENTS = 64
+LOG_FLUSH_INTERVAL = 1.0  # seconds
+
+# Columnar detection store (see detection_store.py, needs pyarrow)
+# Parquet files partitioned by (UTC) day and camera under STORE_DIR, with a sidecar
+# index for fast time-range and plate lookups (/api/detections/search).
+# Every flush adds a file; once a partition has more than STORE_COMPACT_FILES
+# small ones (under STORE_ROW_GROUP_SIZE rows) those are merged into one
+STORE_ENABLED = True
+STORE_DIR = "detection_store"
+STORE_ROW_GROUP_SIZE = 10000
+STORE_FLUSH_INTERVAL = 60  # seconds
+STORE_COMPACT_FILES = 24
+
+# Live statistics for the API (see live_stats.py)
+# The detector keeps running totals and the last STATS_RECENT_SIZE detections
+# and publishes them to shared memory; /api/stats and /api/detections read that.
+# One detector process per name: start further ones (and their API) with another name
+STATS_SHM_NAME = "esp32cam_live_stats"
+STATS_SHM_SIZE = 256 * 1024  # bytes
+STATS_PUBLISH_INTERVAL = 0.05  # seconds (about one frame)
+STATS_RECENT_SIZE = 50
+STATS_BUCKET_SECONDS = 60  # timeline bucket width
+STATS_BUCKETS = 60  # timeline buckets kept (one hour at 60s)
+
+# Push channel (/api/stream, server-sent events)
+# One API thread checks the snapshot every STREAM_POLL_INTERVAL and fans changes
+# out to every client; each client gets at most one message per STREAM_CLIENT_INTERVAL
+STREAM_POLL_INTERVAL = 0.05  # seconds
+STREAM_CLIENT_INTERVAL = 0.25  # seconds
+STREAM_HEARTBEAT = 15  # seconds between keep-alive comments on an idle stream
+
+# Annotated MJPEG re-stream (see restream.py)
+# http://<host>:RESTREAM_PORT/stream shows the annotated video, e.g. for headless
+# deployments. Frames are JPEG-encoded once per resolution/quality and shared by
+# all viewers, and not at all while nobody is watching.
+# There is no authentication, so it only listens on this machine by default;
+# exposing plate video to the network is opt-in (--restream-host 0.0.0.0)
+RESTREAM_ENABLED = True
+RESTREAM_HOST = "127.0.0.1"
+RESTREAM_PORT = 8081
+RESTREAM_MAX_FPS = 15
+RESTREAM_JPEG_QUALITY = 70
+
 # Log to console
 CONSOLE_LOGGING_ENABLED = True
 
@@ -155,6 +270,8 @@ EXCEL_INCLUDE_HEADER = True
 
 # Export format
 # Options: "xlsx" (default), "csv"
+# Exports are written on a background thread straight from the on-disk log;
+# incremental exports ('i' key / "Export New Rows") append only the new rows
 EXPORT_FORMAT = "xlsx"
 
 # ============================================================================
@@ -172,16 +289,94 @@ WORKER_THREADS = 1
 # Frame buffer size
 FRAME_BUFFER_SIZE = 1
 
+# Pipeline queue sizes
+# Capture, inference, annotate (OCR + drawing) and render run as separate stages
+# connected by bounded queues. Live streams drop the oldest queued frame when a
+# queue is full; video files block so every frame is processed.
+PIPELINE_QUEUE_SIZE = 2
+PIPELINE_IO_QUEUE_SIZE = 256  # LED commands and log appends
+
+# License plate OCR worker processes
+# Each worker loads its own EasyOCR model (~100MB RAM each)
+OCR_WORKERS = 2
+# Max plate crops waiting for a worker; low-priority vehicles are dropped first
+OCR_QUEUE_SIZE = 16
+
+# Plate reading schedule
+# Each tracked vehicle is read once; a read below OCR_CONFIRM_CONFIDENCE is only
+# repeated when a better (bigger/sharper) crop shows up, and reads are combined
+# by vote until one text gets OCR_CONFIRM_VOTES reads
+OCR_CONFIRM_CONFIDENCE = 0.6
+OCR_CONFIRM_VOTES = 2
+OCR_MAX_READS_PER_VEHICLE = 4
+
+# Shared inference engine (used when several cameras run in one process)
+# Frames from all streams are grouped into one forward pass of up to
+# INFERENCE_MAX_BATCH frames, waiting at most INFERENCE_MAX_WAIT_MS for the batch to fill
+INFERENCE_MAX_BATCH = 8
+INFERENCE_MAX_WAIT_MS = 10
+
+# Offline batch processing (--batch)
+# Each video is split into chunks of BATCH_CHUNK_FRAMES frames, processed in
+# parallel by BATCH_WORKERS processes (0 = one per CPU core), each with its own
+# model and BATCH_OCR_WORKERS plate readers. Tracks restart at chunk boundaries.
+BATCH_WORKERS = 0
+BATCH_CHUNK_FRAMES = 3000
+BATCH_OCR_WORKERS = 1
+
 # ============================================================================
 # ADVANCED SETTINGS
 # ============================================================================
 
 # Enable debug mode
+# Also draws per-stage p50/p99 timings (ms) on the video
 DEBUG_MODE = False
 
-# Show FPS counter
+# Show FPS counter (rendered and inferred frames per second) on the video
 SHOW_FPS = False
 
+# Prometheus metrics (see metrics.py)
+# Per-stage timing summaries (capture, motion, preprocess, forward, decode,
+# inference, postprocess, annotate, OCR, render, LED, log) and frame/OCR/LED
+# counters for every detector, at http://<host>:METRICS_PORT/metrics.
+# Only on this machine by default; let a remote Prometheus scrape it with
+# --metrics-host 0.0.0.0
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+
+# Benchmarks (python benchmark.py)
+# Generated clips, results/*.json and the stored baseline.json live in BENCHMARK_DIR.
+# Every scenario processes BENCHMARK_FRAMES frames; a metric more than
+# BENCHMARK_TOLERANCE (relative) worse than the baseline is a regression.
+# The stub model costs BENCHMARK_STUB_BATCH_MS per forward pass plus
+# BENCHMARK_STUB_IMAGE_MS per image, the stub OCR BENCHMARK_STUB_OCR_MS per read.
+BENCHMARK_DIR = "benchmarks"
+BENCHMARK_FRAMES = 300
+BENCHMARK_BATCH_SIZES = (1, 2, 4, 8)
+BENCHMARK_TOLERANCE = 0.15
+BENCHMARK_STUB_BATCH_MS = 15
+BENCHMARK_STUB_IMAGE_MS = 5
+BENCHMARK_STUB_OCR_MS = 40
+
+# ESP32-CAM simulator (python camera_sim.py, see camera_sim.py)
+# Camera i listens on SIM_BASE_PORT + i and serves /stream, /capture and /led
+# like the sketch. Synthetic frames loop every SIM_SYNTHETIC_FRAMES frames.
+# Impairments: frames up to SIM_JITTER_MS late, SIM_LOSS of frames dropped,
+# SIM_STALL_RATE stalls of SIM_STALL_SECONDS and SIM_DISCONNECT_RATE dropped
+# connections per second per stream
+SIM_HOST = "127.0.0.1"
+SIM_BASE_PORT = 8100
+SIM_FPS = 15
+SIM_RESOLUTION = (800, 600)  # The sketch's SVGA frame size
+SIM_JPEG_QUALITY = 80
+SIM_SYNTHETIC_FRAMES = 300
+SIM_JITTER_MS = 0
+SIM_LOSS = 0.0
+SIM_STALL_RATE = 0.0
+SIM_STALL_SECONDS = 3.0
+SIM_DISCONNECT_RATE = 0.0
+
 # Save detection images
 SAVE_DETECTION_IMAGES = False
 DETECTION_IMAGES_DIR = "detections"
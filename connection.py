@@ -0,0 +1,344 @@
+"""
+Self-healing live stream connections for the ESP32-CAM detection system
+
+StreamConnection stands in for the cv2.VideoCapture of a live stream (the
+FrameGrabber reads from it the same way) and keeps the stream alive by itself:
+
+  - Each opened capture is read on its own daemon thread. A watchdog on the
+    monotonic time of the last frame drops the capture once no frame has come
+    for config.STREAM_TIMEOUT seconds, even if its read() never returns (the
+    stuck thread releases the capture whenever the read finally does)
+  - A capture that fails STREAM_MAX_READ_FAILURES reads in a row is dropped too
+  - Opens and reads also get FFmpeg timeouts of STREAM_TIMEOUT where OpenCV
+    supports them (4.6+), so stuck reads usually end on their own
+  - Every reopen, the first one included, waits a random delay of up to
+    STREAM_RETRY_BACKOFF * 2^attempt (full jitter, capped at
+    STREAM_RETRY_MAX_BACKOFF), and at most STREAM_MAX_CONCURRENT_CONNECTS opens
+    run at once in the process, so cameras that lose Wi-Fi together don't all
+    reconnect in the same instant
+  - Only the capture is replaced: the pipeline, model, tracker and OCR workers
+    keep running, loaded and warm, while a camera is away
+
+State (connecting / streaming / reconnecting / closed), drop and stall counts
+and time to recover (last frame before a drop -> first frame after it) are
+available from status(), reported to an on_change callback and, given a
+Metrics object, exported as the stream_up / stream_down_seconds gauges,
+stream_drops / stream_stalls / stream_recoveries counters and a 'recovery'
+timing.
+"""
+import random
+import threading
+import time
+
+import cv2
+
+import config
+
+CONNECTING = 'connecting'
+STREAMING = 'streaming'
+RECONNECTING = 'reconnecting'
+CLOSED = 'closed'
+
+_connect_gate = None  # Process-wide limit on simultaneous opens
+_connect_gate_lock = threading.Lock()
+
+
+def _gate():
+    global _connect_gate
+    with _connect_gate_lock:
+        if _connect_gate is None:
+            _connect_gate = threading.BoundedSemaphore(max(1, int(config.STREAM_MAX_CONCURRENT_CONNECTS)))
+        return _connect_gate
+
+
+def open_capture(url, timeout=None):
+    """cv2.VideoCapture for a stream URL with FFmpeg open/read timeouts (a plain open on older OpenCV)"""
+    timeout_ms = int((timeout or config.STREAM_TIMEOUT) * 1000)
+    try:
+        cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms,
+                                                     cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms])
+    except (AttributeError, TypeError, cv2.error):
+        cap = cv2.VideoCapture(url)  # OpenCV < 4.6: no timeout properties
+    # For IP camera apps, may need to set buffer size
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+
+class _CaptureReader:
+    """
+    Reads one opened capture on a daemon thread, keeping only the newest frame
+
+    Only this thread ever touches the capture after the open, so it can be
+    abandoned mid-read: stop() returns at once and the capture is released
+    here when the read returns.
+    """
+
+    def __init__(self, cap, name):
+        self.cap = cap
+        self.cond = threading.Condition()
+        self.frame = None  # Newest frame not yet taken
+        self.failures = 0  # Failed reads not yet reported
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"stream-{name}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while self.running:
+                try:
+                    ret, frame = self.cap.read()
+                except cv2.error:
+                    ret, frame = False, None
+                with self.cond:
+                    if ret:
+                        self.frame = frame
+                    else:
+                        self.failures += 1
+                    self.cond.notify_all()
+                if not ret:
+                    time.sleep(0.05)  # Don't spin on a dead capture
+        finally:
+            self.cap.release()
+
+    def take(self, timeout):
+        """
+        Returns:
+            (True, frame), (False, None) for a failed read, or None if neither came within timeout
+        """
+        with self.cond:
+            if self.frame is None and not self.failures and self.running:
+                self.cond.wait(timeout)
+            if self.frame is not None:
+                frame, self.frame = self.frame, None
+                return True, frame
+            if self.failures:
+                self.failures -= 1
+                return False, None
+            return None
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def stop(self):
+        self.running = False
+        self.wake()
+
+
+class StreamConnection:
+    """
+    A live stream that reconnects itself; read()/release() like cv2.VideoCapture
+
+    Args:
+        url: Stream URL
+        name: Name used in messages (default: the URL)
+        timeout: Open/read timeout and watchdog period (default config.STREAM_TIMEOUT)
+        backoff: First reconnect delay bound, doubled per failed attempt (default config.STREAM_RETRY_BACKOFF)
+        max_backoff: Largest reconnect delay bound (default config.STREAM_RETRY_MAX_BACKOFF)
+        metrics: Metrics to export connection gauges, counters and 'recovery' timings into
+        on_change: Called with status() whenever the state changes
+    """
+
+    def __init__(self, url, name=None, timeout=None, backoff=None, max_backoff=None, metrics=None, on_change=None):
+        self.url = url
+        self.name = name or url
+        self.timeout = timeout or config.STREAM_TIMEOUT
+        self.backoff = backoff or config.STREAM_RETRY_BACKOFF
+        self.max_backoff = max_backoff or config.STREAM_RETRY_MAX_BACKOFF
+        self.metrics = metrics
+        self.on_change = on_change
+        self.rng = random.Random()
+
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.reader = None  # _CaptureReader of the open capture
+        self.state = CONNECTING
+        self.last_frame_at = None  # Monotonic; the watchdog fires STREAM_TIMEOUT after it
+        self.down_since = None  # Monotonic time of the last frame before the current drop
+        self.down_since_wall = None
+        self.read_failures_in_row = 0
+
+        # Metrics
+        self.opens = 0
+        self.failed_opens = 0
+        self.read_failures = 0
+        self.drops = 0
+        self.stalls = 0
+        self.recoveries = 0
+        self.last_recovery = None
+        self.max_recovery = 0.0
+        self.total_downtime = 0.0
+        self.last_error = None
+
+        if metrics is not None:
+            metrics.gauge('stream_up', lambda: int(self.state == STREAMING))
+            metrics.gauge('stream_down_seconds', lambda: round(self.down_for(), 3))
+
+    def connect(self, attempts=None, backoff_first=False):
+        """
+        Open the stream, backing off between failed attempts
+
+        Args:
+            attempts: Give up after this many failed opens (None = until closed)
+            backoff_first: Wait a jittered delay before the first attempt too (reconnects)
+
+        Returns:
+            True once open, False if it gave up or was closed
+        """
+        delays = int(backoff_first)
+        if delays:
+            self.closed.wait(self._delay(delays))
+        failures = 0
+        while not self.closed.is_set():
+            if self._open():
+                return True
+            failures += 1
+            if attempts is not None and failures >= attempts:
+                return False
+            self.closed.wait(self._delay(failures + delays))
+        return False
+
+    def _delay(self, attempt):
+        """Full jitter: cameras that failed together retry at spread-out times"""
+        return self.rng.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def _open(self):
+        with _gate():  # Few opens at once, however many cameras are reconnecting
+            if self.closed.is_set():
+                return False
+            cap = open_capture(self.url, self.timeout)
+        if not cap.isOpened():
+            cap.release()
+            self.failed_opens += 1
+            self.last_error = "open failed"
+            return False
+        with self.lock:
+            if self.closed.is_set():
+                cap.release()
+                return False
+            self.reader = _CaptureReader(cap, self.name)
+            self.opens += 1
+            self.read_failures_in_row = 0
+            self.last_frame_at = time.monotonic()  # The watchdog starts counting from the open
+        return True
+
+    def read(self):
+        """
+        Next frame, reconnecting first if the stream is down
+
+        Returns:
+            (ret, frame) like cv2.VideoCapture.read(); (False, None) while the stream is down
+        """
+        if self.reader is None and not self.connect(backoff_first=self.state == RECONNECTING):
+            return False, None
+        reader = self.reader
+        if reader is None:
+            return False, None
+        result = reader.take(max(0.0, self.last_frame_at + self.timeout - time.monotonic()))
+        now = time.monotonic()
+        if self.closed.is_set():
+            return False, None
+        if result is None:
+            # Watchdog: not even a failed read for STREAM_TIMEOUT, the capture is stuck
+            self._lost(f"no frame for {now - self.last_frame_at:.1f}s", stalled=True)
+            return False, None
+
+        ret, frame = result
+        if ret:
+            self.last_frame_at = now
+            self.read_failures_in_row = 0
+            if self.state != STREAMING:
+                self._streaming(now)
+            return True, frame
+
+        self.read_failures += 1
+        self.read_failures_in_row += 1
+        if now - self.last_frame_at >= self.timeout:
+            self._lost(f"no frame for {now - self.last_frame_at:.1f}s", stalled=True)
+        elif self.read_failures_in_row >= config.STREAM_MAX_READ_FAILURES:
+            self._lost(f"{self.read_failures_in_row} failed reads")
+        return False, None
+
+    def _streaming(self, now):
+        with self.lock:
+            self.state = STREAMING
+            recovery = None
+            if self.down_since is not None:
+                recovery = now - self.down_since
+                self.down_since = self.down_since_wall = None
+                self.recoveries += 1
+                self.last_recovery = recovery
+                self.max_recovery = max(self.max_recovery, recovery)
+                self.total_downtime += recovery
+        if recovery is not None:
+            print(f"✅ Stream {self.name} back after {recovery:.1f}s")
+            if self.metrics is not None:
+                self.metrics.observe('recovery', recovery)
+                self.metrics.count('stream_recoveries')
+        self._notify()
+
+    def _lost(self, reason, stalled=False):
+        with self.lock:
+            reader, self.reader = self.reader, None
+            closed = self.closed.is_set()
+            if not closed:
+                self.state = RECONNECTING
+                self.drops += 1
+                self.stalls += stalled
+                self.last_error = reason
+                if self.down_since is None:
+                    self.down_since = self.last_frame_at or time.monotonic()
+                    self.down_since_wall = time.time() - (time.monotonic() - self.down_since)
+        if reader is not None:
+            reader.stop()  # Its thread releases the capture, now or when a stuck read returns
+        if closed:
+            return
+        print(f"⚠️ Stream {self.name} lost ({reason}), reconnecting...")
+        if self.metrics is not None:
+            self.metrics.count('stream_drops')
+            if stalled:
+                self.metrics.count('stream_stalls')
+        self._notify()
+
+    def _notify(self):
+        if self.on_change is not None:
+            try:
+                self.on_change(self.status())
+            except Exception as e:
+                print(f"⚠️ Connection state callback failed: {e}")
+
+    def down_for(self):
+        """Seconds since the last frame before the current drop (0 while streaming)"""
+        down_since = self.down_since
+        return time.monotonic() - down_since if down_since is not None else 0.0
+
+    def status(self):
+        return {
+            'state': self.state,
+            'down_since': self.down_since_wall,
+            'opens': self.opens,
+            'failed_opens': self.failed_opens,
+            'drops': self.drops,
+            'stalls': self.stalls,
+            'recoveries': self.recoveries,
+            'last_recovery_s': round(self.last_recovery, 2) if self.last_recovery is not None else None,
+            'max_recovery_s': round(self.max_recovery, 2),
+            'downtime_s': round(self.total_downtime + self.down_for(), 2),
+            'last_error': self.last_error,
+        }
+
+    def interrupt(self):
+        """Stop reconnecting (wakes a reader waiting out a backoff or for a frame)"""
+        self.closed.set()
+        reader = self.reader
+        if reader is not None:
+            reader.wake()
+
+    def release(self):
+        with self.lock:
+            self.closed.set()
+            self.state = CLOSED
+            reader, self.reader = self.reader, None
+        if reader is not None:
+            reader.stop()
+        self._notify()
@@ -0,0 +1,287 @@
+"""
+Append-only detection log for the ESP32-CAM detection system
+
+Each detection is a fixed-size binary record (LOG_RECORD_DTYPE, 24 bytes):
+numeric timestamp, class id, priority code, plate id, track id and pedestrian
+count. Plate texts are interned once into plates.txt and referenced by id.
+Records are buffered and written in batches to segment files that rotate at
+config.LOG_SEGMENT_MB; only the newest config.LOG_MAX_SEGMENTS are kept, so
+disk use is bounded too. A small in-memory ring (config.MAX_LOG_ENTRIES)
+keeps the recent window for the UI.
+
+Layout of a log directory:
+    meta.json           class names, timestamp kind, record dtype
+    plates.txt          plate id N is line N (id 0 = no plate)
+    segment_000001.bin  raw records, oldest first
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+import config
+
+LOG_RECORD_DTYPE = np.dtype([
+    ('ts', '<f8'),           # Unix time, or seconds into the video for batch runs
+    ('cls', '<i2'),          # Model class id
+    ('priority', 'i1'),      # PRIORITY_* code (0 = none / general mode)
+    ('pedestrians', '<i2'),  # Pedestrians in view when the vehicle was first seen
+    ('plate_id', '<i4'),     # Index into plates.txt, 0 = no plate
+    ('track_id', '<i8'),     # Tracker ID, 0 = untracked
+])
+
+PRIORITY_NAMES = ('N/A', 'LOW', 'MEDIUM', 'HIGH')  # priority code -> log text
+
+
+def format_timestamp(ts, kind='wall'):
+    """Record timestamp as text: local date/time, or HH:MM:SS.mmm into the video"""
+    if kind == 'video':
+        millis = int(round(ts * 1000))
+        minutes, millis = divmod(millis, 60000)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours:02d}:{minutes:02d}:{millis / 1000:06.3f}"
+    return datetime.fromtimestamp(ts).isoformat(sep=' ', timespec='seconds')
+
+
+class DetectionLog:
+    """
+    Bounded detection log: rotating binary segments on disk plus a recent ring
+
+    Args:
+        directory: Where segments are written (None = memory only, ring only)
+        class_names: Model class id -> label, for decoding
+        timestamps: 'wall' (Unix time) or 'video' (seconds into the file)
+        ring_size: Records kept in memory (default config.MAX_LOG_ENTRIES, 0 = unbounded)
+        segment_bytes: Rotate the segment file at this size
+        max_segments: Oldest segments beyond this are deleted
+        flush_records: Write once this many records are buffered
+        flush_interval: ... or once the oldest buffered record is this old (seconds)
+    """
+
+    def __init__(self, directory=None, class_names=None, timestamps='wall', ring_size=None,
+                 segment_bytes=None, max_segments=None, flush_records=256, flush_interval=None):
+        self.directory = directory
+        self.class_names = class_names or {}
+        self.timestamps = timestamps
+        ring_size = config.MAX_LOG_ENTRIES if ring_size is None else ring_size
+        self.ring = deque(maxlen=ring_size or None)
+        self.segment_bytes = segment_bytes or int(config.LOG_SEGMENT_MB * 1024 * 1024)
+        self.max_segments = max(1, max_segments or config.LOG_MAX_SEGMENTS)
+        self.flush_records = flush_records
+        self.flush_interval = flush_interval if flush_interval is not None else config.LOG_FLUSH_INTERVAL
+
+        self.plates = [None]  # plate id -> text
+        self.plate_ids = {}   # text -> plate id
+        self.new_plates = []  # interned since the last flush
+
+        self.buffer = []
+        self.buffer_since = None
+        self.lock = threading.Lock()
+        self.file = None
+        self.segment_index = 0
+        self.segments = []
+        self.first_index = 0  # Absolute index of the oldest record still on disk
+        self.total = 0
+        self.bytes_written = 0
+        self.flushes = 0
+
+    def __len__(self):
+        return self.total
+
+    def plate_id(self, plate):
+        if not plate or plate == "N/A":
+            return 0
+        pid = self.plate_ids.get(plate)
+        if pid is None:
+            pid = self.plate_ids[plate] = len(self.plates)
+            self.plates.append(plate)
+            self.new_plates.append(plate)
+        return pid
+
+    def append(self, ts, cls, priority=0, plate=None, track_id=0, pedestrians=0):
+        self.extend([(ts, cls, priority, plate, track_id, pedestrians)])
+
+    def extend(self, entries):
+        """
+        Add records
+
+        Args:
+            entries: Iterable of (ts, cls, priority_code, plate_text, track_id, pedestrians)
+        """
+        with self.lock:
+            for ts, cls, priority, plate, track_id, pedestrians in entries:
+                record = (ts, cls, priority, pedestrians, self.plate_id(plate), track_id)
+                self.ring.append(record)
+                self.total += 1
+                if self.directory is not None:
+                    self.buffer.append(record)
+            if self.buffer and self.buffer_since is None:
+                self.buffer_since = time.monotonic()
+            due = self.buffer and (len(self.buffer) >= self.flush_records
+                                   or time.monotonic() - self.buffer_since >= self.flush_interval)
+            if due:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.segment_index == 0:
+            with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+                json.dump({
+                    'class_names': {str(k): v for k, v in self.class_names.items()},
+                    'timestamps': self.timestamps,
+                    'dtype': LOG_RECORD_DTYPE.descr,
+                }, f)
+        self.segment_index += 1
+        path = os.path.join(self.directory, f"segment_{self.segment_index:06d}.bin")
+        self.segments.append(path)
+        self.file = open(path, 'ab')
+        # Bounded disk use: drop the oldest segments
+        while len(self.segments) > self.max_segments:
+            oldest = self.segments.pop(0)
+            try:
+                self.first_index += os.path.getsize(oldest) // LOG_RECORD_DTYPE.itemsize
+                os.remove(oldest)
+            except OSError:
+                pass
+
+    def _flush(self):
+        if self.directory is None or not (self.buffer or self.new_plates):
+            return
+        if self.file is None:
+            self._open_segment()
+        if self.new_plates:
+            with open(os.path.join(self.directory, 'plates.txt'), 'a', encoding='utf-8') as f:
+                f.writelines(p + "\n" for p in self.new_plates)
+            self.new_plates = []
+        if self.buffer:
+            data = np.array(self.buffer, dtype=LOG_RECORD_DTYPE).tobytes()
+            self.file.write(data)
+            self.file.flush()
+            self.bytes_written += len(data)
+            self.flushes += 1
+            self.buffer = []
+            self.buffer_since = None
+            if self.file.tell() >= self.segment_bytes:
+                self.file.close()
+                self._open_segment()
+
+    def records(self):
+        """
+        Every record still available, oldest first
+
+        Returns:
+            Structured array of LOG_RECORD_DTYPE: the on-disk segments (plus
+            anything buffered), or the ring for a memory-only log
+        """
+        with self.lock:
+            if self.directory is None:
+                return np.array(list(self.ring), dtype=LOG_RECORD_DTYPE)
+            self._flush()
+            parts = [np.fromfile(path, dtype=LOG_RECORD_DTYPE) for path in self.segments if os.path.exists(path)]
+        if not parts:
+            return np.zeros(0, dtype=LOG_RECORD_DTYPE)
+        return np.concatenate(parts)
+
+    def iter_records(self, start=0, chunk_size=65536):
+        """
+        Stream records with absolute index >= start, oldest first, without
+        loading the whole log
+
+        Yields:
+            (index_of_first_record, structured array of at most chunk_size records)
+        """
+        with self.lock:
+            if self.directory is None:
+                first = self.total - len(self.ring)
+                ring = list(self.ring)[max(0, start - first):]
+                snapshot = None
+            else:
+                self._flush()
+                first = self.first_index
+                # Segments are append-only: remember how far each one goes right now
+                snapshot = [(path, os.path.getsize(path) // LOG_RECORD_DTYPE.itemsize)
+                            for path in self.segments if os.path.exists(path)]
+        if snapshot is None:
+            index = max(start, first)
+            for i in range(0, len(ring), chunk_size):
+                yield index + i, np.array(ring[i:i + chunk_size], dtype=LOG_RECORD_DTYPE)
+            return
+
+        index = first
+        for path, count in snapshot:
+            if index + count <= start:
+                index += count
+                continue
+            skip = max(0, start - index)
+            try:
+                f = open(path, 'rb')
+            except FileNotFoundError:
+                # Rotated away since the snapshot: those records are gone, carry on with the rest
+                index += count
+                continue
+            with f:
+                f.seek(skip * LOG_RECORD_DTYPE.itemsize)
+                remaining = count - skip
+                position = index + skip
+                while remaining > 0:
+                    n = min(chunk_size, remaining)
+                    records = np.fromfile(f, dtype=LOG_RECORD_DTYPE, count=n)
+                    if len(records) == 0:
+                        break
+                    yield position, records
+                    position += len(records)
+                    remaining -= len(records)
+            index += count
+
+    def decode(self, records):
+        """Records -> (timestamp, label, priority, plate, pedestrians) rows for display/export"""
+        rows = []
+        for r in records:
+            cls = int(r['cls'])
+            rows.append((
+                format_timestamp(float(r['ts']), self.timestamps),
+                self.class_names.get(cls, str(cls)),
+                PRIORITY_NAMES[int(r['priority'])],
+                self.plates[int(r['plate_id'])] or "N/A",
+                int(r['pedestrians']),
+            ))
+        return rows
+
+    def rows(self):
+        """Every available record, decoded"""
+        return self.decode(self.records())
+
+    def recent(self, count=None):
+        """Newest records from the in-memory ring, decoded, oldest first"""
+        with self.lock:
+            ring = list(self.ring)
+        if count is not None:
+            ring = ring[-count:]
+        return self.decode(np.array(ring, dtype=LOG_RECORD_DTYPE))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'records': self.total,
+                'in_memory': len(self.ring),
+                'buffered': len(self.buffer),
+                'segments': len(self.segments),
+                'bytes_written': self.bytes_written,
+                'flushes': self.flushes,
+                'plates': len(self.plates) - 1,
+            }
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,338 @@
+"""
+Columnar detection store for the ESP32-CAM detection system
+
+Detections are persisted as Parquet files partitioned by UTC day and camera
+(timestamps are stored as UTC instants; text output is local time):
+
+    detection_store/date=2024-05-01/camera=192.168.1.50/part-083015-000001.parquet
+    detection_store/date=2024-05-01/camera=192.168.1.50/_index.json
+
+Each partition keeps a small sidecar index listing, for every row group, its
+timestamp range, row count and the plates it contains. Time-range and plate
+queries use the index to pick the matching row groups and read only those,
+through memory-mapped Parquet I/O, instead of opening every file.
+
+Each flush writes a new file, so once a partition holds more than
+config.STORE_COMPACT_FILES small files (less than one full row group,
+config.STORE_ROW_GROUP_SIZE rows) they are merged into one. Files of at least
+a row group are left alone, so each row is rewritten a bounded number of times
+rather than on every compaction (new file and index first, old files removed
+last; a reader that loses that race re-reads the partition's index).
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import config
+from detection_log import PRIORITY_NAMES, format_timestamp
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+
+INDEX_FILE = '_index.json'
+DAY_SECONDS = 24 * 3600
+
+
+def _ts_type():
+    return pa.timestamp('ms', tz='UTC')
+
+
+def _schema():
+    return pa.schema([
+        ('ts', _ts_type()),
+        ('cls', pa.int16()),
+        ('label', pa.dictionary(pa.int16(), pa.string())),
+        ('priority', pa.int8()),
+        ('plate', pa.string()),
+        ('track_id', pa.int64()),
+        ('pedestrians', pa.int16()),
+    ])
+
+
+def _partition_name(value):
+    return "".join(c if c.isalnum() or c in '-_.' else '_' for c in str(value)).strip('_') or "default"
+
+
+def _day(ts):
+    """Partition day of a Unix timestamp (UTC, the same clock the ts column is stored in)"""
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%d')
+
+
+def _row_groups(ts, plates, row_group_size):
+    """Sidecar index entries (time range and plates per row group) for rows sorted by ts"""
+    groups = []
+    for start in range(0, len(ts), row_group_size):
+        end = min(start + row_group_size, len(ts))
+        groups.append({
+            'ts_min': ts[start],
+            'ts_max': ts[end - 1],
+            'rows': end - start,
+            'plates': sorted({p for p in plates[start:end] if p and p != "N/A"}),
+        })
+    return groups
+
+
+class DetectionStore:
+    """
+    Day/camera partitioned Parquet files plus per-partition row-group indexes
+
+    Args:
+        root: Store directory (default config.STORE_DIR)
+    """
+
+    def __init__(self, root=None):
+        if pa is None:
+            raise RuntimeError("pyarrow not installed. Install with: pip install pyarrow")
+        self.root = root or config.STORE_DIR
+        self.schema = _schema()
+        self.lock = threading.Lock()
+        self.seq = 0
+
+    def partition_dir(self, day, camera):
+        return os.path.join(self.root, f"date={day}", f"camera={_partition_name(camera)}")
+
+    def _load_index(self, directory):
+        try:
+            with open(os.path.join(directory, INDEX_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'files': []}
+
+    def write(self, camera, rows):
+        """
+        Append rows as a new Parquet file in each day partition they fall in
+
+        Args:
+            camera: Camera / stream id (partition key)
+            rows: List of (ts, cls, label, priority_code, plate, track_id, pedestrians)
+        """
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(_day(row[0]), []).append(row)
+        for day, day_rows in by_day.items():
+            self._write_partition(day, camera, day_rows)
+
+    def _write_partition(self, day, camera, rows):
+        rows.sort(key=lambda r: r[0])
+        columns = list(zip(*rows))
+        table = pa.table({
+            'ts': pa.array([int(ts * 1000) for ts in columns[0]], _ts_type()),
+            'cls': pa.array(columns[1], pa.int16()),
+            'label': pa.array(columns[2], pa.string()).dictionary_encode().cast(self.schema.field('label').type),
+            'priority': pa.array(columns[3], pa.int8()),
+            'plate': pa.array([p if p and p != "N/A" else None for p in columns[4]], pa.string()),
+            'track_id': pa.array(columns[5], pa.int64()),
+            'pedestrians': pa.array(columns[6], pa.int16()),
+        }, schema=self.schema)
+
+        directory = self.partition_dir(day, camera)
+        row_group_size = config.STORE_ROW_GROUP_SIZE
+        with self.lock:
+            os.makedirs(directory, exist_ok=True)
+            name = self._file_name()
+            pq.write_table(table, os.path.join(directory, name), row_group_size=row_group_size,
+                           compression='zstd')
+
+            index = self._load_index(directory)
+            index['files'].append({'file': name, 'row_groups': _row_groups(columns[0], columns[4], row_group_size)})
+            self._save_index(directory, index)
+            if len(self._small_files(index)) > config.STORE_COMPACT_FILES:
+                self._compact(directory, index)
+
+    def _file_name(self):
+        self.seq += 1
+        return f"part-{datetime.now().strftime('%H%M%S')}-{os.getpid()}-{self.seq:06d}.parquet"
+
+    @staticmethod
+    def _save_index(directory, index):
+        tmp = os.path.join(directory, INDEX_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(directory, INDEX_FILE))
+
+    def _read(self, path, row_groups=None, columns=None):
+        """Memory-mapped read; files written before timestamps were tz-aware get their ts column marked UTC"""
+        parquet = pq.ParquetFile(path, memory_map=True)
+        if row_groups is None:
+            table = parquet.read(columns=columns)
+        else:
+            table = parquet.read_row_groups(row_groups, columns=columns)
+        if 'ts' in table.column_names and table.schema.field('ts').type != _ts_type():
+            i = table.column_names.index('ts')
+            table = table.set_column(i, 'ts', table['ts'].cast(_ts_type()))  # Naive values were UTC already
+        return table
+
+    @staticmethod
+    def _small_files(index):
+        """Index entries of files holding less than one full row group"""
+        return [entry for entry in index['files']
+                if sum(group['rows'] for group in entry['row_groups']) < config.STORE_ROW_GROUP_SIZE]
+
+    def _compact(self, directory, index):
+        """Merge the partition's small files into one (lock held); larger files are kept as they are"""
+        small = self._small_files(index)
+        names = [entry['file'] for entry in small]
+        table = pa.concat_tables([self._read(os.path.join(directory, name)) for name in names],
+                                 promote_options='default')
+        table = table.cast(self.schema).sort_by('ts')
+        row_group_size = config.STORE_ROW_GROUP_SIZE
+        name = self._file_name()
+        pq.write_table(table, os.path.join(directory, name), row_group_size=row_group_size, compression='zstd')
+        ts = [t / 1000 for t in table['ts'].cast(pa.int64()).to_pylist()]
+        groups = _row_groups(ts, table['plate'].to_pylist(), row_group_size)
+        kept = [entry for entry in index['files'] if entry['file'] not in names]
+        self._save_index(directory, {'files': kept + [{'file': name, 'row_groups': groups}]})
+        for old in names:
+            try:
+                os.remove(os.path.join(directory, old))
+            except OSError:
+                pass
+
+    def partitions(self, start=None, end=None, camera=None):
+        """Partition directories overlapping the day range (and camera, if given)"""
+        if not os.path.isdir(self.root):
+            return []
+        # A day of slack: stores written before partitions were UTC used local days
+        first = _day(start - DAY_SECONDS) if start is not None else None
+        last = _day(end + DAY_SECONDS) if end is not None else None
+        result = []
+        for day_dir in sorted(os.listdir(self.root)):
+            if not day_dir.startswith('date='):
+                continue
+            day = day_dir[5:]
+            if (first and day < first) or (last and day > last):
+                continue
+            day_path = os.path.join(self.root, day_dir)
+            for camera_dir in sorted(os.listdir(day_path)):
+                if camera is not None and camera_dir != f"camera={_partition_name(camera)}":
+                    continue
+                result.append(os.path.join(day_path, camera_dir))
+        return result
+
+    def query(self, start=None, end=None, plate=None, camera=None, columns=None):
+        """
+        Detections in [start, end] (Unix seconds), optionally for one plate / camera
+
+        Only row groups whose index entry overlaps the range and lists the
+        plate are read.
+
+        Returns:
+            pyarrow.Table with a 'camera' column added
+        """
+        tables = []
+        for directory in self.partitions(start, end, camera):
+            camera_name = os.path.basename(directory)[len('camera='):]
+            try:
+                found = self._read_partition(directory, start, end, plate, columns)
+            except FileNotFoundError:
+                # Compacted while we read it: the new index lists the merged file
+                found = self._read_partition(directory, start, end, plate, columns)
+            for table in found:
+                tables.append(table.append_column('camera', pa.array([camera_name] * len(table), pa.string())))
+
+        if not tables:
+            schema = self.schema if columns is None else pa.schema([self.schema.field(c) for c in columns])
+            return schema.append(pa.field('camera', pa.string())).empty_table()
+        table = pa.concat_tables(tables, promote_options='default')
+
+        # Row groups are coarse; filter the rows themselves
+        mask = None
+        if 'ts' in table.column_names:
+            if start is not None:
+                mask = pc.greater_equal(table['ts'], pa.scalar(int(start * 1000), _ts_type()))
+            if end is not None:
+                upper = pc.less_equal(table['ts'], pa.scalar(int(end * 1000), _ts_type()))
+                mask = upper if mask is None else pc.and_(mask, upper)
+        if plate is not None and 'plate' in table.column_names:
+            same = pc.equal(table['plate'], plate)
+            mask = same if mask is None else pc.and_(mask, same)
+        if mask is not None:
+            table = table.filter(mask)
+        return table
+
+    def _read_partition(self, directory, start, end, plate, columns):
+        """Row groups of one partition that may hold matching rows, per its index"""
+        tables = []
+        for entry in self._load_index(directory)['files']:
+            groups = [
+                i for i, g in enumerate(entry['row_groups'])
+                if (start is None or g['ts_max'] >= start)
+                and (end is None or g['ts_min'] <= end)
+                and (plate is None or plate in g['plates'])
+            ]
+            if groups:
+                tables.append(self._read(os.path.join(directory, entry['file']), groups, columns))
+        return tables
+
+    @staticmethod
+    def to_rows(table):
+        """Query result -> JSON-friendly dicts (local-time text timestamps and priorities)"""
+        rows = table.to_pylist()
+        for row in rows:
+            row['ts'] = format_timestamp(row['ts'].timestamp())
+            row['priority'] = PRIORITY_NAMES[row['priority']]
+        return rows
+
+    def sightings(self, plate, days=7, camera=None):
+        """Every sighting of a plate in the last `days` days, as dicts (oldest first)"""
+        end = time.time()
+        start = end - timedelta(days=days).total_seconds()
+        return self.to_rows(self.query(start, end, plate=plate, camera=camera).sort_by('ts'))
+
+
+class StoreWriter:
+    """
+    Buffers one camera's detections and writes them to the store in batches
+
+    Args:
+        store: DetectionStore
+        camera: Camera / stream id
+        class_names: Model class id -> label
+        batch_rows: Write once this many rows are buffered (default config.STORE_ROW_GROUP_SIZE)
+        flush_interval: ... or once the oldest buffered row is this old (seconds)
+    """
+
+    def __init__(self, store, camera, class_names=None, batch_rows=None, flush_interval=None):
+        self.store = store
+        self.camera = camera
+        self.class_names = class_names or {}
+        self.batch_rows = batch_rows or config.STORE_ROW_GROUP_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else config.STORE_FLUSH_INTERVAL
+        self.buffer = []
+        self.buffer_since = None
+        self.rows_written = 0
+        self.errors = 0
+
+    def add(self, entries):
+        """
+        Args:
+            entries: Iterable of detection-log entries (ts, cls, priority_code, plate, track_id, pedestrians)
+        """
+        for ts, cls, priority, plate, track_id, pedestrians in entries:
+            label = self.class_names.get(int(cls), str(cls))
+            self.buffer.append((ts, cls, label, priority, plate, track_id, pedestrians))
+        if self.buffer and self.buffer_since is None:
+            self.buffer_since = time.monotonic()
+        if self.buffer and (len(self.buffer) >= self.batch_rows
+                            or time.monotonic() - self.buffer_since >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        rows, self.buffer, self.buffer_since = self.buffer, [], None
+        try:
+            self.store.write(self.camera, rows)
+            self.rows_written += len(rows)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Detection store write failed: {e}")
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,151 @@
+"""
+Background log export for the ESP32-CAM detection system
+
+Exports stream the detection log straight from its on-disk segments in
+chunks, so the full log is never materialised as Python objects, and run on
+a single background thread so neither the UI nor the detection loop waits.
+config.EXPORT_FORMAT picks the writer:
+
+  - 'xlsx': openpyxl write-only workbook (rows are streamed to the file)
+  - 'csv':  csv.writer
+
+Incremental exports only write rows added since the previous export: CSV
+appends to one running file, xlsx writes a new workbook with just the new rows.
+"""
+import csv
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+
+try:
+    import openpyxl
+    from openpyxl import Workbook
+except Exception:
+    openpyxl = None
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+
+
+class LogExporter:
+    """
+    Writes a DetectionLog to Excel or CSV on a background thread
+
+    Args:
+        log: DetectionLog to export
+        detect_pedestrians: Include the "Pedestrians Nearby" column
+        fmt: 'xlsx' or 'csv' (default config.EXPORT_FORMAT)
+        prefix: Filename prefix (default config.EXCEL_FILENAME_PREFIX)
+    """
+
+    def __init__(self, log, detect_pedestrians=False, fmt=None, prefix=None):
+        self.log = log
+        self.detect_pedestrians = detect_pedestrians
+        self.fmt = (fmt or config.EXPORT_FORMAT).lower()
+        if self.fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{self.fmt}'. Options: {', '.join(EXPORT_FORMATS)}")
+        self.prefix = prefix or config.EXCEL_FILENAME_PREFIX
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-export")
+        self.lock = threading.Lock()
+        self.exported = 0  # Absolute index of the first record not yet exported incrementally
+        self.incremental_file = None
+
+        # Metrics
+        self.exports = 0
+        self.rows_written = 0
+
+    @property
+    def header(self):
+        columns = ["Timestamp", "Vehicle Type", "Priority", "License Plate"]
+        if self.detect_pedestrians:
+            columns.append("Pedestrians Nearby")
+        return columns
+
+    def export(self, filename=None, incremental=False):
+        """
+        Queue an export
+
+        Args:
+            filename: Output file (default <prefix>_<time>.<fmt>)
+            incremental: Only rows added since the last incremental export
+
+        Returns:
+            Future resolving to the written filename
+        """
+        if self.fmt == 'xlsx' and openpyxl is None:
+            raise RuntimeError("openpyxl not installed. Install with: pip install openpyxl")
+        return self.executor.submit(self._export, filename, incremental)
+
+    def _rows(self, start, progress):
+        """Decoded rows from absolute index start, chunk by chunk; progress['end'] tracks how far it got"""
+        for index, records in self.log.iter_records(start):
+            for row in self.log.decode(records):
+                yield row if self.detect_pedestrians else row[:4]
+            progress['end'] = index + len(records)
+
+    def _filename(self, suffix=""):
+        now = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return f"{self.prefix}_{now}{suffix}.{self.fmt}"
+
+    def _export(self, filename, incremental):
+        with self.lock:
+            start = self.exported if incremental else 0
+            total = len(self.log)
+            if incremental and self.fmt == 'csv':
+                # One running CSV that each incremental export appends to
+                if self.incremental_file is None:
+                    self.incremental_file = filename or self._filename("_incremental")
+                filename = self.incremental_file
+            elif filename is None:
+                filename = self._filename(f"_rows{start + 1}-{total}" if incremental else "")
+
+            progress = {'end': start}
+            rows = self._rows(start, progress)
+            if self.fmt == 'csv':
+                written = self._write_csv(filename, rows, append=incremental)
+            else:
+                written = self._write_xlsx(filename, rows)
+
+            if incremental:
+                self.exported = progress['end']
+            self.exports += 1
+            self.rows_written += written
+            return filename
+
+    def _write_csv(self, filename, rows, append=False):
+        new_file = not (append and os.path.exists(filename))
+        written = 0
+        with open(filename, 'a' if append else 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            if new_file and config.EXCEL_INCLUDE_HEADER:
+                writer.writerow(self.header)
+            for row in rows:
+                writer.writerow(row)
+                written += 1
+        return written
+
+    def _write_xlsx(self, filename, rows):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(config.EXCEL_SHEET_NAME)
+        if config.EXCEL_INCLUDE_HEADER:
+            ws.append(self.header)
+        written = 0
+        for row in rows:
+            ws.append(row)
+            written += 1
+        wb.save(filename)
+        return written
+
+    def stats(self):
+        return {
+            'format': self.fmt,
+            'exports': self.exports,
+            'rows_written': self.rows_written,
+            'exported_up_to': self.exported,
+        }
+
+    def close(self):
+        """Wait for queued exports to finish"""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,384 @@
+"""
+Shared inference service for the ESP32-CAM detection system
+
+One YOLO model serves any number of camera streams. Detectors submit frames,
+the engine groups them into micro-batches (up to max_batch frames, waiting at
+most max_wait_ms for the batch to fill), runs one forward pass and hands each
+result back to the stream that asked for it.
+
+Post-processing works on whole arrays: the backend's box array is turned into
+DETECTION_DTYPE records (priority codes, distance, filtering, sorting) without
+a per-box Python loop.
+"""
+import os
+import queue
+import re
+import runpy
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+import numpy as np
+
+import config
+from backends import load_backend
+from metrics import Metrics
+
+
+# Priority codes used in detection records (higher = more important)
+PRIORITY_NONE, PRIORITY_LOW, PRIORITY_MEDIUM, PRIORITY_HIGH = 0, 1, 2, 3
+PRIORITY_LEVELS = ('NONE', 'LOW', 'MEDIUM', 'HIGH')  # code -> name
+PRIORITY_CODES = {name: code for code, name in enumerate(PRIORITY_LEVELS)}
+
+# One row per detection, consumed by tracking, OCR, drawing and logging
+DETECTION_DTYPE = np.dtype([
+    ('box', np.int32, (4,)),   # x1, y1, x2, y2 in original frame pixels
+    ('conf', np.float32),
+    ('cls', np.int16),
+    ('priority', np.int8),     # PRIORITY_* code, 0 = not a vehicle
+    ('distance', np.int32),    # Pixels from box bottom to frame bottom (lower = nearer)
+    ('track_id', np.int64),    # Filled in by the tracker (0 = untracked)
+])
+
+
+class PriorityKeywords:
+    """
+    config.VEHICLE_PRIORITY and config.CUSTOM_VEHICLE_KEYWORDS, re-read when config.py is edited
+
+    One daemon thread per process checks config.py's mtime every
+    check_interval seconds. On a change only these two dicts are re-read
+    (config.py runs in a scratch namespace; the live config module is left
+    alone) and published with a new version number in one assignment, so
+    readers never see half an update.
+    """
+
+    SETTINGS = ('VEHICLE_PRIORITY', 'CUSTOM_VEHICLE_KEYWORDS')
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self.current = (0, self._settings(vars(config)))  # (version, {setting: dict})
+        self.mtime = self._config_mtime()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        """(version, {setting: dict}); the version changes whenever the dicts do"""
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._watch, name="priority-keywords", daemon=True)
+                    self.thread.start()
+        return self.current
+
+    @classmethod
+    def _settings(cls, namespace):
+        return {name: dict(namespace.get(name) or {}) for name in cls.SETTINGS}
+
+    @staticmethod
+    def _config_mtime():
+        try:
+            return os.path.getmtime(config.__file__)
+        except OSError:
+            return None
+
+    def _watch(self):
+        while True:
+            time.sleep(self.check_interval)
+            mtime = self._config_mtime()
+            if mtime == self.mtime:
+                continue
+            self.mtime = mtime
+            try:
+                settings = self._settings(runpy.run_path(config.__file__))
+            except Exception as e:
+                print(f"⚠️ Could not re-read config.py: {e}")
+                continue
+            if settings == self.current[1]:
+                continue
+            print("config.py changed, rebuilding vehicle priority tables")
+            self.current = (self.current[0] + 1, settings)
+
+
+priority_keywords = PriorityKeywords()  # Shared by every PriorityIndex in the process
+
+
+class PriorityIndex:
+    """
+    Class id -> priority code table, so classifying a box is one array gather
+
+    Built from the model's class names and three keyword sources, later ones
+    overriding earlier ones: the built-in VEHICLE_PRIORITY passed in,
+    config.VEHICLE_PRIORITY and config.CUSTOM_VEHICLE_KEYWORDS. Keywords match
+    whole words ('car' matches "police car" but not "carrot"), and a label
+    matching several keywords takes the highest priority.
+
+    The table is rebuilt automatically when the model's classes change or
+    the keyword dicts in config.py are edited (see PriorityKeywords).
+    """
+
+    def __init__(self, base_keywords=None, source=None):
+        self.base_keywords = dict(base_keywords or {})
+        self.source = source or priority_keywords
+        self.version, self.settings = self.source.get()
+        self.names = None
+        self.table = None
+        self.patterns = None
+        self.rebuilds = 0
+
+    def keywords(self):
+        merged = dict(self.base_keywords)
+        for name in PriorityKeywords.SETTINGS:
+            merged.update(self.settings.get(name, {}))
+        return {k.lower(): v for k, v in merged.items() if v in PRIORITY_CODES}
+
+    def _compile(self):
+        self.patterns = [
+            (re.compile(r'\b' + re.escape(keyword) + r'\b'), PRIORITY_CODES[priority])
+            for keyword, priority in self.keywords().items()
+        ]
+
+    def classify(self, label):
+        """
+        Priority name for one label
+
+        Returns:
+            'HIGH', 'MEDIUM', 'LOW', or None if the label isn't a vehicle
+        """
+        if self.patterns is None:
+            self._compile()
+        label_lower = str(label).lower()
+        code = max((c for pattern, c in self.patterns if pattern.search(label_lower)), default=PRIORITY_NONE)
+        return PRIORITY_LEVELS[code] if code != PRIORITY_NONE else None
+
+    def lookup(self, names):
+        """
+        Priority table for a model's class names (dict id -> label)
+
+        Returns:
+            int8 array indexed by class id
+        """
+        version, settings = self.source.get()
+        if version != self.version:
+            self.version, self.settings = version, settings
+            self.patterns = None
+            self.table = None
+        if self.table is None or (names is not self.names and names != self.names):
+            self._build(names)
+        return self.table
+
+    def _build(self, names):
+        self._compile()
+        table = np.zeros(max(names) + 1 if names else 0, dtype=np.int8)
+        for cls, name in names.items():
+            priority = self.classify(name)
+            if priority:
+                table[cls] = PRIORITY_CODES[priority]
+        self.names = names
+        self.table = table
+        self.rebuilds += 1
+
+
+def postprocess_detections(raw, frame_height, priority_table,
+                           person_cls=None, general_mode=False, detect_pedestrians=False):
+    """
+    Turn raw (N, 6) boxes into detection records with array operations only
+
+    Args:
+        raw: (N, 6) x1, y1, x2, y2, conf, cls array from an inference backend,
+             already in original frame pixels
+        frame_height: Original frame height, for the distance column
+        priority_table: int array, class id -> PRIORITY_* code
+        person_cls: Class id of 'person' (pedestrian filter)
+        general_mode: Keep every class, sorted by confidence
+        detect_pedestrians: Also return person detections
+
+    Returns:
+        dict with 'vehicles' (sorted nearest first), 'pedestrians' and 'general'
+        structured arrays of DETECTION_DTYPE
+    """
+    det = np.zeros(len(raw), dtype=DETECTION_DTYPE)
+    det['box'] = raw[:, :4]
+    det['conf'] = raw[:, 4]
+    cls = raw[:, 5].astype(np.int32)
+    det['cls'] = cls
+    det['distance'] = frame_height - det['box'][:, 3]
+    empty = det[:0]
+
+    if general_mode:
+        order = np.argsort(-det['conf'], kind='stable')
+        return {'vehicles': empty, 'pedestrians': empty, 'general': det[order]}
+
+    known = (cls >= 0) & (cls < len(priority_table))
+    det['priority'][known] = priority_table[cls[known]]
+
+    vehicles = det[det['priority'] > PRIORITY_NONE]
+    vehicles = vehicles[np.argsort(vehicles['distance'], kind='stable')]
+
+    if detect_pedestrians and person_cls is not None:
+        pedestrians = det[cls == person_cls]
+    else:
+        pedestrians = empty
+
+    return {'vehicles': vehicles, 'pedestrians': pedestrians, 'general': empty}
+
+
+class StreamStats:
+    """Latency bookkeeping for one stream"""
+
+    def __init__(self):
+        self.frames = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, latency):
+        self.frames += 1
+        self.total_latency += latency
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        avg = self.total_latency / self.frames if self.frames else 0.0
+        return {
+            'frames': self.frames,
+            'avg_latency_ms': round(avg * 1000, 2),
+            'last_latency_ms': round(self.last_latency * 1000, 2),
+            'max_latency_ms': round(self.max_latency * 1000, 2),
+        }
+
+
+class BatchInferenceEngine:
+    """
+    Micro-batching YOLO service shared by several ESP32CamDetector instances
+
+    Args:
+        model_path: YOLO weights to load (default: config.YOLO_MODEL)
+        max_batch: Largest number of frames run in one forward pass
+        max_wait_ms: How long the first frame of a batch may wait for company
+        backend: Inference backend name (torch, onnx, openvino)
+        backend_options: Extra load_backend() arguments (int8, intra_threads, inter_threads)
+    """
+
+    def __init__(self, model_path=None, max_batch=None, max_wait_ms=None, backend=None, backend_options=None):
+        self.model_path = model_path or config.YOLO_MODEL
+        self.backend = backend
+        self.backend_options = backend_options or {}
+        self.max_batch = max(1, int(max_batch or config.INFERENCE_MAX_BATCH))
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else config.INFERENCE_MAX_WAIT_MS) / 1000.0
+        self.model = None
+        self.requests = queue.Queue()
+        self.thread = None
+        self.running = False
+        self.lock = threading.Lock()
+
+        # Stats
+        self.batches = 0
+        self.batched_frames = 0
+        self.batch_sizes = defaultdict(int)  # batch size -> number of batches
+        self.stream_stats = defaultdict(StreamStats)
+        self.metrics = Metrics(stream='shared-model')  # Batched preprocess/forward/decode timings
+
+    @property
+    def names(self):
+        return self.model.names if self.model is not None else None
+
+    def load(self):
+        """Load the model once and start the batching thread"""
+        with self.lock:
+            if self.model is None:
+                self.model = load_backend(self.backend, self.model_path, **self.backend_options)
+                self.model.metrics = self.metrics
+            if not self.running:
+                self.running = True
+                self.thread = threading.Thread(target=self._worker, name="batch-inference", daemon=True)
+                self.thread.start()
+        return self
+
+    def submit(self, stream_id, frame):
+        """
+        Queue a frame for the next batch
+
+        Returns:
+            Future resolving to the (N, 6) detection array for this frame
+        """
+        if not self.running:
+            self.load()
+        future = Future()
+        self.requests.put((stream_id, frame, time.perf_counter(), future))
+        return future
+
+    def infer(self, stream_id, frame, timeout=None):
+        """Blocking helper: returns the detection array just like calling the backend directly"""
+        return self.submit(stream_id, frame).result(timeout=timeout)
+
+    def _collect_batch(self):
+        """Wait for one request, then gather more until the batch is full or the deadline passes"""
+        try:
+            first = self.requests.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while self.running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            frames = [item[1] for item in batch]
+            self.metrics.count('batches')
+            try:
+                results = self.model.detect_batch(frames)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            with self.lock:
+                self.batches += 1
+                self.batched_frames += len(batch)
+                self.batch_sizes[len(batch)] += 1
+                for stream_id, _, submitted, _ in batch:
+                    self.stream_stats[stream_id].add(done - submitted)
+
+            for (_, _, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        """Per-stream latency and batch occupancy"""
+        with self.lock:
+            avg_batch = self.batched_frames / self.batches if self.batches else 0.0
+            return {
+                'batches': self.batches,
+                'frames': self.batched_frames,
+                'avg_batch_size': round(avg_batch, 2),
+                'batch_occupancy': round(avg_batch / self.max_batch, 3),
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+                'queue_depth': self.requests.qsize(),
+                'streams': {sid: s.as_dict() for sid, s in self.stream_stats.items()},
+            }
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        # Fail anything still waiting so callers don't hang
+        while True:
+            try:
+                _, _, _, future = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(RuntimeError("Inference engine closed"))
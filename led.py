@@ -0,0 +1,164 @@
+"""
+Background LED control for the ESP32-CAM detection system
+
+The detection loop only records the priority it wants the LEDs to show;
+LedDispatcher sends it to the ESP32 (/led?color=...) from its own thread:
+
+  - One persistent requests.Session, so every command reuses a keep-alive
+    connection instead of opening a new one
+  - Coalescing: only the latest desired colour is sent; changes that are
+    superseded before they go out are never sent at all
+  - Hysteresis: a higher priority is shown at once, but dropping to a lower
+    one (or off) waits until it has held for config.LED_RELEASE_DELAY, so a
+    vehicle missed for a frame or two doesn't make the LEDs flap
+  - Failed commands are retried with exponential backoff (capped at
+    config.LED_RETRY_MAX_BACKOFF), always with the newest desired colour
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+
+LED_LEVELS = {'NONE': 0, 'LOW': 1, 'MEDIUM': 2, 'HIGH': 3}
+
+
+class LedDispatcher:
+    """
+    Sends LED colour changes to one ESP32 without blocking the caller
+
+    Args:
+        base_url: ESP32 address, e.g. "http://192.168.1.50"
+        colors: Priority -> colour name (default config.LED_COLORS)
+        timeout: HTTP timeout per attempt (default config.LED_REQUEST_TIMEOUT)
+        release_delay: Seconds a lower priority must hold before it is shown (default config.LED_RELEASE_DELAY)
+        retry_backoff: First retry delay, doubled per failure up to config.LED_RETRY_MAX_BACKOFF
+        metrics: Metrics to record 'led' send latency and failures into
+    """
+
+    def __init__(self, base_url, colors=None, timeout=None, release_delay=None, retry_backoff=None, metrics=None):
+        self.url = base_url.rstrip('/') + "/led"
+        self.colors = colors or config.LED_COLORS
+        self.timeout = timeout or config.LED_REQUEST_TIMEOUT
+        self.release_delay = config.LED_RELEASE_DELAY if release_delay is None else release_delay
+        self.retry_backoff = retry_backoff or config.LED_RETRY_BACKOFF
+        self.metrics = metrics
+
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=0))
+
+        self.condition = threading.Condition()
+        self.desired = 'NONE'
+        self.desired_since = time.monotonic()
+        self.shown = None  # Last colour the ESP32 acknowledged (None = unknown)
+        self.closed = False
+
+        # Metrics
+        self.requests = 0
+        self.sent = 0
+        self.failures = 0
+        self.retries = 0
+        self.coalesced = 0  # Desired changes replaced before they were sent
+        self.suppressed = 0  # Drops that reverted within release_delay (flaps avoided)
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_error = None
+
+        self.thread = threading.Thread(target=self._run, name="led-dispatcher", daemon=True)
+        self.thread.start()
+
+    def set(self, priority):
+        """Record the priority the LEDs should show (returns immediately)"""
+        with self.condition:
+            self.requests += 1
+            if priority == self.desired:
+                return
+            if self.desired != self.shown:
+                if priority == self.shown and LED_LEVELS.get(self.desired, 0) < LED_LEVELS.get(priority, 0):
+                    self.suppressed += 1  # A pending drop was cancelled
+                else:
+                    self.coalesced += 1
+            self.desired = priority
+            self.desired_since = time.monotonic()
+            self.condition.notify()
+
+    def _due(self):
+        """Seconds until the desired colour may be sent (0 = now, None = nothing to send)"""
+        if self.desired == self.shown:
+            return None
+        if self.shown is None or LED_LEVELS.get(self.desired, 0) > LED_LEVELS.get(self.shown, 0):
+            return 0.0  # Unknown state or escalation: show it right away
+        return max(0.0, self.desired_since + self.release_delay - time.monotonic())
+
+    def _run(self):
+        failures = 0  # Consecutive failed sends
+        retry_at = 0.0
+        while True:
+            with self.condition:
+                while not self.closed:
+                    due = self._due()
+                    if due is not None and failures:
+                        due = max(due, retry_at - time.monotonic())
+                    if due is not None and due <= 0:
+                        break
+                    self.condition.wait(due)
+                if self.closed:
+                    return
+                priority = self.desired  # Always the newest colour, even on a retry
+
+            if self._send(priority):
+                with self.condition:
+                    self.shown = priority
+                failures = 0
+                continue
+            # Unreachable ESP32: keep trying, backing off up to LED_RETRY_MAX_BACKOFF
+            self.retries += bool(failures)
+            failures += 1
+            retry_at = time.monotonic() + min(self.retry_backoff * 2 ** (failures - 1),
+                                              config.LED_RETRY_MAX_BACKOFF)
+
+    def _send(self, priority):
+        color = self.colors.get(priority, 'off')
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self.url, params={'color': color}, timeout=self.timeout)
+            response.raise_for_status()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            if self.metrics is not None:
+                self.metrics.count('led_failures')
+            return False
+        latency = time.perf_counter() - start
+        if self.metrics is not None:
+            self.metrics.observe('led', latency)
+            self.metrics.count('led_commands')
+        self.sent += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        return True
+
+    def stats(self):
+        with self.condition:
+            return {
+                'shown': self.shown,
+                'desired': self.desired,
+                'requests': self.requests,
+                'sent': self.sent,
+                'failures': self.failures,
+                'retries': self.retries,
+                'coalesced': self.coalesced,
+                'suppressed': self.suppressed,
+                'avg_latency_ms': round(self.total_latency / self.sent * 1000, 1) if self.sent else 0.0,
+                'max_latency_ms': round(self.max_latency * 1000, 1),
+                'last_error': self.last_error,
+            }
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join(timeout=self.timeout + 1)
+        self.session.close()
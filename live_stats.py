@@ -0,0 +1,537 @@
+"""
+Live detection statistics shared with the Flask API
+
+The detector keeps running totals as detections are logged: by priority,
+with/without plate, per class, per camera and per time bucket, plus a bounded
+ring of recent detections. Every update is O(1). A background thread
+publishes a JSON snapshot into a named shared-memory block whenever something
+changed, at most every config.STATS_PUBLISH_INTERVAL seconds, so api.py
+answers /api/stats and /api/detections by copying a few kilobytes out of
+shared memory - no file scans and no calls into the detection process.
+
+SnapshotFeed is the API side of the push channel: one thread watches the
+snapshot's sequence number and fans new detections and stats out to every
+connected client, each with its own throttle.
+
+One process owns (writes) the block: an exclusive lock on <name>.lock in the
+temp directory, released by the OS if the owner dies, keeps a second detector
+from becoming a second seqlock writer on the same block. Run further detector
+processes with their own config.STATS_SHM_NAME.
+
+Shared-memory layout (a seqlock, so readers never see a half-written snapshot):
+    [0:8]   sequence number, odd while a write is in progress
+    [8:12]  payload length
+    [12:]   UTF-8 JSON payload
+"""
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+
+import config
+from detection_log import PRIORITY_NAMES, format_timestamp
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except Exception:
+    shared_memory = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+HEADER = struct.Struct('<QI')
+
+
+class LiveStats:
+    """
+    Incrementally updated detection counters and recent-detections ring
+
+    Args:
+        publish: Publish snapshots to shared memory for api.py
+        recent_size: Detections kept in the recent ring
+        bucket_seconds: Width of a timeline bucket
+        buckets: Timeline buckets kept
+    """
+
+    def __init__(self, publish=True, recent_size=None, bucket_seconds=None, buckets=None):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.total = 0
+        self.by_priority = {name: 0 for name in PRIORITY_NAMES}
+        self.with_plate = 0
+        self.without_plate = 0
+        self.by_class = {}
+        self.by_camera = {}
+        self.cameras = {}  # Stream id -> connection state
+        self.bucket_seconds = bucket_seconds or config.STATS_BUCKET_SECONDS
+        self.timeline = deque(maxlen=buckets or config.STATS_BUCKETS)  # [bucket_start, count, high, medium, low]
+        self.recent = deque(maxlen=recent_size or config.STATS_RECENT_SIZE)
+        self.next_id = 1
+
+        self.publisher = None
+        self.changed = threading.Event()
+        self.closed = False
+        if publish:
+            try:
+                self.publisher = StatsPublisher()
+            except Exception as e:
+                print(f"⚠️ Live stats not shared with the API: {e}")
+            else:
+                # Publishes as soon as something changes, at most every STATS_PUBLISH_INTERVAL
+                self.publish_thread = threading.Thread(target=self._publish_loop, name="live-stats", daemon=True)
+                self.publish_thread.start()
+
+    def add(self, entries, camera=None, class_names=None):
+        """
+        Count new detection-log entries
+
+        Args:
+            entries: (ts, cls, priority_code, plate, track_id, pedestrians) tuples
+            camera: Stream id the entries came from
+            class_names: Class id -> label
+        """
+        class_names = class_names or {}
+        with self.lock:
+            for ts, cls, priority, plate, track_id, pedestrians in entries:
+                label = class_names.get(int(cls), str(cls))
+                priority_name = PRIORITY_NAMES[int(priority)]
+                has_plate = bool(plate) and plate != "N/A"
+
+                self.total += 1
+                self.by_priority[priority_name] += 1
+                if has_plate:
+                    self.with_plate += 1
+                else:
+                    self.without_plate += 1
+                self.by_class[label] = self.by_class.get(label, 0) + 1
+                if camera is not None:
+                    self.by_camera[camera] = self.by_camera.get(camera, 0) + 1
+
+                bucket_start = int(ts // self.bucket_seconds * self.bucket_seconds)
+                if not self.timeline or self.timeline[-1][0] < bucket_start:
+                    self.timeline.append([bucket_start, 0, 0, 0, 0])
+                # Vehicles are logged when first seen, so late entries only go back a bucket or two
+                bucket = next((b for b in reversed(self.timeline) if b[0] <= bucket_start), None)
+                if bucket is not None and bucket[0] == bucket_start:
+                    bucket[1] += 1
+                    if priority_name in ('HIGH', 'MEDIUM', 'LOW'):
+                        bucket[('HIGH', 'MEDIUM', 'LOW').index(priority_name) + 2] += 1
+
+                detection = {
+                    'id': self.next_id,
+                    'timestamp': format_timestamp(ts),
+                    'vehicle': label,
+                    'priority': priority_name,
+                    'plate': plate if has_plate else "N/A",
+                    'trackId': int(track_id),
+                    'pedestrians': int(pedestrians),
+                    'camera': camera,
+                }
+                self.next_id += 1
+                self.recent.append(detection)
+        self.changed.set()
+
+    def set_camera(self, camera, status):
+        """
+        Record a stream's connection state
+
+        Args:
+            camera: Stream id
+            status: StreamConnection.status()
+        """
+        with self.lock:
+            self.cameras[camera] = {
+                'state': status['state'],
+                'downSince': status['down_since'],
+                'drops': status['drops'],
+                'stalls': status['stalls'],
+                'recoveries': status['recoveries'],
+                'lastRecoverySeconds': status['last_recovery_s'],
+            }
+        self.changed.set()
+
+    def stats(self):
+        """Totals in the shape the dashboard expects"""
+        with self.lock:
+            return {
+                'totalDetections': self.total,
+                'highPriority': self.by_priority['HIGH'],
+                'mediumPriority': self.by_priority['MEDIUM'],
+                'lowPriority': self.by_priority['LOW'],
+                'otherObjects': self.by_priority['N/A'],
+                'withPlates': self.with_plate,
+                'withoutPlates': self.without_plate,
+                'byClass': dict(self.by_class),
+                'byCamera': dict(self.by_camera),
+                'cameras': {camera: dict(state) for camera, state in self.cameras.items()},
+                'timeline': [
+                    {'start': b[0], 'count': b[1], 'high': b[2], 'medium': b[3], 'low': b[4]}
+                    for b in self.timeline
+                ],
+                'startedAt': self.started,
+            }
+
+    def recent_detections(self, count=None):
+        """Newest first"""
+        with self.lock:
+            recent = list(self.recent)
+        recent.reverse()
+        return recent[:count] if count else recent
+
+    def snapshot(self):
+        return {'stats': self.stats(), 'detections': self.recent_detections(), 'updatedAt': time.time()}
+
+    def publish(self):
+        try:
+            self.publisher.publish(self.snapshot())
+        except Exception as e:
+            print(f"⚠️ Live stats publish failed: {e}")
+
+    def _publish_loop(self):
+        self.publish()  # Readers see an empty snapshot (not "no detector") right away
+        while not self.closed:
+            self.changed.wait()
+            self.changed.clear()
+            if self.closed:
+                break
+            self.publish()
+            time.sleep(config.STATS_PUBLISH_INTERVAL)
+
+    def close(self):
+        if self.publisher is not None:
+            self.closed = True
+            self.changed.set()
+            self.publish_thread.join(timeout=2)
+            self.publish()
+            self.publisher.close()
+            self.publisher = None
+
+
+class OwnerLock:
+    """
+    Exclusive, non-blocking lock on a file holding the owner's pid
+
+    The OS drops the lock when the owning process exits, however it exits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self.file.seek(0)
+            owner = self.file.read().strip() or "unknown"
+            self.file.close()
+            raise RuntimeError(f"{path} held by pid {owner}")
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+
+    def release(self):
+        if self.file.closed:
+            return
+        try:
+            os.remove(self.path)  # Before unlocking, so no new owner's file is removed
+        except OSError:
+            pass
+        self.file.close()  # Releases the lock
+
+
+class StatsPublisher:
+    """Writes JSON snapshots into the named shared-memory block (one publishing process per name)"""
+
+    def __init__(self, name=None, size=None):
+        if shared_memory is None:
+            raise RuntimeError("multiprocessing.shared_memory not available (Python 3.8+)")
+        self.name = name or config.STATS_SHM_NAME
+        self.size = size or config.STATS_SHM_SIZE
+        try:
+            self.owner = OwnerLock(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"))
+        except RuntimeError as e:
+            raise RuntimeError(f"'{self.name}' is already published by another detector ({e}); "
+                               f"give this one its own STATS_SHM_NAME") from None
+        self.seq = 0
+        try:
+            try:
+                self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.size)
+            except FileExistsError:
+                # Left behind by a detector that didn't shut down cleanly (we hold the lock, so it's gone).
+                # Keep counting from its sequence number so attached readers see the change
+                stale = shared_memory.SharedMemory(name=self.name)
+                self.seq = (HEADER.unpack_from(stale.buf, 0)[0] & ~1) + 2
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.size)
+        except Exception:
+            self.owner.release()
+            raise
+        HEADER.pack_into(self.shm.buf, 0, self.seq, 0)
+
+    def publish(self, snapshot):
+        payload = json.dumps(snapshot, separators=(',', ':')).encode('utf-8')
+        if len(payload) > self.shm.size - HEADER.size:
+            # Too big: drop the oldest recent detections until it fits
+            snapshot = dict(snapshot)
+            while len(payload) > self.shm.size - HEADER.size and snapshot['detections']:
+                snapshot['detections'] = snapshot['detections'][:len(snapshot['detections']) // 2]
+                payload = json.dumps(snapshot, separators=(',', ':')).encode('utf-8')
+        buf = self.shm.buf
+        HEADER.pack_into(buf, 0, self.seq + 1, 0)  # odd: write in progress
+        buf[HEADER.size:HEADER.size + len(payload)] = payload
+        self.seq += 2
+        HEADER.pack_into(buf, 0, self.seq, len(payload))
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception:
+            pass
+        self.owner.release()
+
+
+class SnapshotReader:
+    """
+    Reads snapshots out of the shared-memory block (API side)
+
+    Stays attached between reads; re-attaches when the sequence number hasn't
+    moved for a while, which picks up a restarted detector's new block.
+    """
+
+    def __init__(self, name=None, reattach_after=1.0):
+        self.name = name or config.STATS_SHM_NAME
+        self.reattach_after = reattach_after
+        self.shm = None
+        self.last_seq = None
+        self.last_change = 0.0
+
+    def _attach(self):
+        if shared_memory is None:
+            return False
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        try:
+            # Readers must not unlink the detector's block when they exit
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return True
+
+    def detach(self):
+        if self.shm is not None:
+            try:
+                self.shm.close()
+            except Exception:
+                pass
+            self.shm = None
+
+    def sequence(self):
+        """Current sequence number (cheap: reads 8 bytes), or None if no detector is publishing"""
+        now = time.monotonic()
+        if self.shm is not None and now - self.last_change > self.reattach_after:
+            self.detach()
+        if self.shm is None:
+            if not self._attach():
+                return None
+            self.last_change = now
+        seq = HEADER.unpack_from(self.shm.buf, 0)[0]
+        if seq != self.last_seq:
+            self.last_seq = seq
+            self.last_change = now
+        return seq
+
+    def read(self, retries=5):
+        """
+        Returns:
+            (sequence, snapshot dict), or (None, None) if no detector is publishing
+        """
+        if self.sequence() is None:
+            return None, None
+        for _ in range(retries):
+            seq, length = HEADER.unpack_from(self.shm.buf, 0)
+            if seq % 2 or length == 0:
+                time.sleep(0.001)
+                continue
+            payload = bytes(self.shm.buf[HEADER.size:HEADER.size + length])
+            if HEADER.unpack_from(self.shm.buf, 0)[0] == seq:
+                return seq, json.loads(payload)
+        return None, None
+
+
+def read_snapshot(name=None):
+    """
+    Latest published snapshot, for api.py
+
+    Returns:
+        dict with 'stats', 'detections' and 'updatedAt', or None if no detector is publishing
+    """
+    reader = SnapshotReader(name)
+    try:
+        return reader.read()[1]
+    finally:
+        reader.detach()
+
+
+class Subscription:
+    """
+    One push client: pending updates coalesced until the client's throttle allows a send
+
+    Detections accumulate (bounded); only the newest stats are kept.
+    """
+
+    def __init__(self, min_interval, max_pending):
+        self.min_interval = min_interval
+        self.detections = deque(maxlen=max_pending)
+        self.stats = None
+        self.condition = threading.Condition()
+        self.last_send = 0.0
+        self.closed = False
+        self.dropped = 0
+
+    def push(self, detections=(), stats=None):
+        with self.condition:
+            overflow = len(self.detections) + len(detections) - self.detections.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+            self.detections.extend(detections)
+            if stats is not None:
+                self.stats = stats
+            self.condition.notify()
+
+    def get(self, timeout):
+        """
+        Wait for pending updates, no sooner than min_interval after the last send
+
+        Returns:
+            (detections oldest first, stats or None); both empty on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while not (self.detections or self.stats) and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], None
+                self.condition.wait(remaining)
+        # Throttle: let more updates pile up (and coalesce) instead of sending each one
+        wait = self.last_send + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        with self.condition:
+            detections, stats = list(self.detections), self.stats
+            self.detections.clear()
+            self.stats = None
+        self.last_send = time.monotonic()
+        return detections, stats
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class SnapshotFeed:
+    """
+    Shared fan-out of live updates to push clients (SSE)
+
+    One thread polls the snapshot's sequence number every poll_interval and,
+    when it moves, reads the snapshot once and hands each subscriber the new
+    detections and the latest stats - so the cost of a change is one read no
+    matter how many dashboards are connected. The thread only runs while
+    someone is subscribed.
+
+    Args:
+        poll_interval: Seconds between sequence checks (default config.STREAM_POLL_INTERVAL)
+        client_interval: Minimum seconds between messages to one client (default config.STREAM_CLIENT_INTERVAL)
+    """
+
+    def __init__(self, name=None, poll_interval=None, client_interval=None):
+        self.reader = SnapshotReader(name)
+        self.poll_interval = poll_interval or config.STREAM_POLL_INTERVAL
+        self.client_interval = client_interval if client_interval is not None else config.STREAM_CLIENT_INTERVAL
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.thread = None
+        self.last_snapshot = None
+        self.seq = None
+        self.last_id = 0
+        self.started_at = None
+
+    def subscribe(self):
+        """
+        Returns:
+            (Subscription, latest snapshot or None) - send the snapshot first, then the subscription's updates
+        """
+        subscription = Subscription(self.client_interval, config.STATS_RECENT_SIZE)
+        with self.lock:
+            self.subscribers.add(subscription)
+            if self.thread is None:
+                # Deltas are relative to the snapshot new clients start from
+                self.seq, snapshot = self.reader.read()
+                if snapshot is not None:
+                    self._advance(snapshot)
+                self.last_snapshot = snapshot
+                self.thread = threading.Thread(target=self._run, name="live-feed", daemon=True)
+                self.thread.start()
+            return subscription, self.last_snapshot
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    self.reader.detach()
+                    return
+            current = self.reader.sequence()
+            if current is not None and current != self.seq and current % 2 == 0:
+                seq, snapshot = self.reader.read()
+                if snapshot is not None:
+                    self.seq = seq
+                    self._dispatch(snapshot)
+            time.sleep(self.poll_interval)
+
+    def _advance(self, snapshot):
+        """Detections in the snapshot newer than the last one seen, oldest first"""
+        started_at = snapshot['stats'].get('startedAt')
+        if started_at != self.started_at:
+            # New detector run: ids start again from 1
+            self.started_at = started_at
+            self.last_id = 0
+        new = [d for d in reversed(snapshot['detections']) if d['id'] > self.last_id]
+        if new:
+            self.last_id = new[-1]['id']
+        return new
+
+    def _dispatch(self, snapshot):
+        new = self._advance(snapshot)
+        with self.lock:
+            self.last_snapshot = snapshot
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            subscription.push(new, snapshot['stats'])
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': len(self.subscribers),
+                'dropped': sum(s.dropped for s in self.subscribers),
+                'last_id': self.last_id,
+            }
@@ -0,0 +1,282 @@
+"""
+Hot-path instrumentation for the ESP32-CAM detection system
+
+Every detector owns a Metrics object labelled with its stream id. Stages time
+themselves with the monotonic perf_counter clock and record into log-bucketed
+(HDR-style) histograms: recording is one log() and a list increment, memory
+is fixed, and any percentile is accurate to about 5%. Counters keep a short
+window of event times so rates (FPS) come for free.
+
+    with self.metrics.timer('inference'):
+        raw = self.detect_frame(frame)
+    self.metrics.count('frames_inferred')
+
+All live Metrics objects are rendered together in Prometheus text format by
+prometheus_text(), which MetricsServer serves at /metrics.
+"""
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+PREFIX = "esp32cam"
+QUANTILES = (0.5, 0.9, 0.99)
+
+_registry = weakref.WeakSet()  # Every Metrics object still in use
+_registry_lock = threading.Lock()
+
+
+class Histogram:
+    """
+    Log-bucketed latency histogram (seconds)
+
+    Buckets grow by 2^(1/8) from 1 µs to ~100 s, so a value's bucket is found
+    with one log() and percentiles are within half a bucket (~4.5%).
+    """
+
+    MIN = 1e-6
+    STEPS_PER_DOUBLING = 8
+    BUCKETS = 8 * 27  # 2^27 µs ≈ 134 s
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        if seconds <= self.MIN:
+            index = 0
+        else:
+            index = min(self.BUCKETS, int(math.log2(seconds / self.MIN) * self.STEPS_PER_DOUBLING) + 1)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, q):
+        """Value below which a fraction q of the recordings fall (bucket midpoint)"""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            target = q * self.count
+            seen = 0
+            for index, n in enumerate(self.counts):
+                seen += n
+                if seen >= target and n:
+                    if index == 0:
+                        return self.MIN
+                    low = self.MIN * 2 ** ((index - 1) / self.STEPS_PER_DOUBLING)
+                    high = self.MIN * 2 ** (index / self.STEPS_PER_DOUBLING)
+                    return min((low + high) / 2, self.max)
+            return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.5) * 1000, 3),
+            'p90_ms': round(self.percentile(0.9) * 1000, 3),
+            'p99_ms': round(self.percentile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Counter:
+    """Monotonic event count plus the times of the last few events, for rates"""
+
+    def __init__(self, window=64):
+        self.value = 0
+        self.times = deque(maxlen=window)
+        self.lock = threading.Lock()  # Several detector threads count into one Metrics
+
+    def add(self, n=1):
+        now = time.perf_counter()
+        with self.lock:
+            self.value += n
+            self.times.append(now)
+
+    def rate(self, max_age=2.0):
+        """Events per second over the recent window (0 if nothing happened in max_age seconds)"""
+        with self.lock:
+            times = list(self.times)
+        if len(times) < 2 or time.perf_counter() - times[-1] > max_age:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0]) if times[-1] > times[0] else 0.0
+
+
+class Metrics:
+    """
+    Stage timers, counters and gauges for one component
+
+    Args:
+        register: Include in prometheus_text() (False for short-lived detectors, e.g. batch chunks)
+        **labels: Prometheus labels, e.g. stream="192.168.1.50"
+    """
+
+    def __init__(self, register=True, **labels):
+        self.labels = {k: str(v) for k, v in labels.items()}
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}  # name -> callable, read at scrape time
+        self.lock = threading.Lock()
+        if register:
+            with _registry_lock:
+                _registry.add(self)
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).record(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(stage).record(time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        counter = self.counters.get(name)
+        if counter is None:
+            with self.lock:
+                counter = self.counters.setdefault(name, Counter())
+        counter.add(n)
+
+    def rate(self, name):
+        counter = self.counters.get(name)
+        return counter.rate() if counter else 0.0
+
+    def gauge(self, name, func):
+        """Report func() as `name` at scrape time (for values other objects already track)"""
+        self.gauges[name] = func
+
+    def snapshot(self):
+        return {
+            'stages': {stage: h.summary() for stage, h in list(self.histograms.items())},
+            'counters': {name: c.value for name, c in list(self.counters.items())},
+            'gauges': {name: _safe(func) for name, func in list(self.gauges.items())},
+        }
+
+    def overlay_lines(self, stages=None):
+        """Short per-stage 'name p50/p99 ms' lines for drawing on a frame"""
+        lines = []
+        for stage, histogram in list(self.histograms.items()):
+            if stages is None or stage in stages:
+                lines.append(f"{stage}: {histogram.percentile(0.5) * 1000:.1f}/"
+                             f"{histogram.percentile(0.99) * 1000:.1f} ms")
+        return lines
+
+
+def timed(metrics, stage):
+    """metrics.timer(stage), or a no-op when metrics is None"""
+    return metrics.timer(stage) if metrics is not None else nullcontext()
+
+
+def _safe(func):
+    try:
+        return func()
+    except Exception:
+        return None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text():
+    """Every registered Metrics object in Prometheus text exposition format"""
+    with _registry_lock:
+        registries = list(_registry)
+
+    summaries, counters, gauges = [], {}, {}
+    for metrics in registries:
+        for stage, histogram in list(metrics.histograms.items()):
+            summaries.append((dict(metrics.labels, stage=stage), histogram))
+        for name, counter in list(metrics.counters.items()):
+            counters.setdefault(name, []).append((metrics.labels, counter.value))
+        for name, func in list(metrics.gauges.items()):
+            value = _safe(func)
+            if value is not None:
+                gauges.setdefault(name, []).append((metrics.labels, value))
+
+    lines = [
+        f"# HELP {PREFIX}_stage_seconds Time spent per pipeline stage",
+        f"# TYPE {PREFIX}_stage_seconds summary",
+    ]
+    for labels, histogram in summaries:
+        for q in QUANTILES:
+            lines.append(f"{PREFIX}_stage_seconds{_label_text(dict(labels, quantile=str(q)))} "
+                         f"{histogram.percentile(q):.6g}")
+        lines.append(f"{PREFIX}_stage_seconds_sum{_label_text(labels)} {histogram.sum:.6g}")
+        lines.append(f"{PREFIX}_stage_seconds_count{_label_text(labels)} {histogram.count}")
+    for name, samples in sorted(counters.items()):
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        lines.extend(f"{PREFIX}_{name}_total{_label_text(labels)} {value}" for labels, value in samples)
+    for name, samples in sorted(gauges.items()):
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        lines.extend(f"{PREFIX}_{name}{_label_text(labels)} {value}" for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the console
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    """
+    Serves prometheus_text() at http://host:port/metrics on a daemon thread
+
+    Args:
+        host: Bind address (default config.METRICS_HOST)
+        port: Port (default config.METRICS_PORT)
+    """
+
+    def __init__(self, host=None, port=None):
+        self.httpd = ThreadingHTTPServer((host or config.METRICS_HOST, port or config.METRICS_PORT), _Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,124 @@
+"""
+Adaptive detection scheduling for the ESP32-CAM detection system
+
+Decides per frame whether YOLO should run. Each frame is shrunk to a tiny
+grayscale thumbnail and compared with the previous one; the mean absolute
+difference is the motion score. Frames with motion, or with vehicles still
+being tracked, are detected every `interval` frames (config.DETECTION_INTERVAL),
+while a static empty scene drops to every `idle_interval` frames. When the
+measured inference time no longer fits the frame budget the interval grows
+automatically, and shrinks back once inference keeps up again.
+"""
+import math
+
+import cv2
+import numpy as np
+
+import config
+
+
+class MotionDetector:
+    """Cheap frame-difference motion score on a downscaled grayscale thumbnail"""
+
+    def __init__(self, size=(64, 48)):
+        self.size = size
+        self.previous = None
+
+    def score(self, frame):
+        """
+        Mean absolute difference to the previous frame
+
+        Returns:
+            0.0 (identical) .. 1.0; 1.0 for the first frame
+        """
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        previous, self.previous = self.previous, small
+        if previous is None:
+            return 1.0
+        return float(cv2.absdiff(small, previous).mean()) / 255.0
+
+
+class DetectionScheduler:
+    """
+    Picks which frames go through inference
+
+    Args:
+        interval: Detection interval while the scene is active (default config.DETECTION_INTERVAL)
+        idle_interval: Interval for a static scene with nothing tracked
+        max_interval: Upper bound when backing off under load
+        motion_threshold: Motion score above which the scene counts as active
+        frame_budget: Seconds available per frame (1 / source FPS). None turns load
+                      backoff off, for sources not paced to the wall clock (headless
+                      video, batch chunks), so the frames inferred don't depend on CPU speed
+    """
+
+    def __init__(self, interval=None, idle_interval=None, max_interval=None,
+                 motion_threshold=None, frame_budget=None):
+        self.base_interval = max(1, int(interval or config.DETECTION_INTERVAL))
+        self.idle_interval = max(self.base_interval, int(idle_interval or config.DETECTION_IDLE_INTERVAL))
+        self.max_interval = max(self.idle_interval, int(max_interval or config.DETECTION_MAX_INTERVAL))
+        self.motion_threshold = motion_threshold if motion_threshold is not None else config.MOTION_THRESHOLD
+        self.frame_budget = frame_budget
+        self.motion = MotionDetector()
+
+        self.interval = self.base_interval  # Current choice (exposed as a metric)
+        self.load_interval = self.base_interval  # Interval inference time allows
+        self.since_last = math.inf
+        self.avg_inference = 0.0  # Exponential moving average, seconds
+        self.last_motion = 0.0
+        self.active = True
+
+        # Metrics
+        self.frames = 0
+        self.detections = 0
+        self.skipped_static = 0
+
+    def should_detect(self, frame, tracked=0):
+        """
+        Call once per frame, in order
+
+        Args:
+            frame: The new frame
+            tracked: Number of vehicles currently tracked
+
+        Returns:
+            True if this frame should be run through the model
+        """
+        self.frames += 1
+        self.since_last += 1
+        self.last_motion = self.motion.score(frame)
+        self.active = tracked > 0 or self.last_motion >= self.motion_threshold
+
+        self.interval = self.load_interval if self.active else max(self.load_interval, self.idle_interval)
+        if self.since_last < self.interval:
+            if not self.active:
+                self.skipped_static += 1
+            return False
+        self.since_last = 0
+        self.detections += 1
+        return True
+
+    def record_inference(self, seconds):
+        """Feed back how long a detection took; backs off when it overruns the frame budget"""
+        alpha = 0.2
+        self.avg_inference = seconds if self.detections <= 1 else (1 - alpha) * self.avg_inference + alpha * seconds
+        if not self.frame_budget:
+            return  # No deadline to miss: keep the configured interval
+        # Frames one inference "costs", rounded up, never below the configured interval
+        needed = math.ceil(self.avg_inference / self.frame_budget - 1e-9)
+        self.load_interval = int(np.clip(needed, self.base_interval, self.max_interval))
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'load_interval': self.load_interval,
+            'active': self.active,
+            'motion': round(self.last_motion, 4),
+            'avg_inference_ms': round(self.avg_inference * 1000, 2),
+            'frame_budget_ms': round(self.frame_budget * 1000, 2) if self.frame_budget else None,
+            'frames': self.frames,
+            'detections': self.detections,
+            'skipped_static': self.skipped_static,
+        }
@@ -36,20 +36,35 @@ Notes:
   - LED colors: RED = High Priority, YELLOW = Medium Priority, GREEN = Low Priority
 """
 import argparse
+import signal
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from collections import deque
 import sys
 import os
+from urllib.parse import urlparse
 
 import cv2
-import requests
+import numpy as np
 
-try:
-    from ultralytics import YOLO
-except Exception:
-    YOLO = None
+import config
+from capture import FrameGrabber
+from connection import StreamConnection
+from backends import BACKENDS, load_backend, model_input_size
+from detection_log import DetectionLog
+from detection_store import DetectionStore, StoreWriter
+from led import LedDispatcher
+from live_stats import LiveStats
+from metrics import Metrics, MetricsServer
+from restream import MjpegBroadcaster, RestreamServer
+from export import LogExporter
+from inference import BatchInferenceEngine, PRIORITY_CODES, PRIORITY_LEVELS, PRIORITY_NONE, PriorityIndex, postprocess_detections
+from motion import DetectionScheduler
+from pipeline import Pipeline
+from plate_ocr import PlateOCRPool, PlateScheduler, preprocess_plate_roi
+from roi import RegionMask, polygons_for
+from tracker import VehicleTracker
 
 try:
     import tkinter as tk
@@ -57,11 +72,6 @@ try:
 except Exception:
     tk = None
 
-try:
-    import openpyxl
-    from openpyxl import Workbook
-except Exception:
-    openpyxl = None
 
 try:
     import easyocr
@@ -113,13 +123,25 @@ LED_COLORS = {
 
 class ESP32CamDetector:
     def __init__(self, esp_ip=None, stream_path="/stream", video_path=None, process_scale=1.0, 
-                 detect_pedestrians=False, general_mode=False):
+                 detect_pedestrians=False, general_mode=False, engine=None, stream_id=None, backend=None, backend_options=None,
+                 headless=False, frame_range=None, model=None, ocr_pool=None, log=None, live_stats=None):
         self.esp_ip = esp_ip
         self.video_path = video_path
         self.use_video = video_path is not None
-        self.process_scale = process_scale  # Scale factor for processing (0.5 = half size for 4x speed)
+        self.process_scale = process_scale  # Model input size relative to config.INFERENCE_IMAGE_SIZE (0.5 = ~4x faster)
         self.detect_pedestrians = detect_pedestrians  # Enable pedestrian detection
         self.general_mode = general_mode  # Enable general object detection (80+ classes)
+        self.engine = engine  # Shared BatchInferenceEngine (None = own model)
+        self.backend = backend or config.INFERENCE_BACKEND  # torch, onnx or openvino
+        self.backend_options = dict(backend_options or {})  # imgsz, int8, intra_threads, inter_threads
+        self.backend_options.setdefault('imgsz', model_input_size(process_scale))
+        self.stream_id = stream_id or esp_ip or video_path or "default"
+        self.headless = headless  # No window/keyboard; video runs unthrottled and stops at the end
+        self.frame_sinks = []  # Callables fed every annotated frame (needed for annotation in headless mode)
+        self.frame_range = frame_range  # (start, end) frame numbers: process just this slice of the video (batch mode; end None = to EOF)
+        self.video_fps = None
+        self.roi_polygons = polygons_for(self.stream_id, esp_ip, video_path)  # Lane masks from config.ROI_POLYGONS
+        self.roi_mask = None  # RegionMask for the current frame size
         
         if esp_ip and esp_ip.startswith("http"):
             self.stream_url = esp_ip
@@ -129,35 +151,88 @@ class ESP32CamDetector:
             self.stream_url = None
 
         self.cap = None
-        self.model = None
-        self.ocr_reader = None
+        self.connection = None  # Self-reconnecting live stream (the cap for live sources)
+        self.grabber = None  # Threaded latest-frame reader for live streams
+        self.model = model  # Preloaded backend (batch workers reuse one across chunks)
+        self.class_names = None  # class id -> label, from the model
+        self.priority_index = PriorityIndex(VEHICLE_PRIORITY)  # class id -> priority code
+        self.person_cls = None  # class id of 'person'
+        self.ocr_pool = ocr_pool  # PlateOCRPool (EasyOCR in worker processes)
+        self.owns_ocr_pool = ocr_pool is None  # Only close a pool we started
+        self.plate_scheduler = None  # Decides which tracked vehicles need OCR
+        # Stage timers and counters, served at /metrics (batch chunks are too short-lived to export)
+        self.metrics = Metrics(register=frame_range is None, stream=self.stream_id)
+        self.metrics.gauge('frames_dropped', self.frames_dropped)
+        self.metrics.gauge('ocr_calls', lambda: self.plate_scheduler.ocr_calls if self.plate_scheduler else 0)
+        self.metrics.gauge('render_fps', lambda: round(self.metrics.rate('frames_rendered'), 2))
+        self.metrics.gauge('detection_interval', lambda: self.scheduler.interval)
+        self.led = None  # LedDispatcher: ESP32 LED commands on a background thread
+        if config.LED_CONTROL_ENABLED and esp_ip and not self.use_video:
+            self.led = LedDispatcher(led_base_url(esp_ip), colors=LED_COLORS, metrics=self.metrics)
         self.running = False
-        self.log = deque()  # store (timestamp_iso, label, priority, license_plate, pedestrian_count)
+        # Binary records (timestamp, class, priority, plate, track, pedestrians) on disk + recent ring
+        self.log = log if log is not None else DetectionLog(
+            directory=os.path.join(config.LOG_DIR, log_directory_name(self.stream_id),
+                                   datetime.now().strftime("%Y%m%d_%H%M%S")),
+            timestamps='video' if frame_range is not None else 'wall'
+        )
+        self.exporter = LogExporter(self.log, detect_pedestrians=detect_pedestrians)  # Background xlsx/csv export
+        self.store_writer = None  # Parquet detection store (wall-clock runs only)
+        self.live_stats = live_stats  # LiveStats shared with the API (counters + recent detections)
         self.frame = None
         self.current_priority = 'NONE'  # Track highest priority vehicle detected
-        self.plate_cache = {}  # Cache to avoid reading same plate multiple times
-        self.plate_cache_timeout = 3  # seconds
+        self.tracker = VehicleTracker()  # Persistent IDs for vehicles across frames
+        self.track_info = {}  # track_id -> first sighting details, logged once per vehicle
         self.last_annotated = None  # Store last annotated frame to prevent blinking
         self.max_vehicles = 5  # Only track 5 nearest vehicles
         self.pedestrian_count = 0  # Track pedestrians in current frame
         self.object_counts = {}  # Track counts of different objects in general mode
+        self.scheduler = None  # DetectionScheduler: which frames get inference (motion + load)
+        self.frame_count = 0
+        self.pipeline = None
+        self.render_queue = None
+        self.io_queue = None
+        self.source_finished = threading.Event()  # Set when a headless video runs out of frames
+        self.run_stats = None  # {'frames', 'seconds'} of the last headless run (benchmarks)
 
     def load_model(self):
-        if YOLO is None:
-            raise RuntimeError("Ultralytics YOLO not available. Install with: pip install ultralytics")
-        # use small model for speed
-        self.model = YOLO("yolov8n.pt")
+        if self.model is not None:
+            pass  # Handed in already loaded
+        elif self.engine is not None:
+            # Shared model: one copy in memory for every stream in this process
+            self.model = self.engine.load()
+        else:
+            # use small model for speed
+            self.model = load_backend(self.backend, config.YOLO_MODEL, **self.backend_options)
+        self.class_names = self.model.names
+        self.log.class_names = self.class_names
+        # Backends have a metrics slot (None until an owner sets it); a shared model already has one
+        if hasattr(self.model, 'metrics') and self.model.metrics is None:
+            self.model.metrics = self.metrics  # Own model: preprocess/forward/decode timings
+        if config.STORE_ENABLED and self.frame_range is None and self.store_writer is None:
+            try:
+                self.store_writer = StoreWriter(DetectionStore(), self.stream_id, self.class_names)
+            except RuntimeError as e:
+                print(f"Detection store disabled: {e}")
+        self.person_cls = next((cls for cls, name in self.class_names.items() if name.lower() == 'person'), None)
+        self.priority_index.lookup(self.class_names)
         
-        # Initialize EasyOCR for license plate recognition
-        if easyocr is not None:
-            print("Loading EasyOCR for license plate recognition (this may take a minute)...")
+        # License plates are read by a pool of OCR processes (vehicle mode only)
+        if self.general_mode:
+            return
+        if self.ocr_pool is not None:
+            self.plate_scheduler = PlateScheduler(self.ocr_pool)
+        elif easyocr is not None:
+            print("Starting EasyOCR workers for license plate recognition (this may take a minute)...")
             try:
-                self.ocr_reader = easyocr.Reader(['en'], gpu=False)  # Set gpu=True if CUDA available
-                print("EasyOCR loaded successfully!")
+                self.ocr_pool = PlateOCRPool()
+                self.ocr_pool.metrics = self.metrics
+                self.plate_scheduler = PlateScheduler(self.ocr_pool)
+                print(f"EasyOCR pool started with {self.ocr_pool.workers} worker(s)!")
             except Exception as e:
-                print(f"Warning: Could not load EasyOCR: {e}")
+                print(f"Warning: Could not start EasyOCR: {e}")
                 print("License plate recognition will be disabled.")
-                self.ocr_reader = None
+                self.ocr_pool = None
         else:
             print("EasyOCR not installed. License plate recognition disabled.")
             print("Install with: pip install easyocr")
@@ -169,179 +244,171 @@ class ESP32CamDetector:
             self.cap = cv2.VideoCapture(self.video_path)
             if not self.cap.isOpened():
                 raise RuntimeError(f"Failed to open video file at {self.video_path}")
+            self.video_fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+            if self.frame_range and self.frame_range[0] > 0:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.frame_range[0])
         else:
             if not self.stream_url:
                 raise RuntimeError("No stream URL or video file provided")
             
             print(f"Connecting to stream: {self.stream_url}")
             
-            # Try to open the stream
-            self.cap = cv2.VideoCapture(self.stream_url)
-            
-            # For IP camera apps, may need to set buffer size
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            
-            if not self.cap.isOpened():
-                raise RuntimeError(f"Failed to open stream at {self.stream_url}")
+            # Try to open the stream; once open it reconnects by itself if the camera drops
+            self.connection = StreamConnection(self.stream_url, name=self.stream_id, metrics=self.metrics,
+                                               on_change=self.connection_changed)
+            if not self.connection.connect(attempts=config.STREAM_RETRY_ATTEMPTS):
+                self.connection.release()
+                raise RuntimeError(f"Failed to open stream at {self.stream_url} "
+                                   f"after {config.STREAM_RETRY_ATTEMPTS} attempt(s)")
+            self.cap = self.connection
             
             print("Successfully connected to IP camera stream!")
 
+        if not self.use_video:
+            budget = config.STREAM_FRAME_BUDGET_MS / 1000.0
+        elif not self.headless:
+            budget = 1.0 / self.video_fps  # Paced playback
+        else:
+            # Headless video and batch chunks read as fast as inference allows: no deadline,
+            # so no load backoff, and the same file gives the same detections on any machine
+            budget = None
+        self.scheduler = DetectionScheduler(frame_budget=budget)
+
+        # Live streams decode on their own thread and drop stale frames;
+        # video files are read inline so every frame is processed in order
+        self.grabber = FrameGrabber(
+            self.cap,
+            threaded=not self.use_video,
+            buffer_size=config.FRAME_BUFFER_SIZE
+        ).start()
+
+    def connection_changed(self, status):
+        """Publish the stream's connection state alongside the detection stats"""
+        if self.live_stats:
+            self.live_stats.set_camera(self.stream_id, status)
+
     def classify_vehicle_priority(self, label):
         """Classify vehicle by priority based on its type"""
-        label_lower = label.lower()
-        
-        # Check for emergency vehicles (high priority)
-        if any(keyword in label_lower for keyword in ['ambulance', 'fire', 'police']):
-            return 'HIGH'
-        
-        # Check if it's a known vehicle type
-        for vehicle_type, priority in VEHICLE_PRIORITY.items():
-            if vehicle_type in label_lower:
-                return priority
-        
-        # Default: not a vehicle or unknown
-        return None
+        return self.priority_index.classify(label)
     
     def preprocess_plate_roi(self, plate_roi):
         """Preprocess image region for better OCR accuracy"""
-        try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
-            
-            # Apply bilateral filter to reduce noise
-            denoised = cv2.bilateralFilter(gray, 11, 17, 17)
-            
-            # Apply adaptive thresholding
-            thresh = cv2.adaptiveThreshold(
-                denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                cv2.THRESH_BINARY, 11, 2
-            )
-            
-            # Resize if too small (minimum height 50px for better OCR)
-            height, width = thresh.shape
-            if height < 50:
-                scale = 50 / height
-                new_width = int(width * scale)
-                thresh = cv2.resize(thresh, (new_width, 50), interpolation=cv2.INTER_CUBIC)
-            
-            return thresh
-        except Exception as e:
-            return plate_roi
+        return preprocess_plate_roi(plate_roi)
     
-    def detect_license_plate(self, frame, x1, y1, x2, y2, vehicle_id):
+    def detect_license_plate(self, frame, x1, y1, x2, y2, vehicle_id, priority='LOW'):
         """
-        Detect and read license plate from vehicle region
+        Get the license plate for a tracked vehicle without blocking on OCR
+        
+        The plate scheduler decides whether this vehicle needs a (re-)read and
+        keeps the best crop seen so far; finished reads are attached on
+        whichever later frame asks for them.
         
         Args:
             frame: Full video frame
             x1, y1, x2, y2: Bounding box coordinates of detected vehicle
-            vehicle_id: Unique identifier for caching purposes
+            vehicle_id: Track ID of the vehicle
+            priority: Vehicle priority (HIGH vehicles are read first)
             
         Returns:
-            License plate text or None
+            Best license plate text so far, or None
         """
-        if self.ocr_reader is None:
+        if self.plate_scheduler is None:
             return None
+        return self.plate_scheduler.observe(vehicle_id, frame, (x1, y1, x2, y2), priority)
+    
+    def forget_tracks(self, track_ids):
+        """
+        Drop per-vehicle state for tracks that ended
         
-        # Check cache first (avoid re-reading same plate)
-        current_time = time.time()
-        if vehicle_id in self.plate_cache:
-            cached_plate, cached_time = self.plate_cache[vehicle_id]
-            if current_time - cached_time < self.plate_cache_timeout:
-                return cached_plate
-        
-        try:
-            # Extract vehicle region with some padding
-            height, width = frame.shape[:2]
-            pad = 10
-            y1_pad = max(0, y1 - pad)
-            y2_pad = min(height, y2 + pad)
-            x1_pad = max(0, x1 - pad)
-            x2_pad = min(width, x2 + pad)
-            
-            vehicle_roi = frame[y1_pad:y2_pad, x1_pad:x2_pad]
-            
-            if vehicle_roi.size == 0 or vehicle_roi.shape[0] < 20 or vehicle_roi.shape[1] < 20:
-                return None
-            
-            # Focus on lower 40% of vehicle (where plates typically are)
-            roi_height = vehicle_roi.shape[0]
-            lower_region = vehicle_roi[int(roi_height * 0.6):, :]
-            
-            if lower_region.size == 0:
-                lower_region = vehicle_roi
-            
-            # Preprocess the image
-            processed = self.preprocess_plate_roi(lower_region)
-            
-            # Perform OCR
-            results = self.ocr_reader.readtext(processed, detail=1, paragraph=False)
-            
-            if not results:
-                return None
-            
-            # Filter and clean results
-            best_plate = None
-            best_confidence = 0
-            
-            for (bbox, text, confidence) in results:
-                # Lower confidence threshold and more lenient validation
-                if confidence > 0.3:  # Lowered from 0.4
-                    # Clean the text (remove spaces, special chars except hyphens)
-                    cleaned_text = ''.join(c for c in text if c.isalnum() or c == '-')
-                    
-                    # More lenient: 3-12 chars, can be all numbers or all letters
-                    if 3 <= len(cleaned_text) <= 12:
-                        # Accept if it has numbers OR letters (not necessarily both)
-                        has_letter = any(c.isalpha() for c in cleaned_text)
-                        has_number = any(c.isdigit() for c in cleaned_text)
-                        
-                        # Accept any text with letters or numbers
-                        if (has_letter or has_number) and confidence > best_confidence:
-                            best_plate = cleaned_text.upper()
-                            best_confidence = confidence
-                            # Debug output
-                            print(f"🔍 Detected plate: {best_plate} (confidence: {confidence:.2f})")
-            
-            # Cache the result
-            if best_plate:
-                self.plate_cache[vehicle_id] = (best_plate, current_time)
-            
-            return best_plate
-            
-        except Exception as e:
-            # Print errors for debugging
-            print(f"⚠️ OCR error: {e}")
-            return None
+        Returns:
+            Log entries for vehicles that left before their plate was confirmed
+        """
+        log_entries = []
+        for track_id in track_ids:
+            plate = self.plate_scheduler.forget(track_id) if self.plate_scheduler else None
+            info = self.track_info.pop(track_id, None)
+            if info is not None and not info['logged']:
+                # Best unconfirmed guess is better than nothing
+                info['plate'] = info['plate'] or plate
+                log_entries.append(self.track_log_entry(info))
+        return log_entries
     
-    def clean_old_cache(self):
-        """Remove old entries from plate cache"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, (_, timestamp) in self.plate_cache.items()
-            if current_time - timestamp > self.plate_cache_timeout
-        ]
-        for key in expired_keys:
-            del self.plate_cache[key]
+    def timestamp(self, frame_index=None):
+        """Log timestamp: Unix time, or seconds into the file for batch chunks"""
+        if self.frame_range is None or frame_index is None:
+            return time.time()
+        return (frame_index - 1) / self.video_fps
+
+    def track_log_entry(self, info):
+        """Log record for one tracked vehicle: (timestamp, class, priority code, plate, track id, pedestrians)"""
+        return (info['first_seen'], info['cls'], PRIORITY_CODES[info['priority']], info['plate'],
+                info['track_id'], info['pedestrians'])
     
+    def run_model(self, frame):
+        """Run detection on one frame, through the shared engine if there is one"""
+        if self.engine is not None:
+            return self.engine.infer(self.stream_id, frame)
+        return self.model.detect(frame)
+
+    def run_model_batch(self, frames):
+        """Run detection on several images (ROI crops) in as few forward passes as possible"""
+        if self.engine is not None:
+            futures = [self.engine.submit(self.stream_id, f) for f in frames]
+            return [future.result() for future in futures]
+        return self.model.detect_batch(frames)
+
+    def detect_frame(self, frame):
+        """Detections for a whole frame, restricted to the configured ROI polygons if any"""
+        if not self.roi_polygons:
+            return self.run_model(frame)
+        if self.roi_mask is None or self.roi_mask.frame_shape != frame.shape[:2]:
+            self.roi_mask = RegionMask(self.roi_polygons, frame.shape)
+            print(f"ROI: {len(self.roi_mask.polygons)} region(s), {len(self.roi_mask.crops)} crop(s) "
+                  f"covering {self.roi_mask.coverage:.0%} of the frame")
+        if not self.roi_mask:
+            return self.run_model(frame)
+        return self.roi_mask.merge(self.run_model_batch(self.roi_mask.crop(frame)))
+
+    @property
+    def window_title(self):
+        if self.general_mode:
+            title = "General Object Detection (80+ Classes)"
+        elif self.detect_pedestrians:
+            title = "Vehicle & Pedestrian Detection"
+        else:
+            title = "ESP32-CAM Vehicle Detection & Priority Classification"
+        # One window per stream when several cameras share the process
+        if self.engine is not None:
+            title = f"{title} [{self.stream_id}]"
+        return title
+
     def send_led_command(self, priority):
-        """Send LED control command to ESP32"""
-        if self.use_video or not self.esp_ip:
-            return  # Skip LED control for video files
-        
-        try:
-            color = LED_COLORS.get(priority, 'off')
-            url = f"http://{self.esp_ip}/led?color={color}"
-            requests.get(url, timeout=1)
-        except Exception as e:
-            # Don't crash on LED control errors
-            pass
+        """Ask the LED dispatcher to show this priority (never blocks; sent from its own thread)"""
+        if self.led is None:
+            return  # No LEDs for video files
+        self.led.set(priority)
 
     def run(self):
+        self.prepare()
+        if self.headless:
+            self.run_headless()
+            return
+
+        self.start_display()
+        # Render stage: the GUI has to stay on this thread
+        try:
+            while self.running:
+                if self.render_next(timeout=0.5):
+                    self.handle_key(cv2.waitKey(self.wait_time) & 0xFF)
+        finally:
+            self.finish_display()
+
+    def prepare(self):
+        """Load the model and open the source"""
         self.running = True
-        if self.model is None:
+        if self.class_names is None:
             self.load_model()
-        if self.cap is None:
+        if self.grabber is None:
             self.start_capture()
 
         # Determine mode
@@ -352,11 +419,11 @@ class ESP32CamDetector:
         
         source_type = "video file" if self.use_video else "ESP32 stream"
         print(f"Starting {mode_str} from {source_type}.")
-        print(f"Press 'q' in the video window to quit, 'e' to export data.")
-        
-        frame_count = 0
-        detection_interval = 3  # Process every 3rd frame for better performance
-        ocr_interval = 15  # Only run OCR every 15th frame (OCR is slow!)
+        self.frame_count = self.frame_range[0] if self.frame_range else 0
+
+    def start_display(self):
+        """Start the pipeline for windowed mode; frames are then shown by render_next() on the GUI thread"""
+        print(f"Press 'q' in the video window to quit, 'e' to export data, 'i' to export new rows only.")
         
         # Calculate proper wait time for video playback
         if self.use_video:
@@ -366,368 +433,648 @@ class ESP32CamDetector:
             wait_time = int(1000 / fps)  # milliseconds per frame
         else:
             wait_time = 1  # For live stream, process as fast as possible
+        self.wait_time = wait_time
         
         print(f"Video FPS: {fps if self.use_video else 'N/A'}, Wait time: {wait_time}ms")
         print(f"Tracking max {self.max_vehicles} nearest vehicles for better performance")
+
+        self.pipeline = self.build_pipeline()
+        self.pipeline.start()
+
+    def render_next(self, timeout=0.5):
+        """
+        Show the next annotated frame in this source's window (GUI thread only)
+
+        Returns:
+            True if a frame was shown, False if none arrived within timeout
+        """
+        packet = self.render_queue.get(timeout=timeout)
+        if packet is None:
+            return False
+        with self.metrics.timer('render'):
+            image = self.draw_overlay(packet['annotated'])
+            cv2.imshow(self.window_title, image)
+            for sink in self.frame_sinks:
+                sink(image)
+        self.metrics.count('frames_rendered')
+        return True
+
+    def handle_key(self, key):
+        if key == ord('q'):
+            self.stop()
+        elif key == ord('e'):
+            # Export on 'e' key press (written on a background thread)
+            self.export_in_background()
+        elif key == ord('i'):
+            # Only the rows added since the last 'i' export
+            self.export_in_background(incremental=True)
+
+    def finish_display(self):
+        """Stop the windowed pipeline and flush everything"""
+        self.running = False
+        self.pipeline.stop()
+        print("Pipeline stats:")
+        print(self.pipeline.summary())
+        self.cleanup()
+        self.exporter.close()  # Let exports still being written finish
+
+    def run_headless(self):
+        """
+        No window and no waitKey: frames are processed as fast as the pipeline
+        allows. Stops on stop() (SIGINT/SIGTERM in main) or, for video files,
+        once the last frame has gone through every stage.
+        """
+        print("Running headless (Ctrl+C or SIGTERM to stop)")
+        self.source_finished.clear()
+        start = time.perf_counter()
+        first_frame = self.frame_count
+        self.pipeline = self.build_pipeline()
+        self.pipeline.start()
+        try:
+            while self.running:
+                if self.source_finished.is_set():
+                    self.pipeline.drain(pump=self.feed_sinks)
+                    break
+                self.feed_sinks()
+        finally:
+            self.running = False
+            elapsed = time.perf_counter() - start
+            self.pipeline.stop()
+            frames = self.frame_count - first_frame
+            self.run_stats = {'frames': frames, 'seconds': elapsed}
+            print(f"Processed {frames} frames in {elapsed:.1f}s "
+                  f"({frames / elapsed if elapsed else 0:.1f} FPS)")
+            print("Pipeline stats:")
+            print(self.pipeline.summary())
+            self.cleanup()
+            # No 'e' key or Tkinter button here, so save what was found
+            # (batch chunks hand their log back to the batch runner instead)
+            if self.log and self.frame_range is None:
+                try:
+                    print(f"✅ Exported: {self.export_excel()}")
+                except Exception as e:
+                    print(f"❌ Export failed: {e}")
+            self.exporter.close()
+
+    def frames_dropped(self):
+        """Frames lost to full pipeline queues plus frames the grabber replaced before they were read"""
+        dropped = sum(q.dropped for q in self.pipeline.queues) if self.pipeline else 0
+        if self.grabber:
+            dropped += self.grabber.stats()['frames_dropped']
+        return dropped
+
+    def draw_overlay(self, image):
+        """
+        FPS (config.SHOW_FPS) and per-stage p50/p99 timings (config.DEBUG_MODE) on a copy of the frame
+
+        Returns the frame itself when both are off.
+        """
+        if not (config.SHOW_FPS or config.DEBUG_MODE):
+            return image
+        image = image.copy()  # Annotated frames are shared (last_annotated, re-stream)
+        lines = [f"FPS: {self.metrics.rate('frames_rendered'):.1f} | "
+                 f"inferred: {self.metrics.rate('frames_inferred'):.1f}/s"]
+        if config.DEBUG_MODE:
+            lines += self.metrics.overlay_lines()
+        y = image.shape[0] - 12 - 22 * (len(lines) - 1)
+        for line in lines:
+            cv2.putText(image, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255, 255, 255), 2)
+            cv2.putText(image, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 0, 0), 1)
+            y += 22
+        return image
+
+    def feed_sinks(self, timeout=0.05):
+        """Hand the next rendered frame (if one arrives within timeout) to the frame sinks"""
+        packet = self.render_queue.get(timeout=timeout)
+        if packet is None or packet.get('annotated') is None:
+            return
+        with self.metrics.timer('render'):
+            image = self.draw_overlay(packet['annotated'])
+            for sink in self.frame_sinks:
+                sink(image)
+        self.metrics.count('frames_rendered')
+
+    @property
+    def annotate_frames(self):
+        """Draw boxes/labels only when something will look at the result (sinks with no viewers don't count)"""
+        return not self.headless or any(getattr(sink, 'active', True) for sink in self.frame_sinks)
+
+    def build_pipeline(self):
+        """
+        Wire up capture -> inference -> annotate (OCR + drawing) -> render, with
+        LED commands and log appends on their own I/O worker
+
+        Video files block on full queues so every frame is processed in order;
+        live streams drop the oldest queued frame so the display stays current.
+        """
+        policy = 'block' if self.use_video else 'drop_oldest'
+        size = config.PIPELINE_QUEUE_SIZE
+
+        pipeline = Pipeline()
+        infer_queue = pipeline.queue('inference', size, policy)
+        annotate_queue = pipeline.queue('annotate', size, policy)
+        self.render_queue = pipeline.queue('render', size, policy)
+        # Never lose log entries; LED/log work is tiny so this rarely fills
+        self.io_queue = pipeline.queue('io', config.PIPELINE_IO_QUEUE_SIZE, 'block')
+
+        pipeline.add('capture', self.capture_stage, out_queue=infer_queue)
+        pipeline.add('inference', self.inference_stage, infer_queue, annotate_queue)
+        # Headless without sinks: nothing reads rendered frames, so don't queue them
+        render_queue = self.render_queue if not self.headless or self.frame_sinks else None
+        pipeline.add('annotate', self.annotate_stage, annotate_queue, render_queue)
+        pipeline.add('io', self.io_stage, self.io_queue)
+        return pipeline
+
+    def capture_stage(self):
+        """Source stage: read the next frame"""
+        if self.frame_range is not None and self.frame_range[1] is not None and self.frame_count >= self.frame_range[1]:
+            ret, frame = False, None  # End of this batch chunk
+        else:
+            with self.metrics.timer('capture'):
+                ret, frame = self.grabber.read()
+        if not ret:
+            if self.use_video and self.headless:
+                # Offline run: done once the file is exhausted
+                if not self.source_finished.is_set():
+                    print("Video ended.")
+                    self.source_finished.set()
+                time.sleep(0.05)
+            elif self.use_video:
+                # Video ended, restart or quit
+                print("Video ended. Restarting...")
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            # Live: the connection reconnects on its own; the grabber already paces retries
+            return None
+
+        self.frame = frame
+        self.frame_count += 1
+        self.metrics.count('frames_read')
+        return {'index': self.frame_count, 'frame': frame, 'detections': None, 'captured': time.perf_counter()}
+
+    def inference_stage(self, packet):
+        """Run YOLO on the frames the scheduler picks and parse the boxes"""
+        frame = packet['frame']
+        with self.metrics.timer('motion'):
+            detect = self.scheduler.should_detect(frame, tracked=len(self.tracker))
+        if not detect:
+            return packet
+
+        # The backend letterboxes the frame (or each ROI crop) straight into its
+        # fixed input size in one resize and hands back boxes in frame pixels
+        start = time.perf_counter()
+        try:
+            raw = self.detect_frame(frame)
+        except Exception as e:
+            print("Detection error:", e)
+            time.sleep(0.5)
+            return None
+        elapsed = time.perf_counter() - start
+        self.scheduler.record_inference(elapsed)
+        self.metrics.observe('inference', elapsed)
+        self.metrics.count('frames_inferred')
+
+        with self.metrics.timer('postprocess'):
+            packet['detections'] = self.parse_detections(raw, frame.shape[0])
+        return packet
+
+    def parse_detections(self, raw, frame_height):
+        """Split raw (N, 6) boxes into vehicle, pedestrian and general detection records"""
+        return postprocess_detections(
+            raw, frame_height, self.priority_index.lookup(self.class_names),
+            person_cls=self.person_cls,
+            general_mode=self.general_mode,
+            detect_pedestrians=self.detect_pedestrians
+        )
+
+    def class_name(self, cls):
+        cls = int(cls)
+        names = self.class_names
+        if names is not None and cls in names:
+            return names[cls]
+        return str(cls)
+
+    def annotate_stage(self, packet):
+        """OCR, drawing and priority decision for detection frames"""
+        frame = packet['frame']
+        detections = packet['detections']
+        if detections is None:
+            # Show last annotated frame instead of raw frame to prevent blinking
+            packet['annotated'] = self.last_annotated if self.last_annotated is not None else frame
+            self.metrics.observe('end_to_end', time.perf_counter() - packet['captured'])
+            return packet
+
+        # Headless with no sinks: still track, OCR and log, but skip the copy and drawing
+        with self.metrics.timer('annotate'):
+            annotated = frame.copy() if self.annotate_frames else None
+            if self.general_mode:
+                self.draw_general_objects(annotated, detections['general'], packet['index'])
+            else:
+                self.draw_vehicles(annotated, frame, packet['index'], detections)
+            if annotated is not None and self.roi_mask:
+                self.roi_mask.draw(annotated)
+
+        # Store this annotated frame to prevent blinking (never drawn on again, so no copy)
+        self.last_annotated = annotated
+        packet['annotated'] = annotated
+        self.metrics.observe('end_to_end', time.perf_counter() - packet['captured'])
+        return packet
+
+    def draw_general_objects(self, annotated, general_detections, frame_index=None):
+        # Already sorted by confidence for better display
+        
+        # Update object counts
+        class_ids, counts = np.unique(general_detections['cls'], return_counts=True)
+        self.object_counts = {self.class_name(c): int(n) for c, n in zip(class_ids, counts)}
         
-        while self.running:
-            ret, frame = self.cap.read()
-            if not ret:
-                if self.use_video:
-                    # Video ended, restart or quit
-                    print("Video ended. Restarting...")
-                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    continue
-                else:
-                    # Stream issue, retry
-                    time.sleep(0.1)
-                    continue
+        # Draw all detected objects
+        color_map = {}  # Cache colors for each class
+        import random
+        random.seed(42)  # Consistent colors
+        log_entries = []
+        
+        for obj in general_detections:
+            x1, y1, x2, y2 = obj['box'].tolist()
+            conf = float(obj['conf'])
+            cls = int(obj['cls'])
+            name = self.class_name(cls)
             
-            self.frame = frame
-            frame_count += 1
+            # Log detection
+            log_entries.append((self.timestamp(frame_index), cls, PRIORITY_NONE, None, 0, 0))  # No priority/plate in general mode
+
+            if annotated is None:
+                continue
+
+            # Generate consistent color for each object class
+            if cls not in color_map:
+                color_map[cls] = (
+                    random.randint(0, 255),
+                    random.randint(0, 255),
+                    random.randint(0, 255)
+                )
+            color = color_map[cls]
             
-            # Resize frame for faster processing if scale < 1.0
-            if self.process_scale < 1.0:
-                process_frame = cv2.resize(frame, None, fx=self.process_scale, fy=self.process_scale, 
-                                          interpolation=cv2.INTER_LINEAR)
-                scale_factor = 1.0 / self.process_scale
-            else:
-                process_frame = frame
-                scale_factor = 1.0
-
-            # Detect vehicles on this frame
-            if frame_count % detection_interval == 0:
-                # Clean old cache entries periodically
-                if frame_count % 30 == 0:
-                    self.clean_old_cache()
-                
-                try:
-                    results = self.model(process_frame)
-                except Exception as e:
-                    print("Detection error:", e)
-                    time.sleep(0.5)
-                    continue
+            # Draw bounding box
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+            
+            # Create label
+            label = f"{name} {conf:.2f}"
+            
+            # Draw label background
+            (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            cv2.rectangle(annotated, (x1, y1 - label_h - 12), (x1 + label_w + 10, y1), color, -1)
+            cv2.putText(annotated, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
 
-                annotated = frame.copy()
-                frame_priorities = []  # Track all priorities detected in this frame
-                
-                # Determine if we should run OCR this frame (only every Nth frame)
-                run_ocr = (frame_count % ocr_interval == 0)
-                
-                # Collect all vehicle detections first
-                vehicle_detections = []
-                pedestrian_detections = []
-                general_detections = []  # For general object detection mode
-                
-                # Process detection results
-                for r in results:
-                    boxes = r.boxes
-                    if boxes is None:
-                        continue
-                    for idx, box in enumerate(boxes):
-                        xyxy = box.xyxy[0].cpu().numpy() if hasattr(box.xyxy[0], 'cpu') else box.xyxy[0].numpy()
-                        # Scale coordinates back to original frame size
-                        x1, y1, x2, y2 = map(int, xyxy[:4] * scale_factor)
-                        conf = float(box.conf[0]) if hasattr(box, 'conf') and len(box.conf) else 0.0
-                        cls = int(box.cls[0]) if hasattr(box, 'cls') and len(box.cls) else None
-                        name = r.names[cls] if (cls is not None and r.names is not None and cls in r.names) else str(cls)
-
-                        # GENERAL OBJECT DETECTION MODE
-                        if self.general_mode:
-                            # Detect ALL objects from COCO dataset (80+ classes)
-                            frame_height = frame.shape[0]
-                            distance = frame_height - y2
-                            
-                            general_detections.append({
-                                'bbox': (x1, y1, x2, y2),
-                                'conf': conf,
-                                'name': name,
-                                'distance': distance,
-                                'cls': cls
-                            })
-                            continue  # Skip vehicle-specific logic in general mode
-                        
-                        # VEHICLE MODE (default behavior)
-                        # Check if it's a pedestrian (person detection)
-                        if self.detect_pedestrians and name.lower() == 'person':
-                            # Calculate distance from bottom center
-                            frame_height = frame.shape[0]
-                            distance = frame_height - y2
-                            
-                            pedestrian_detections.append({
-                                'bbox': (x1, y1, x2, y2),
-                                'conf': conf,
-                                'distance': distance
-                            })
-                        
-                        # Classify vehicle priority
-                        priority = self.classify_vehicle_priority(name)
-                        
-                        if priority:  # Only process if it's a vehicle
-                            # Calculate distance from bottom center (nearer = larger y2 value)
-                            frame_height = frame.shape[0]
-                            distance = frame_height - y2  # Lower distance = closer to camera
-                            
-                            vehicle_detections.append({
-                                'bbox': (x1, y1, x2, y2),
-                                'conf': conf,
-                                'name': name,
-                                'priority': priority,
-                                'distance': distance
-                            })
-                
-                # Sort by distance and keep only the 5 nearest vehicles
-                vehicle_detections.sort(key=lambda v: v['distance'])
-                nearest_vehicles = vehicle_detections[:self.max_vehicles]
+        if log_entries:
+            self.io_queue.put(('log', log_entries))
+
+        if annotated is None:
+            return
+        
+        # Display object counts
+        y_offset = 30
+        total_objects = len(general_detections)
+        status_text = f"Total Objects: {total_objects} | Unique Classes: {len(self.object_counts)}"
+        cv2.putText(annotated, status_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(annotated, status_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 1)
+        
+        # Display top 5 detected objects
+        y_offset += 35
+        sorted_counts = sorted(self.object_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+        for obj_name, count in sorted_counts:
+            count_text = f"{obj_name}: {count}"
+            cv2.putText(annotated, count_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+            cv2.putText(annotated, count_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+            y_offset += 30
+
+    def draw_vehicles(self, annotated, frame, frame_index, detections):
+        pedestrian_detections = detections['pedestrians']
+        vehicle_detections = detections['vehicles']
+        log_entries = []
+
+        # Stable track IDs for every vehicle box; vehicles that left get logged now
+        vehicle_detections['track_id'] = self.tracker.update(vehicle_detections['box'])
+        log_entries.extend(self.forget_tracks(self.tracker.removed))
+
+        # Already sorted by distance: keep only the 5 nearest tracked vehicles
+        nearest_vehicles = vehicle_detections[:self.max_vehicles]
+        
+        # Update pedestrian count
+        self.pedestrian_count = len(pedestrian_detections)
+
+        # Draw pedestrians if feature is enabled
+        if self.detect_pedestrians and annotated is not None:
+            for ped in pedestrian_detections:
+                x1, y1, x2, y2 = ped['box'].tolist()
+                conf = float(ped['conf'])
                 
-                # Update pedestrian count
-                self.pedestrian_count = len(pedestrian_detections)
+                # Draw pedestrian bounding box in cyan
+                color = (255, 255, 0)  # Cyan for pedestrians
+                cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
                 
-                # =============== GENERAL OBJECT DETECTION MODE ===============
-                if self.general_mode:
-                    # Sort by confidence for better display
-                    general_detections.sort(key=lambda d: d['conf'], reverse=True)
-                    
-                    # Update object counts
-                    self.object_counts.clear()
-                    for obj in general_detections:
-                        obj_name = obj['name']
-                        self.object_counts[obj_name] = self.object_counts.get(obj_name, 0) + 1
-                    
-                    # Draw all detected objects
-                    color_map = {}  # Cache colors for each class
-                    import random
-                    random.seed(42)  # Consistent colors
-                    
-                    for obj in general_detections:
-                        x1, y1, x2, y2 = obj['bbox']
-                        conf = obj['conf']
-                        name = obj['name']
-                        cls = obj['cls']
-                        
-                        # Generate consistent color for each object class
-                        if cls not in color_map:
-                            color_map[cls] = (
-                                random.randint(0, 255),
-                                random.randint(0, 255),
-                                random.randint(0, 255)
-                            )
-                        color = color_map[cls]
-                        
-                        # Draw bounding box
-                        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                        
-                        # Create label
-                        label = f"{name} {conf:.2f}"
-                        
-                        # Draw label background
-                        (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                        cv2.rectangle(annotated, (x1, y1 - label_h - 12), (x1 + label_w + 10, y1), color, -1)
-                        cv2.putText(annotated, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                        
-                        # Log detection
-                        ts = datetime.now().isoformat(sep=' ', timespec='seconds')
-                        self.log.append((ts, name, "N/A", "N/A", 0))  # No priority/plate in general mode
-                    
-                    # Display object counts
-                    y_offset = 30
-                    total_objects = len(general_detections)
-                    status_text = f"Total Objects: {total_objects} | Unique Classes: {len(self.object_counts)}"
-                    cv2.putText(annotated, status_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                    cv2.putText(annotated, status_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 1)
-                    
-                    # Display top 5 detected objects
-                    y_offset += 35
-                    sorted_counts = sorted(self.object_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-                    for obj_name, count in sorted_counts:
-                        count_text = f"{obj_name}: {count}"
-                        cv2.putText(annotated, count_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                        cv2.putText(annotated, count_text, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
-                        y_offset += 30
-                    
-                    # Store and display
-                    self.last_annotated = annotated.copy()
-                    cv2.imshow("General Object Detection (80+ Classes)", annotated)
+                # Create label
+                label = f"Pedestrian {conf:.2f}"
                 
-                # =============== VEHICLE MODE (default) ===============
-                else:
-                    # Draw pedestrians if feature is enabled
-                    if self.detect_pedestrians:
-                        for ped in pedestrian_detections:
-                            x1, y1, x2, y2 = ped['bbox']
-                            conf = ped['conf']
-                            
-                            # Draw pedestrian bounding box in cyan
-                            color = (255, 255, 0)  # Cyan for pedestrians
-                            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                            
-                            # Create label
-                            label = f"Pedestrian {conf:.2f}"
-                            
-                            # Draw label background
-                            (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                            cv2.rectangle(annotated, (x1, y1 - label_h - 12), (x1 + label_w + 10, y1), color, -1)
-                            cv2.putText(annotated, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
-                    
-                    # Now draw only the nearest vehicles
-                    for vehicle in nearest_vehicles:
-                        x1, y1, x2, y2 = vehicle['bbox']
-                        conf = vehicle['conf']
-                        name = vehicle['name']
-                        priority = vehicle['priority']
-                        
-                        frame_priorities.append(priority)
-                        
-                        # Try to detect license plate (only on OCR frames to improve performance)
-                        license_plate = None
-                        if run_ocr:
-                            vehicle_id = f"{x1}_{y1}_{x2}_{y2}"  # Simple ID based on position
-                            license_plate = self.detect_license_plate(frame, x1, y1, x2, y2, vehicle_id)
-                            
-                            # Debug: Show when we're processing
-                            if license_plate:
-                                print(f"✅ Vehicle: {name}, Plate: {license_plate}")
-                        
-                        # Choose color based on priority
-                        if priority == 'HIGH':
-                            color = (0, 0, 255)  # Red for high priority
-                        elif priority == 'MEDIUM':
-                            color = (0, 165, 255)  # Orange/Yellow for medium priority
-                        else:  # LOW
-                            color = (0, 255, 0)  # Green for low priority
-                        
-                        # Draw bounding box
-                        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                        
-                        # Create label with priority and license plate
-                        if license_plate:
-                            label = f"{name} {conf:.2f} [{priority}] | Plate: {license_plate}"
-                        else:
-                            label = f"{name} {conf:.2f} [{priority}]"
-                        
-                        # Draw label background with better visibility
-                        (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-                        cv2.rectangle(annotated, (x1, y1 - label_h - 12), (x1 + label_w + 10, y1), color, -1)
-                        cv2.putText(annotated, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-
-                        # Log detection with license plate and pedestrian count
-                        ts = datetime.now().isoformat(sep=' ', timespec='seconds')
-                        self.log.append((ts, name, priority, license_plate if license_plate else "N/A", self.pedestrian_count if self.detect_pedestrians else 0))
-                    
-                    # Determine highest priority and send LED command
-                    if frame_priorities:
-                        if 'HIGH' in frame_priorities:
-                            new_priority = 'HIGH'
-                        elif 'MEDIUM' in frame_priorities:
-                            new_priority = 'MEDIUM'
-                        else:
-                            new_priority = 'LOW'
-                        
-                        # Only send command if priority changed
-                        if new_priority != self.current_priority:
-                            self.current_priority = new_priority
-                            self.send_led_command(new_priority)
-                    else:
-                        # No vehicles detected, turn off LEDs
-                        if self.current_priority != 'NONE':
-                            self.current_priority = 'NONE'
-                            self.send_led_command('NONE')
-                    
-                    # Display current priority status
-                    if self.detect_pedestrians:
-                        status_text = f"Priority: {self.current_priority} | Vehicles: {len(nearest_vehicles)}/{self.max_vehicles} | Pedestrians: {self.pedestrian_count}"
-                    else:
-                        status_text = f"Current Priority: {self.current_priority} | Tracking: {len(nearest_vehicles)}/{self.max_vehicles} vehicles"
-                    cv2.putText(annotated, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                    cv2.putText(annotated, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 1)
-
-                    # Store this annotated frame to prevent blinking
-                    self.last_annotated = annotated.copy()
-                    window_title = "Vehicle & Pedestrian Detection" if self.detect_pedestrians else "ESP32-CAM Vehicle Detection & Priority Classification"
-                    cv2.imshow(window_title, annotated)
+                # Draw label background
+                (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+                cv2.rectangle(annotated, (x1, y1 - label_h - 12), (x1 + label_w + 10, y1), color, -1)
+                cv2.putText(annotated, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2)
+        
+        # Now draw only the nearest vehicles
+        for vehicle in nearest_vehicles:
+            x1, y1, x2, y2 = vehicle['box'].tolist()
+            conf = float(vehicle['conf'])
+            name = self.class_name(vehicle['cls'])
+            priority = PRIORITY_LEVELS[vehicle['priority']]
+            track_id = int(vehicle['track_id'])
+            
+            info = self.track_info.get(track_id)
+            if info is None:
+                info = self.track_info[track_id] = {
+                    'first_seen': self.timestamp(frame_index),
+                    'track_id': track_id,
+                    'cls': int(vehicle['cls']),
+                    'name': name,
+                    'priority': priority,
+                    'plate': None,
+                    'pedestrians': self.pedestrian_count if self.detect_pedestrians else 0,
+                    'logged': False,
+                }
+            
+            # License plate: only queued when this vehicle actually needs a read
+            license_plate = self.detect_license_plate(frame, x1, y1, x2, y2, track_id, priority=priority)
+            
+            # Log each vehicle once, as soon as its plate is confirmed
+            # (vehicles that leave unconfirmed are logged by forget_tracks)
+            if license_plate and not info['logged'] and self.plate_scheduler.is_confirmed(track_id):
+                info['plate'] = license_plate
+                info['logged'] = True
+                log_entries.append(self.track_log_entry(info))
+                print(f"✅ Vehicle #{track_id}: {name}, Plate: {license_plate}")
+
+            if annotated is None:
+                continue
+            
+            # Choose color based on priority
+            if priority == 'HIGH':
+                color = (0, 0, 255)  # Red for high priority
+            elif priority == 'MEDIUM':
+                color = (0, 165, 255)  # Orange/Yellow for medium priority
+            else:  # LOW
+                color = (0, 255, 0)  # Green for low priority
+            
+            # Draw bounding box
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+            
+            # Create label with priority and license plate
+            if license_plate:
+                label = f"#{track_id} {name} {conf:.2f} [{priority}] | Plate: {license_plate}"
             else:
-                # Show last annotated frame instead of raw frame to prevent blinking
-                window_title = "Vehicle & Pedestrian Detection" if self.detect_pedestrians else "ESP32-CAM Vehicle Detection & Priority Classification"
-                if self.last_annotated is not None:
-                    cv2.imshow(window_title, self.last_annotated)
-                else:
-                    cv2.imshow(window_title, frame)
+                label = f"#{track_id} {name} {conf:.2f} [{priority}]"
             
-            key = cv2.waitKey(wait_time) & 0xFF
-            if key == ord('q'):
-                self.stop()
-                break
-            elif key == ord('e'):
-                # Export Excel on 'e' key press
-                try:
-                    filename = self.export_excel()
-                    print(f"✅ Excel exported: {filename}")
-                except Exception as e:
-                    print(f"❌ Export failed: {e}")
+            # Draw label background with better visibility
+            (label_w, label_h), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            cv2.rectangle(annotated, (x1, y1 - label_h - 12), (x1 + label_w + 10, y1), color, -1)
+            cv2.putText(annotated, label, (x1 + 5, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
 
-        self.cleanup()
+        if log_entries:
+            self.io_queue.put(('log', log_entries))
+        
+        # Determine highest priority and send LED command
+        if len(nearest_vehicles):
+            new_priority = PRIORITY_LEVELS[nearest_vehicles['priority'].max()]
+            
+            # Only send command if priority changed
+            if new_priority != self.current_priority:
+                self.current_priority = new_priority
+                self.send_led_command(new_priority)
+        else:
+            # No vehicles detected, turn off LEDs
+            if self.current_priority != 'NONE':
+                self.current_priority = 'NONE'
+                self.send_led_command('NONE')
+
+        if annotated is None:
+            return
+        
+        # Display current priority status
+        if self.detect_pedestrians:
+            status_text = f"Priority: {self.current_priority} | Vehicles: {len(nearest_vehicles)}/{self.max_vehicles} | Pedestrians: {self.pedestrian_count}"
+        else:
+            status_text = f"Current Priority: {self.current_priority} | Tracking: {len(nearest_vehicles)}/{self.max_vehicles} vehicles"
+        cv2.putText(annotated, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(annotated, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 1)
+
+    def io_stage(self, event):
+        """Log appends, off the detection path"""
+        kind, payload = event
+        if kind == 'log':
+            with self.metrics.timer('log'):
+                self.log.extend(payload)
+                if self.store_writer:
+                    self.store_writer.add(payload)
+                if self.live_stats:
+                    self.live_stats.add(payload, self.stream_id, self.class_names)
+            self.metrics.count('detections_logged', len(payload))
 
     def stop(self):
         self.running = False
 
     def cleanup(self):
-        if self.cap:
+        if self.plate_scheduler and self.use_video and self.headless:
+            # Offline: let reads already queued finish rather than lose their plates
+            self.plate_scheduler.wait_pending(timeout=30)
+        # Vehicles still in view when we stop haven't been logged yet
+        final_entries = self.forget_tracks(list(self.track_info))
+        self.log.extend(final_entries)
+        self.log.close()
+        if self.store_writer:
+            self.store_writer.add(final_entries)
+            self.store_writer.close()
+        if self.live_stats:
+            self.live_stats.add(final_entries, self.stream_id, self.class_names)
+        stats = self.log.stats()
+        print(f"Log: {stats['records']} records, {stats['bytes_written'] / 1024:.1f} KB in "
+              f"{stats['segments']} segment(s), {stats['in_memory']} in memory")
+        if self.ocr_pool:
+            stats = self.ocr_pool.stats()
+            print(f"OCR jobs: {stats['completed']} done, {stats['rejected'] + stats['dropped']} skipped, "
+                  f"avg latency {stats['avg_latency_ms']}ms, {self.plate_scheduler.ocr_calls} reads scheduled")
+            if self.owns_ocr_pool:
+                self.ocr_pool.close()
+        if self.scheduler:
+            stats = self.scheduler.stats()
+            budget = f"{stats['frame_budget_ms']}ms" if stats['frame_budget_ms'] else "no"
+            print(f"Detection: {stats['detections']}/{stats['frames']} frames, interval {stats['interval']} "
+                  f"(load {stats['load_interval']}), avg inference {stats['avg_inference_ms']}ms "
+                  f"of {budget} budget, {stats['skipped_static']} static frames skipped")
+        stages = self.metrics.snapshot()['stages']
+        if stages:
+            print("Stage timings (p50/p99 ms): " + ", ".join(
+                f"{stage} {s['p50_ms']:.1f}/{s['p99_ms']:.1f}" for stage, s in stages.items()))
+        if self.led:
+            stats = self.led.stats()
+            print(f"LED: {stats['sent']} sent, {stats['coalesced']} coalesced, {stats['suppressed']} flaps suppressed, "
+                  f"{stats['failures']} failed, avg latency {stats['avg_latency_ms']}ms")
+            self.led.close()
+        if self.grabber:
+            stats = self.grabber.stats()
+            print(f"Frames read: {stats['frames_read']}, consumed: {stats['frames_consumed']}, "
+                  f"dropped: {stats['frames_dropped']}")
+            self.grabber.release()
+            if self.connection:
+                stats = self.connection.status()
+                print(f"Stream: {stats['drops']} drops ({stats['stalls']} stalled), {stats['recoveries']} recoveries, "
+                      f"last/max recovery {stats['last_recovery_s']}/{stats['max_recovery_s']}s, "
+                      f"down {stats['downtime_s']}s")
+        elif self.cap:
             try:
                 self.cap.release()
             except Exception:
                 pass
-        cv2.destroyAllWindows()
+        if not self.headless:
+            cv2.destroyAllWindows()
+
+    def export(self, filename=None, incremental=False):
+        """Queue a background export of the log (config.EXPORT_FORMAT); returns a Future of the filename"""
+        return self.exporter.export(filename, incremental=incremental)
 
     def export_excel(self, filename=None):
-        if openpyxl is None:
-            raise RuntimeError("openpyxl not installed. Install with: pip install openpyxl")
-        if filename is None:
-            now = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"vehicle_detections_{now}.xlsx"
-
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Vehicle Detections"
-        
-        # Add headers based on pedestrian detection mode
-        if self.detect_pedestrians:
-            ws.append(("Timestamp", "Vehicle Type", "Priority", "License Plate", "Pedestrians Nearby"))
-            for ts, label, priority, plate, ped_count in list(self.log):
-                ws.append((ts, label, priority, plate, ped_count))
-        else:
-            ws.append(("Timestamp", "Vehicle Type", "Priority", "License Plate"))
-            for entry in list(self.log):
-                # Handle both old format (4 items) and new format (5 items)
-                if len(entry) == 5:
-                    ts, label, priority, plate, _ = entry
-                else:
-                    ts, label, priority, plate = entry
-                ws.append((ts, label, priority, plate))
-        
-        wb.save(filename)
-        return filename
+        """Export the whole log and wait for the file"""
+        return self.export(filename).result()
 
+    def export_in_background(self, incremental=False):
+        """Start an export and report when it's written, without blocking the caller"""
+        def report(future):
+            try:
+                print(f"✅ Exported: {future.result()}")
+            except Exception as e:
+                print(f"❌ Export failed: {e}")
+        try:
+            self.export(incremental=incremental).add_done_callback(report)
+        except Exception as e:
+            print(f"❌ Export failed: {e}")
+
+
+def led_base_url(esp_ip):
+    """ESP32 base URL from --ip (bare address or full stream URL)"""
+    if esp_ip.startswith("http"):
+        url = urlparse(esp_ip)
+        return f"{url.scheme}://{url.netloc}"
+    return f"http://{esp_ip}"
+
+
+def log_directory_name(stream_id):
+    """Filesystem-safe directory name for a camera's log"""
+    name = os.path.basename(str(stream_id).rstrip('/')) if os.path.exists(str(stream_id)) else str(stream_id)
+    return "".join(c if c.isalnum() or c in '-_.' else '_' for c in name).strip('_') or "default"
+
+
+def report_error(detector, e):
+    print(f"Error [{detector.stream_id}]:", e)
+    import traceback
+    traceback.print_exc()
+
+
+def run_detectors(detectors):
+    """Headless: each detector on its own thread; returns once every one has finished its cleanup"""
+    def run_detector(detector):
+        try:
+            detector.run()
+        except Exception as e:
+            report_error(detector, e)
 
-def start_tkinter_ui(detector: ESP32CamDetector):
+    threads = [threading.Thread(target=run_detector, args=(d,), name=f"detector-{d.stream_id}")
+               for d in detectors]
+    for t in threads:
+        t.start()
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(0.5)
+    finally:
+        # Also on Ctrl+C: let every detector flush its log and store before the shared engine goes away
+        for detector in detectors:
+            detector.stop()
+        for t in threads:
+            t.join()
+
+
+def run_windows(detectors):
+    """
+    Several sources with windows: the pipelines run on their own threads, but
+    every imshow/waitKey happens here on the main thread (HighGUI requirement).
+    'q' stops all sources, 'e'/'i' export every log.
+    """
+    def start(detector):
+        try:
+            detector.prepare()
+            detector.start_display()
+            return True
+        except Exception as e:
+            report_error(detector, e)
+            return False
+
+    with ThreadPoolExecutor(max_workers=len(detectors)) as pool:  # Cameras connect in parallel
+        started = [d for d, ok in zip(detectors, pool.map(start, detectors)) if ok]
+    due = [0.0] * len(started)  # Video files play at their own frame rate
+    try:
+        while any(d.running for d in started):
+            for i, detector in enumerate(started):
+                if detector.running and time.monotonic() >= due[i] and detector.render_next(timeout=0):
+                    due[i] = time.monotonic() + detector.wait_time / 1000.0
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                for detector in started:
+                    detector.stop()
+            elif key in (ord('e'), ord('i')):
+                for detector in started:
+                    detector.handle_key(key)
+    finally:
+        for detector in started:
+            detector.stop()
+        for detector in started:
+            try:
+                detector.finish_display()
+            except Exception as e:
+                report_error(detector, e)  # Still flush the others
+
+
+def start_tkinter_ui(detectors):
     if tk is None:
         print("Tkinter not available. Install or run without GUI to export manually.")
         return
+    if isinstance(detectors, ESP32CamDetector):
+        detectors = [detectors]
 
     root = tk.Tk()
     root.title("ESP32-CAM Detection Controls")
 
-    def on_generate():
+    def on_generate(incremental=False):
+        # Exports run on the detectors' export threads; poll so the UI never blocks
         try:
-            filename = detector.export_excel()
-            messagebox.showinfo("Excel Generated", f"Saved: {filename}")
+            futures = [detector.export(incremental=incremental) for detector in detectors]
         except Exception as e:
             messagebox.showerror("Error", str(e))
+            return
+
+        def check():
+            if not all(f.done() for f in futures):
+                root.after(200, check)
+                return
+            try:
+                filenames = [f.result() for f in futures]
+                messagebox.showinfo("Export Generated", "Saved: " + ", ".join(filenames))
+            except Exception as e:
+                messagebox.showerror("Error", str(e))
+        check()
 
     btn = tk.Button(root, text="Generate Excel", command=on_generate, width=20, height=2)
     btn.pack(padx=10, pady=10)
+    btn_new = tk.Button(root, text="Export New Rows", command=lambda: on_generate(incremental=True), width=20, height=2)
+    btn_new.pack(padx=10, pady=(0, 10))
 
     def on_close():
-        detector.stop()
+        for detector in detectors:
+            detector.stop()
         root.destroy()
 
     root.protocol("WM_DELETE_WINDOW", on_close)
@@ -757,20 +1104,52 @@ Examples:
   python new.py --ip http://192.168.1.100:8080/video --pedestrians
   
   # Performance optimization:
-  python new.py --video traffic.mp4 --scale 0.5         # Faster, lower quality
-  python new.py --video traffic.mp4 --scale 1.0         # Best quality, slower
+  python new.py --video traffic.mp4 --scale 0.5         # Faster, lower quality (320px model input)
+  python new.py --video traffic.mp4 --scale 1.0         # Best quality, slower (640px model input)
   
   # General objects WITH pedestrian tracking:
   python new.py --video scene.mp4 --general-objects --pedestrians
+  
+  # CPU inference through ONNX Runtime / OpenVINO (exported once, cached in model_cache/):
+  python new.py --video traffic.mp4 --backend onnx
+  python new.py --video traffic.mp4 --backend onnx --int8 --threads 4
+  python new.py --ip 192.168.1.50 --backend openvino
+  
+  # Several cameras sharing one YOLO model (batched inference):
+  python new.py --ip 192.168.1.50 192.168.1.51 192.168.1.52
+  python new.py --ip 192.168.1.50 192.168.1.51 --batch-size 4 --batch-wait-ms 15
+  
+  # Headless (servers without a display; video runs as fast as possible, Ctrl+C/SIGTERM to stop):
+  python new.py --video traffic.mp4 --headless
+  python new.py --ip 192.168.1.50 --headless
+  
+  # Offline batch processing (each file once, split across all CPU cores, merged log in frame order):
+  python new.py --batch --video traffic.mp4
+  python new.py --batch --video recordings/ --workers 4 --output archive.xlsx
+  python new.py --batch --video "recordings/2024-*.mp4" --chunk-frames 6000
         """,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.add_argument("--ip", help="Camera IP address or full stream URL (supports ESP32-CAM, IP Webcam, DroidCam, RTSP, etc.)")
+    parser.add_argument("--ip", nargs="+", help="Camera IP address(es) or full stream URL(s) (supports ESP32-CAM, IP Webcam, DroidCam, RTSP, etc.)")
     parser.add_argument("--stream-path", default="/stream", help="Stream path for ESP32-CAM (default: /stream, not used for full URLs)")
-    parser.add_argument("--video", help="Path to video file for offline processing (alternative to --ip)")
-    parser.add_argument("--scale", type=float, default=0.75, help="Processing scale factor (0.5-1.0, lower=faster, default=0.75)")
+    parser.add_argument("--video", nargs="+", help="Path(s) to video file(s) for offline processing (alternative to --ip)")
+    parser.add_argument("--scale", type=float, default=1.0, help=f"Model input size as a fraction of {config.INFERENCE_IMAGE_SIZE}px (0.5-1.0, lower=faster, default=1.0)")
     parser.add_argument("--pedestrians", action="store_true", help="Enable pedestrian detection (detects people in the frame)")
     parser.add_argument("--general-objects", action="store_true", help="Enable general object detection mode (detects 80+ COCO classes instead of vehicle-only)")
+    parser.add_argument("--batch-size", type=int, default=config.INFERENCE_MAX_BATCH, help=f"Max frames per batched forward pass when running several sources (default={config.INFERENCE_MAX_BATCH})")
+    parser.add_argument("--batch-wait-ms", type=float, default=config.INFERENCE_MAX_WAIT_MS, help=f"Max time a frame waits for its batch to fill (default={config.INFERENCE_MAX_WAIT_MS}ms)")
+    parser.add_argument("--backend", choices=BACKENDS, default=config.INFERENCE_BACKEND, help=f"Inference backend (default={config.INFERENCE_BACKEND}). onnx/openvino fall back to torch if unavailable")
+    parser.add_argument("--int8", action="store_true", default=config.INFERENCE_INT8, help="Use an INT8-quantised ONNX model (onnx/openvino backends)")
+    parser.add_argument("--threads", type=int, default=config.INFERENCE_INTRA_OP_THREADS, help="CPU threads per inference call for onnx/openvino (0 = auto)")
+    parser.add_argument("--headless", action="store_true", help="No video window or Tkinter UI; video files run unthrottled and stop at the end")
+    parser.add_argument("--batch", action="store_true", help="Offline batch mode: process each --video file (or directory/glob) once across a process pool")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS, help="Batch mode worker processes, each with its own model (0 = one per CPU core)")
+    parser.add_argument("--chunk-frames", type=int, default=config.BATCH_CHUNK_FRAMES, help=f"Batch mode frames per chunk (default={config.BATCH_CHUNK_FRAMES})")
+    parser.add_argument("--restream-port", type=int, default=config.RESTREAM_PORT if config.RESTREAM_ENABLED else 0, help=f"Serve the annotated video as MJPEG on this port (0 = off, default={config.RESTREAM_PORT if config.RESTREAM_ENABLED else 0})")
+    parser.add_argument("--restream-host", default=config.RESTREAM_HOST, help=f"Re-stream bind address (default={config.RESTREAM_HOST}; 0.0.0.0 exposes the unauthenticated stream to the network)")
+    parser.add_argument("--metrics-port", type=int, default=config.METRICS_PORT if config.METRICS_ENABLED else 0, help=f"Serve Prometheus metrics at /metrics on this port (0 = off, default={config.METRICS_PORT if config.METRICS_ENABLED else 0})")
+    parser.add_argument("--metrics-host", default=config.METRICS_HOST, help=f"Metrics bind address (default={config.METRICS_HOST}; 0.0.0.0 lets other machines scrape it)")
+    parser.add_argument("--output", help="Batch mode Excel file for the merged log (default: batch_detections_<time>.xlsx)")
     args = parser.parse_args()
 
     # Validate input
@@ -795,19 +1174,57 @@ Examples:
     
     # Validate scale
     if args.scale <= 0 or args.scale > 1.0:
-        print("Warning: Scale must be between 0.1 and 1.0. Using default 0.75")
-        args.scale = 0.75
-
-    detector = ESP32CamDetector(
-        esp_ip=args.ip,
-        stream_path=args.stream_path,
-        video_path=args.video,
-        process_scale=args.scale,
-        detect_pedestrians=args.pedestrians,
-        general_mode=args.general_objects
-    )
+        print("Warning: Scale must be between 0.1 and 1.0. Using default 1.0")
+        args.scale = 1.0
+
+    backend_options = {'imgsz': model_input_size(args.scale), 'int8': args.int8, 'intra_threads': args.threads}
+
+    if args.batch:
+        if not args.video or args.ip:
+            print("Error: --batch works on --video files, directories or globs only")
+            sys.exit(1)
+        from batch import run_batch
+        try:
+            result = run_batch(args.video, workers=args.workers, chunk_frames=args.chunk_frames, output=args.output,
+                               process_scale=args.scale, detect_pedestrians=args.pedestrians,
+                               general_mode=args.general_objects, backend=args.backend,
+                               backend_options=backend_options)
+        except Exception as e:
+            print("Error:", e)
+            sys.exit(1)
+        if result['failed']:
+            sys.exit(1)  # Partial results were written, but the run wasn't complete
+        return
+
+    # One detector per source; several sources share one batched model
+    sources = [('ip', ip) for ip in (args.ip or [])] + [('video', path) for path in (args.video or [])]
+    engine = None
+    if len(sources) > 1:
+        engine = BatchInferenceEngine(max_batch=args.batch_size, max_wait_ms=args.batch_wait_ms,
+                                      backend=args.backend, backend_options=backend_options)
+
+    # Running totals and recent detections, published to shared memory for api.py
+    live_stats = LiveStats()
+    detectors = []
+    for kind, source in sources:
+        detectors.append(ESP32CamDetector(
+            esp_ip=source if kind == 'ip' else None,
+            stream_path=args.stream_path,
+            video_path=source if kind == 'video' else None,
+            process_scale=args.scale,
+            detect_pedestrians=args.pedestrians,
+            general_mode=args.general_objects,
+            engine=engine,
+            backend=args.backend,
+            backend_options=backend_options,
+            headless=args.headless,
+            live_stats=live_stats
+        ))
     
-    print(f"Processing at {args.scale*100:.0f}% resolution for better performance")
+    print(f"Processing at {backend_options['imgsz']}x{backend_options['imgsz']} model input ({args.scale*100:.0f}%)")
+    if engine is not None:
+        print(f"📡 {len(detectors)} sources sharing one model (batch size {engine.max_batch}, "
+              f"max wait {args.batch_wait_ms:.0f}ms)")
     
     # Display mode information
     if args.general_objects:
@@ -822,17 +1239,78 @@ Examples:
     else:
         print("� Add --pedestrians flag to enable pedestrian tracking")
 
-    # start tkinter UI in separate thread
-    ui_thread = threading.Thread(target=start_tkinter_ui, args=(detector,), daemon=True)
-    ui_thread.start()
+    # Annotated MJPEG re-stream: encoded once per frame and shared by every viewer
+    restream = None
+    if args.restream_port:
+        broadcasters = {}
+        for detector in detectors:
+            broadcaster = MjpegBroadcaster()
+            detector.frame_sinks.append(broadcaster)
+            broadcasters[str(detector.stream_id)] = broadcaster
+        try:
+            restream = RestreamServer(broadcasters, host=args.restream_host, port=args.restream_port).start()
+            print(f"📺 Annotated stream: http://localhost:{restream.port}/stream "
+                  f"(max {config.RESTREAM_MAX_FPS} FPS, encoded only while someone watches)")
+        except OSError as e:
+            print(f"⚠️ Re-stream disabled, can't listen on port {args.restream_port}: {e}")
+            for detector in detectors:
+                detector.frame_sinks.clear()
+
+    # Prometheus scrape endpoint: stage timings and counters for every detector in this process
+    metrics_server = None
+    if args.metrics_port:
+        try:
+            metrics_server = MetricsServer(host=args.metrics_host, port=args.metrics_port).start()
+            print(f"📈 Metrics: http://localhost:{metrics_server.port}/metrics")
+        except OSError as e:
+            print(f"⚠️ Metrics endpoint disabled, can't listen on port {args.metrics_port}: {e}")
+
+    if args.headless:
+        # No 'q' key without a window: stop cleanly on Ctrl+C / SIGTERM instead
+        def handle_signal(signum, frame):
+            print(f"\nReceived {signal.Signals(signum).name}, shutting down...")
+            for detector in detectors:
+                detector.stop()
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+    else:
+        # start tkinter UI in separate thread
+        ui_thread = threading.Thread(target=start_tkinter_ui, args=(detectors,), daemon=True)
+        ui_thread.start()
+
+    if len(detectors) == 1:
+        try:
+            detectors[0].run()
+        except Exception as e:
+            print("Error:", e)
+            import traceback
+            traceback.print_exc()
+            sys.exit(1)
+        finally:
+            live_stats.close()
+            if restream:
+                restream.close()
+            if metrics_server:
+                metrics_server.close()
+        return
 
     try:
-        detector.run()
-    except Exception as e:
-        print("Error:", e)
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
+        if args.headless:
+            run_detectors(detectors)
+        else:
+            run_windows(detectors)
+    finally:
+        stats = engine.stats()
+        print(f"Batches: {stats['batches']}, avg batch size: {stats['avg_batch_size']} "
+              f"(occupancy {stats['batch_occupancy']:.0%})")
+        for stream_id, s in stats['streams'].items():
+            print(f"  {stream_id}: {s['frames']} frames, avg latency {s['avg_latency_ms']}ms")
+        engine.close()
+        live_stats.close()
+        if restream:
+            restream.close()
+        if metrics_server:
+            metrics_server.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+"""
+Producer/consumer pipeline for the ESP32-CAM detection system
+
+Each stage runs on its own worker thread and talks to the next one through a
+bounded queue. When a queue is full the backpressure policy decides what
+happens:
+
+  - 'block':        the producer waits (video files: every frame is processed)
+  - 'drop_oldest':  the oldest queued item is discarded (live streams: stay current)
+  - 'drop_newest':  the new item is discarded
+
+Every queue and stage keeps its own metrics (depth, drops, service time) so a
+slow stage is easy to spot.
+"""
+import threading
+import time
+from collections import deque
+
+QUEUE_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+
+class BoundedQueue:
+    """Thread-safe FIFO with a fixed capacity and a backpressure policy"""
+
+    def __init__(self, maxsize=2, policy='block', name=None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy '{policy}'. Options: {', '.join(QUEUE_POLICIES)}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.name = name
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+
+        # Metrics
+        self.put_count = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def put(self, item, timeout=None):
+        """
+        Add an item, applying the backpressure policy when full
+
+        Returns:
+            True if the item was queued, False if it was dropped
+        """
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                if self.policy == 'drop_newest':
+                    self.dropped += 1
+                    return False
+                if self.policy == 'drop_oldest':
+                    self.items.popleft()
+                    self.dropped += 1
+                else:
+                    deadline = None if timeout is None else time.monotonic() + timeout
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.dropped += 1
+                            return False
+                        self.cond.wait(0.1 if remaining is None else min(remaining, 0.1))
+                    if self.closed:
+                        return False
+            self.items.append(item)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self.items))
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, or None if nothing arrived in time"""
+        with self.cond:
+            if not self.items:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        """Wake up anyone blocked on this queue"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+    def stats(self):
+        return {
+            'depth': len(self.items),
+            'max_depth': self.max_depth,
+            'capacity': self.maxsize,
+            'policy': self.policy,
+            'queued': self.put_count,
+            'dropped': self.dropped,
+        }
+
+
+class Stage:
+    """
+    One pipeline worker
+
+    Args:
+        name: Stage name used in thread names and metrics
+        func: Called with each input item (or with no arguments for a source stage).
+              Whatever it returns (other than None) is pushed to out_queue.
+        in_queue: BoundedQueue to read from (None = source stage)
+        out_queue: BoundedQueue to write results to (None = sink stage)
+    """
+
+    def __init__(self, name, func, in_queue=None, out_queue=None):
+        self.name = name
+        self.func = func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.thread = None
+        self.running = False
+        self.busy = False  # True while func is running on an item
+
+        # Metrics
+        self.processed = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.last_service = 0.0
+        self.max_service = 0.0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name=f"stage-{self.name}", daemon=True)
+        self.thread.start()
+        return self
+
+    def _loop(self):
+        while self.running:
+            if self.in_queue is not None:
+                item = self.in_queue.get(timeout=0.1)
+                if item is None:
+                    continue
+            self.busy = True
+            start = time.perf_counter()
+            try:
+                result = self.func(item) if self.in_queue is not None else self.func()
+            except Exception as e:
+                self.errors += 1
+                self.busy = False
+                print(f"⚠️ Pipeline stage '{self.name}' error: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            self.processed += 1
+            self.busy_time += elapsed
+            self.last_service = elapsed
+            self.max_service = max(self.max_service, elapsed)
+
+            if result is not None and self.out_queue is not None:
+                self.out_queue.put(result)
+            self.busy = False
+
+    def stop(self):
+        self.running = False
+
+    def join(self, timeout=2):
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+
+    def stats(self):
+        avg = self.busy_time / self.processed if self.processed else 0.0
+        return {
+            'processed': self.processed,
+            'errors': self.errors,
+            'avg_service_ms': round(avg * 1000, 2),
+            'last_service_ms': round(self.last_service * 1000, 2),
+            'max_service_ms': round(self.max_service * 1000, 2),
+            'queue': self.in_queue.stats() if self.in_queue is not None else None,
+        }
+
+
+class Pipeline:
+    """A set of stages started and stopped together"""
+
+    def __init__(self):
+        self.stages = []
+        self.queues = []
+
+    def queue(self, name, maxsize=2, policy='block'):
+        q = BoundedQueue(maxsize=maxsize, policy=policy, name=name)
+        self.queues.append(q)
+        return q
+
+    def add(self, name, func, in_queue=None, out_queue=None):
+        stage = Stage(name, func, in_queue=in_queue, out_queue=out_queue)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def idle(self):
+        return all(len(q) == 0 for q in self.queues) and not any(s.busy for s in self.stages)
+
+    def drain(self, timeout=None, pump=None):
+        """
+        Stop the source stages and wait for everything already read to finish
+
+        Args:
+            timeout: Give up after this many seconds
+            pump: Called while waiting, for a caller that consumes the last
+                queue itself (otherwise it fills up and the pipeline never empties)
+
+        Returns:
+            True if the pipeline emptied, False if timeout expired first
+        """
+        for stage in self.stages:
+            if stage.in_queue is None:
+                stage.stop()
+        for stage in self.stages:
+            if stage.in_queue is None:
+                stage.join()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        idle_checks = 0
+        # Idle twice in a row, so an item between get() and busy=True isn't missed
+        while idle_checks < 2:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            if pump is not None:
+                pump()
+            else:
+                time.sleep(0.05)
+            idle_checks = idle_checks + 1 if self.idle() else 0
+        return True
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+        for q in self.queues:
+            q.close()
+        for stage in self.stages:
+            stage.join()
+
+    def stats(self):
+        """Per-stage service time and queue depth"""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def summary(self):
+        lines = []
+        for name, s in self.stats().items():
+            line = f"  {name:<10} processed={s['processed']:<7} avg={s['avg_service_ms']}ms max={s['max_service_ms']}ms"
+            if s['queue'] is not None:
+                q = s['queue']
+                line += f" queue={q['depth']}/{q['capacity']} ({q['policy']}) dropped={q['dropped']}"
+            lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,444 @@
+"""
+License plate OCR worker pool for the ESP32-CAM detection system
+
+EasyOCR holds the GIL for most of a readtext() call, so running it on a thread
+still freezes the detection loop. Plate ROIs are instead sent to a pool of
+worker processes, each with its own EasyOCR reader. Jobs wait in a bounded
+priority queue (HIGH-priority vehicles first) and every submission returns a
+Future that the detector checks on later frames.
+"""
+import heapq
+import itertools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, wait
+
+import cv2
+
+import config
+
+try:
+    import easyocr
+except Exception:
+    easyocr = None
+
+
+# Lower rank = read first
+PRIORITY_RANK = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
+
+# Set in each worker process by _init_worker()
+_reader = None
+
+
+def preprocess_plate_roi(plate_roi):
+    """Preprocess image region for better OCR accuracy"""
+    try:
+        # Convert to grayscale
+        gray = cv2.cvtColor(plate_roi, cv2.COLOR_BGR2GRAY)
+
+        # Apply bilateral filter to reduce noise
+        denoised = cv2.bilateralFilter(gray, 11, 17, 17)
+
+        # Apply adaptive thresholding
+        thresh = cv2.adaptiveThreshold(
+            denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY, 11, 2
+        )
+
+        # Resize if too small (minimum height 50px for better OCR)
+        height, width = thresh.shape
+        if height < 50:
+            scale = 50 / height
+            new_width = int(width * scale)
+            thresh = cv2.resize(thresh, (new_width, 50), interpolation=cv2.INTER_CUBIC)
+
+        return thresh
+    except Exception:
+        return plate_roi
+
+
+def extract_plate_roi(frame, x1, y1, x2, y2, pad=10):
+    """
+    Crop the part of a vehicle box where the plate usually is
+
+    Returns:
+        A small contiguous copy of the lower 40% of the padded vehicle box,
+        or None if the box is too small to read
+    """
+    height, width = frame.shape[:2]
+    y1_pad = max(0, y1 - pad)
+    y2_pad = min(height, y2 + pad)
+    x1_pad = max(0, x1 - pad)
+    x2_pad = min(width, x2 + pad)
+
+    vehicle_roi = frame[y1_pad:y2_pad, x1_pad:x2_pad]
+
+    if vehicle_roi.size == 0 or vehicle_roi.shape[0] < 20 or vehicle_roi.shape[1] < 20:
+        return None
+
+    # Focus on lower 40% of vehicle (where plates typically are)
+    roi_height = vehicle_roi.shape[0]
+    lower_region = vehicle_roi[int(roi_height * 0.6):, :]
+
+    if lower_region.size == 0:
+        lower_region = vehicle_roi
+
+    # Copy so only the crop (not the whole frame) is sent to the worker
+    return lower_region.copy()
+
+
+def parse_plate_results(results):
+    """
+    Pick the best plate-like string from EasyOCR output
+
+    Returns:
+        (plate_text, confidence), or (None, 0.0) if nothing looks like a plate
+    """
+    best_plate = None
+    best_confidence = 0.0
+
+    for (bbox, text, confidence) in results:
+        # Lower confidence threshold and more lenient validation
+        if confidence > 0.3:  # Lowered from 0.4
+            # Clean the text (remove spaces, special chars except hyphens)
+            cleaned_text = ''.join(c for c in text if c.isalnum() or c == '-')
+
+            # More lenient: 3-12 chars, can be all numbers or all letters
+            if 3 <= len(cleaned_text) <= 12:
+                # Accept if it has numbers OR letters (not necessarily both)
+                has_letter = any(c.isalpha() for c in cleaned_text)
+                has_number = any(c.isdigit() for c in cleaned_text)
+
+                # Accept any text with letters or numbers
+                if (has_letter or has_number) and confidence > best_confidence:
+                    best_plate = cleaned_text.upper()
+                    best_confidence = float(confidence)
+
+    return best_plate, best_confidence
+
+
+def _init_worker(languages, gpu):
+    """Load one EasyOCR reader per worker process"""
+    global _reader
+    _reader = easyocr.Reader(languages, gpu=gpu, verbose=False)
+
+
+def _read_plate(roi):
+    """Worker-side job: preprocess + OCR one plate ROI"""
+    processed = preprocess_plate_roi(roi)
+    results = _reader.readtext(processed, detail=1, paragraph=False)
+    if not results:
+        return None, 0.0
+    plate, confidence = parse_plate_results(results)
+    if plate:
+        print(f"🔍 Detected plate: {plate} (confidence: {confidence:.2f})")
+    return plate, confidence
+
+
+class PlateOCRPool:
+    """
+    Process pool that reads license plates asynchronously
+
+    Args:
+        workers: Number of OCR processes (each loads its own EasyOCR model)
+        max_pending: Capacity of the waiting queue; when full, the lowest-priority
+                     job is dropped (or the new one is rejected if it ranks lowest)
+        languages: EasyOCR languages
+        gpu: Let EasyOCR use CUDA
+    """
+
+    def __init__(self, workers=None, max_pending=None, languages=('en',), gpu=None):
+        if easyocr is None:
+            raise RuntimeError("EasyOCR not installed. Install with: pip install easyocr")
+        self.workers = max(1, int(workers or config.OCR_WORKERS))
+        self.max_pending = max(1, int(max_pending or config.OCR_QUEUE_SIZE))
+        gpu = config.USE_GPU if gpu is None else gpu
+
+        # spawn: the detector process already runs threads and torch
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(list(languages), gpu)
+        )
+        self.pending = []  # heap of (rank, seq, roi, future, submitted_at)
+        self.seq = itertools.count()
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.running = True
+        self.dispatcher = threading.Thread(target=self._dispatch, name="ocr-dispatch", daemon=True)
+        self.dispatcher.start()
+        self.metrics = None  # Metrics for per-read 'ocr' latency (set by the owning detector)
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.total_wait = 0.0
+        self.max_latency = 0.0
+
+    def submit(self, roi, priority='LOW'):
+        """
+        Queue a plate ROI for OCR
+
+        Returns:
+            Future resolving to (plate_text, confidence), or None if the queue
+            is full of more important work
+        """
+        future = Future()
+        rank = PRIORITY_RANK.get(priority, len(PRIORITY_RANK))
+        with self.cond:
+            if len(self.pending) >= self.max_pending:
+                # Evict the least important waiting job, if it's less important than this one
+                worst = max(self.pending)
+                if worst[0] <= rank:
+                    self.rejected += 1
+                    return None
+                self.pending.remove(worst)
+                heapq.heapify(self.pending)
+                worst[3].cancel()
+                self.dropped += 1
+            heapq.heappush(self.pending, (rank, next(self.seq), roi, future, time.perf_counter()))
+            self.submitted += 1
+            self.cond.notify_all()
+        return future
+
+    def _dispatch(self):
+        """Feed the process pool from the priority queue, one job per free worker"""
+        while True:
+            with self.cond:
+                while self.running and (not self.pending or self.in_flight >= self.workers):
+                    self.cond.wait(0.5)
+                if not self.running:
+                    return
+                _, _, roi, future, submitted_at = heapq.heappop(self.pending)
+                self.in_flight += 1
+
+            if not future.set_running_or_notify_cancel():
+                with self.cond:
+                    self.in_flight -= 1
+                continue
+
+            started_at = time.perf_counter()
+            try:
+                job = self.executor.submit(_read_plate, roi)
+            except Exception as e:
+                with self.cond:
+                    self.in_flight -= 1
+                    self.failed += 1
+                future.set_exception(e)
+                continue
+            job.add_done_callback(lambda job, f=future, s=submitted_at, t=started_at: self._finish(job, f, s, t))
+
+    def _finish(self, job, future, submitted_at, started_at):
+        latency = time.perf_counter() - submitted_at
+        error = CancelledError() if job.cancelled() else job.exception()
+        with self.cond:
+            self.in_flight -= 1
+            self.total_wait += started_at - submitted_at
+            if error is None:
+                self.completed += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            else:
+                self.failed += 1
+            self.cond.notify_all()
+        if self.metrics is not None:
+            self.metrics.observe('ocr', latency)
+            self.metrics.count('ocr_reads' if error is None else 'ocr_failures')
+        if error is None:
+            future.set_result(job.result())
+        else:
+            future.set_exception(error)
+
+    def stats(self):
+        """Per-job latency and queue metrics"""
+        with self.cond:
+            done = self.completed or 1
+            return {
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+                'dropped': self.dropped,
+                'pending': len(self.pending),
+                'in_flight': self.in_flight,
+                'avg_latency_ms': round(self.total_latency / done * 1000, 2),
+                'avg_queue_wait_ms': round(self.total_wait / done * 1000, 2),
+                'max_latency_ms': round(self.max_latency * 1000, 2),
+            }
+
+    def close(self):
+        with self.cond:
+            self.running = False
+            for _, _, _, future, _ in self.pending:
+                future.cancel()
+            self.pending = []
+            self.cond.notify_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Per-vehicle OCR states
+UNREAD = 'unread'            # Never sent to OCR
+PENDING = 'pending'          # A read is in flight
+LOW_CONFIDENCE = 'low_conf'  # Read, but not trusted yet - re-read if a better crop shows up
+CONFIRMED = 'confirmed'      # Done, never read again
+
+
+def crop_quality(roi):
+    """Score a plate crop: bigger and sharper is better (area x Laplacian variance)"""
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if roi.ndim == 3 else roi
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    return float(roi.shape[0] * roi.shape[1]) * (1.0 + sharpness)
+
+
+class PlateTrackState:
+    """OCR bookkeeping for one tracked vehicle"""
+
+    def __init__(self):
+        self.state = UNREAD
+        self.best_roi = None
+        self.best_score = 0.0
+        self.submitted_score = 0.0
+        self.future = None
+        self.reads = 0
+        self.votes = {}  # plate text -> summed confidence
+        self.vote_counts = {}  # plate text -> number of reads
+
+    @property
+    def plate(self):
+        """Best plate so far by confidence-weighted vote"""
+        if not self.votes:
+            return None
+        return max(self.votes, key=self.votes.get)
+
+
+class PlateScheduler:
+    """
+    Decides which tracked vehicles need OCR and combines their reads
+
+    Each vehicle is read once. If the read isn't trusted (confidence below
+    confirm_confidence) it is re-read only when a clearly better crop arrives,
+    and the reads are combined by confidence-weighted voting until one text
+    collects confirm_votes reads or a trusted confidence. OCR work therefore
+    scales with the number of new vehicles, not with the frame rate.
+
+    Args:
+        pool: PlateOCRPool used for the actual reads
+        confirm_confidence: A single read at or above this confirms the plate
+        confirm_votes: Number of agreeing reads that confirm the plate
+        max_reads: Give up re-reading a vehicle after this many reads
+        min_improvement: A re-read needs a crop this much better than the last one sent
+    """
+
+    def __init__(self, pool, confirm_confidence=None, confirm_votes=None, max_reads=None, min_improvement=1.3):
+        self.pool = pool
+        self.confirm_confidence = confirm_confidence or config.OCR_CONFIRM_CONFIDENCE
+        self.confirm_votes = confirm_votes or config.OCR_CONFIRM_VOTES
+        self.max_reads = max_reads or config.OCR_MAX_READS_PER_VEHICLE
+        self.min_improvement = min_improvement
+        self.tracks = {}
+        self.ocr_calls = 0
+
+    def observe(self, track_id, frame, bbox, priority='LOW'):
+        """
+        Update a vehicle with this frame's crop and queue OCR if it needs one
+
+        Returns:
+            Best plate text so far, or None
+        """
+        track = self.tracks.get(track_id)
+        if track is None:
+            track = self.tracks[track_id] = PlateTrackState()
+
+        if track.state == PENDING and track.future.done():
+            self._collect(track)
+
+        if track.state == CONFIRMED:
+            return track.plate
+
+        # Remember the best crop seen so far
+        roi = extract_plate_roi(frame, *bbox)
+        if roi is not None:
+            score = crop_quality(roi)
+            if score > track.best_score:
+                track.best_roi = roi
+                track.best_score = score
+
+        if self._needs_read(track):
+            future = self.pool.submit(track.best_roi, priority)
+            if future is not None:
+                track.future = future
+                track.submitted_score = track.best_score
+                track.state = PENDING
+                self.ocr_calls += 1
+
+        return track.plate
+
+    def _needs_read(self, track):
+        if track.best_roi is None or track.state == PENDING or track.reads >= self.max_reads:
+            return False
+        if track.state == UNREAD:
+            return True
+        return track.best_score >= track.submitted_score * self.min_improvement
+
+    def _collect(self, track):
+        """Fold a finished read into the vote"""
+        future, track.future = track.future, None
+        try:
+            plate, confidence = future.result()
+        except CancelledError:
+            # Evicted from the pool's queue by more urgent work: not a read, so retry on the next crop
+            track.state = UNREAD
+            return
+        except Exception as e:
+            # Print errors for debugging
+            print(f"⚠️ OCR error: {e}")
+            plate, confidence = None, 0.0
+        track.reads += 1
+
+        if plate:
+            track.votes[plate] = track.votes.get(plate, 0.0) + confidence
+            track.vote_counts[plate] = track.vote_counts.get(plate, 0) + 1
+            if confidence >= self.confirm_confidence or track.vote_counts[plate] >= self.confirm_votes:
+                track.state = CONFIRMED
+                track.best_roi = None  # Not needed any more
+                return
+        track.state = LOW_CONFIDENCE
+
+    def is_confirmed(self, track_id):
+        track = self.tracks.get(track_id)
+        return track is not None and track.state == CONFIRMED
+
+    def wait_pending(self, timeout=None):
+        """Block until every in-flight read has finished (offline runs, before the final forget)"""
+        futures = [t.future for t in self.tracks.values() if t.state == PENDING]
+        if futures:
+            wait(futures, timeout=timeout)
+
+    def forget(self, track_id):
+        """
+        Drop a vehicle that left the scene
+
+        Returns:
+            Best plate guess for it, or None
+        """
+        track = self.tracks.pop(track_id, None)
+        if track is None:
+            return None
+        if track.state == PENDING:
+            if track.future.done():
+                self._collect(track)
+            else:
+                track.future.cancel()
+        return track.plate
+
+    def stats(self):
+        counts = {UNREAD: 0, PENDING: 0, LOW_CONFIDENCE: 0, CONFIRMED: 0}
+        for track in self.tracks.values():
+            counts[track.state] += 1
+        return {'ocr_calls': self.ocr_calls, 'vehicles': len(self.tracks), 'states': counts}
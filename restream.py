@@ -0,0 +1,264 @@
+"""
+Annotated MJPEG re-stream for the ESP32-CAM detection system
+
+Lets a browser (or the dashboard's LiveFeed) watch the annotated output
+without cv2.imshow, which is what headless deployments need. Each detector
+gets an MjpegBroadcaster as a frame sink:
+
+  - Frames are only kept while someone is watching; with no viewers a frame
+    costs one attribute check (and headless detectors skip drawing altogether)
+  - At most config.RESTREAM_MAX_FPS frames per second are published
+  - Each published frame is JPEG-encoded once per (width, quality) variant, by
+    whichever viewer asks first; every other viewer of that variant gets the
+    same bytes
+
+RestreamServer serves the broadcasters over HTTP (stdlib only):
+
+    GET /                  JSON list of streams
+    GET /stream            first stream   (?width=640&quality=70)
+    GET /stream/<n|id>     n-th stream, or by stream id
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import cv2
+
+import config
+
+BOUNDARY = "frame"
+MAX_VARIANTS = 8  # distinct (width, quality) encodings kept per stream
+
+
+class _Variant:
+    """Latest encoding of one (width, quality) combination"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = -1
+        self.jpeg = None
+
+
+class MjpegBroadcaster:
+    """
+    Frame sink that shares JPEG-encoded annotated frames with any number of viewers
+
+    Args:
+        max_fps: Published frames per second (default config.RESTREAM_MAX_FPS)
+        quality: Default JPEG quality (default config.RESTREAM_JPEG_QUALITY)
+    """
+
+    def __init__(self, max_fps=None, quality=None):
+        self.min_interval = 1.0 / (max_fps or config.RESTREAM_MAX_FPS)
+        self.quality = quality or config.RESTREAM_JPEG_QUALITY
+        self.condition = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.last_publish = 0.0
+        self.viewers = 0
+        self.variants = {}
+        self.variants_lock = threading.Lock()
+
+        # Metrics
+        self.frames_published = 0
+        self.frames_skipped = 0  # over max_fps
+        self.encodes = 0
+        self.frames_sent = 0
+
+    @property
+    def active(self):
+        """Whether anyone is watching (detectors skip drawing for idle sinks in headless mode)"""
+        return self.viewers > 0
+
+    def __call__(self, frame):
+        if not self.viewers:
+            return
+        now = time.monotonic()
+        if now - self.last_publish < self.min_interval:
+            self.frames_skipped += 1
+            return
+        self.last_publish = now
+        # Annotated frames are never drawn on again once rendered, so no copy
+        with self.condition:
+            self.frame = frame
+            self.seq += 1
+            self.frames_published += 1
+            self.condition.notify_all()
+
+    def _variant(self, width, quality):
+        key = (width, quality)
+        with self.variants_lock:
+            variant = self.variants.get(key)
+            if variant is None:
+                if len(self.variants) >= MAX_VARIANTS:
+                    stale = min(self.variants, key=lambda k: self.variants[k].seq)
+                    del self.variants[stale]
+                variant = self.variants[key] = _Variant()
+            return variant
+
+    def encoded(self, seq, frame, width=None, quality=None):
+        """JPEG bytes of frame `seq` at the given width/quality, encoded at most once"""
+        quality = int(quality or self.quality)
+        if width and width < frame.shape[1]:
+            width = int(width)
+        else:
+            width = None
+        variant = self._variant(width, quality)
+        with variant.lock:
+            if variant.seq < seq:
+                image = frame
+                if width:
+                    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+                    image = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                ok, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+                if ok:
+                    variant.seq = seq
+                    variant.jpeg = buffer.tobytes()
+                    self.encodes += 1
+            return variant.jpeg
+
+    def frames(self, width=None, quality=None, timeout=5.0):
+        """
+        Yield JPEG bytes for each new frame (None after `timeout` seconds without one)
+
+        The caller counts as a viewer until the generator is closed.
+        """
+        with self.condition:
+            self.viewers += 1
+        try:
+            last = 0
+            while True:
+                with self.condition:
+                    if self.seq <= last:
+                        self.condition.wait(timeout)
+                    if self.seq <= last:
+                        seq, frame = last, None
+                    else:
+                        seq, frame = self.seq, self.frame
+                if frame is None:
+                    yield None
+                    continue
+                last = seq
+                jpeg = self.encoded(seq, frame, width, quality)
+                if jpeg is not None:
+                    self.frames_sent += 1
+                    yield jpeg
+        finally:
+            with self.condition:
+                self.viewers -= 1
+
+    def stats(self):
+        return {
+            'viewers': self.viewers,
+            'frames_published': self.frames_published,
+            'frames_skipped': self.frames_skipped,
+            'encodes': self.encodes,
+            'frames_sent': self.frames_sent,
+            'variants': len(self.variants),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "ESP32CamRestream/1.0"
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown the detector's console
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.split('/') if p]
+        streams = self.server.streams
+        if not parts:
+            self._send_json(200, {
+                'streams': [{'id': stream_id, 'url': f"/stream/{i}", **b.stats()}
+                            for i, (stream_id, b) in enumerate(streams.items())]
+            })
+            return
+        if parts[0] != 'stream' or len(parts) > 2:
+            self._send_json(404, {'error': 'Not found'})
+            return
+
+        names = list(streams)
+        key = parts[1] if len(parts) == 2 else '0'
+        if key in streams:
+            broadcaster = streams[key]
+        elif key.isdigit() and int(key) < len(names):
+            broadcaster = streams[names[int(key)]]
+        else:
+            self._send_json(404, {'error': f"No stream '{key}'"})
+            return
+
+        query = parse_qs(url.query)
+        try:
+            width = int(query['width'][0]) if 'width' in query else None
+            quality = min(95, max(10, int(query['quality'][0]))) if 'quality' in query else None
+        except ValueError:
+            self._send_json(400, {'error': 'width and quality must be integers'})
+            return
+        self._stream(broadcaster, width, quality)
+
+    def _stream(self, broadcaster, width, quality):
+        self.send_response(200)
+        self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={BOUNDARY}')
+        self.send_header('Cache-Control', 'no-cache, private')
+        self.send_header('Pragma', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        frames = broadcaster.frames(width, quality)
+        try:
+            for jpeg in frames:
+                if self.server.closing:
+                    break
+                if jpeg is None:
+                    continue  # No new frame yet; keep the connection open
+                self.wfile.write(
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode('ascii')
+                    + jpeg + b"\r\n"
+                )
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass  # Viewer went away
+        finally:
+            frames.close()
+
+
+class RestreamServer:
+    """
+    HTTP server for a set of MjpegBroadcasters, on a daemon thread
+
+    Args:
+        streams: dict of stream id -> MjpegBroadcaster
+        host: Bind address (default config.RESTREAM_HOST)
+        port: Port (default config.RESTREAM_PORT)
+    """
+
+    def __init__(self, streams, host=None, port=None):
+        self.httpd = ThreadingHTTPServer((host or config.RESTREAM_HOST, port or config.RESTREAM_PORT), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.streams = dict(streams)
+        self.httpd.closing = False
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="restream", daemon=True)
+
+    @property
+    def port(self):
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.closing = True
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,128 @@
+"""
+Region-of-interest / lane masks for the ESP32-CAM detection system
+
+Fixed cameras usually only care about one or two lanes. config.ROI_POLYGONS
+lists polygons per camera; inference then runs only on the tight bounding
+crops of those polygons (overlapping crops are merged so nothing is detected
+twice) and detections whose ground point (bottom centre of the box) falls
+outside every polygon are dropped with one lookup into a precomputed mask,
+before any tracking, OCR or drawing happens.
+"""
+import os
+
+import cv2
+import numpy as np
+
+import config
+
+
+def polygons_for(*camera_ids, regions=None):
+    """
+    ROI polygons configured for a camera
+
+    Tries each id in turn (stream id, IP/URL, video path, video file name),
+    then the 'default' entry.
+
+    Returns:
+        List of polygons (lists of (x, y) points), empty if none are configured
+    """
+    regions = config.ROI_POLYGONS if regions is None else regions
+    for camera_id in camera_ids:
+        if not camera_id:
+            continue
+        for key in (camera_id, os.path.basename(str(camera_id))):
+            if key in regions:
+                return regions[key]
+    return regions.get('default', [])
+
+
+def _merge_rects(rects):
+    """Union overlapping (x1, y1, x2, y2) rectangles until none overlap"""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in rects]
+
+
+class RegionMask:
+    """
+    Pixel polygons, inference crops and inside/outside mask for one frame size
+
+    Args:
+        polygons: Lists of (x, y) points, either in pixels or as fractions
+                  (0-1) of the frame width/height
+        frame_shape: Shape of the frames the mask will be used on
+        pad: Pixels added around each crop so boxes on the polygon edge aren't cut
+    """
+
+    def __init__(self, polygons, frame_shape, pad=16):
+        height, width = frame_shape[:2]
+        self.frame_shape = frame_shape[:2]
+        self.polygons = []
+        for polygon in polygons:
+            points = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+            if len(points) < 3:
+                continue
+            if points.max() <= 1.0:
+                points = points * (width, height)
+            self.polygons.append(np.round(points).astype(np.int32))
+
+        self.mask = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(self.mask, self.polygons, 1)
+
+        rects = []
+        for points in self.polygons:
+            x, y, w, h = cv2.boundingRect(points)
+            rects.append((max(0, x - pad), max(0, y - pad), min(width, x + w + pad), min(height, y + h + pad)))
+        self.crops = [r for r in _merge_rects(rects) if r[2] > r[0] and r[3] > r[1]]
+
+        # Fraction of the frame the model actually sees
+        crop_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in self.crops)
+        self.coverage = crop_area / float(width * height)
+
+    def __bool__(self):
+        return bool(self.crops)
+
+    def crop(self, frame):
+        """Views of the frame for each inference crop"""
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in self.crops]
+
+    def merge(self, results):
+        """
+        Shift per-crop (N, 6) detections back to frame pixels and keep those inside a polygon
+
+        Returns:
+            One (N, 6) array for the whole frame
+        """
+        shifted = []
+        for (x1, y1, _, _), raw in zip(self.crops, results):
+            if len(raw):
+                raw = raw.copy()
+                raw[:, [0, 2]] += x1
+                raw[:, [1, 3]] += y1
+                shifted.append(raw)
+        if not shifted:
+            return np.zeros((0, 6), dtype=np.float32)
+        raw = np.concatenate(shifted)
+        return raw[self.inside(raw)]
+
+    def inside(self, boxes):
+        """Boolean array: box ground point (bottom centre) lies inside a polygon"""
+        height, width = self.frame_shape
+        cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(np.int32), 0, width - 1)
+        by = np.clip(boxes[:, 3].astype(np.int32) - 1, 0, height - 1)
+        return self.mask[by, cx].astype(bool)
+
+    def draw(self, image, color=(255, 0, 255)):
+        cv2.polylines(image, self.polygons, True, color, 1)
@@ -0,0 +1,139 @@
+"""
+Parity test for the ONNX Runtime / OpenVINO inference backends
+
+Runs the same frames through the PyTorch backend and an exported backend and
+checks that every torch box has a matching box (same class, IoU above a
+threshold, similar confidence) in the other backend's output.
+
+Usage:
+  python test_backends.py               # onnx vs torch
+  python test_backends.py openvino      # openvino vs torch
+  pytest test_backends.py               # onnx vs torch, skipped if a backend can't load
+"""
+
+import sys
+import os
+
+IOU_TOLERANCE = 0.9     # Matching boxes must overlap at least this much
+CONF_TOLERANCE = 0.05   # and differ in confidence by at most this
+MIN_MATCH_RATE = 0.95   # Fraction of torch boxes that must be matched
+
+
+class BackendUnavailable(Exception):
+    """A backend (or torch, the reference) can't be loaded here, so nothing was compared"""
+
+
+def load_test_frames(max_frames=5):
+    """A few frames from the bundled clips, or synthetic frames if there are none"""
+    import cv2
+    import numpy as np
+
+    frames = []
+    for video in ('traffic.mp4', 'car1.mp4'):
+        if not os.path.exists(video):
+            continue
+        cap = cv2.VideoCapture(video)
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+            # Spread the samples out a little
+            cap.set(cv2.CAP_PROP_POS_FRAMES, cap.get(cv2.CAP_PROP_POS_FRAMES) + 30)
+        cap.release()
+    if not frames:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(max_frames)]
+    return frames
+
+
+def match_rate(reference, candidate):
+    """Fraction of reference boxes with a same-class box within tolerance in candidate"""
+    from tracker import iou_matrix
+
+    if len(reference) == 0:
+        return 1.0
+    if len(candidate) == 0:
+        return 0.0
+    iou = iou_matrix(reference[:, :4], candidate[:, :4])
+    same_class = reference[:, None, 5] == candidate[None, :, 5]
+    close_conf = abs(reference[:, None, 4] - candidate[None, :, 4]) <= CONF_TOLERANCE
+    matched = ((iou >= IOU_TOLERANCE) & same_class & close_conf).any(axis=1)
+    return float(matched.mean())
+
+
+def check_backend_parity(backend='onnx'):
+    """
+    Boxes from an exported backend must match the torch backend within tolerance
+
+    Raises:
+        BackendUnavailable: If either backend can't be loaded
+        AssertionError: If the boxes don't match
+    """
+    print(f"\nComparing {backend} against torch...")
+    try:
+        from backends import OnnxBackend, OpenVINOBackend, TorchBackend
+        import config
+        torch_backend = TorchBackend(config.YOLO_MODEL)
+        backend_class = OnnxBackend if backend == 'onnx' else OpenVINOBackend
+        other = backend_class(config.YOLO_MODEL)
+    except Exception as e:
+        raise BackendUnavailable(str(e)) from e
+
+    assert other.names == torch_backend.names, "Class names differ between backends"
+
+    ok = True
+    for i, frame in enumerate(load_test_frames()):
+        reference = torch_backend.detect(frame)
+        candidate = other.detect(frame)
+        rate = match_rate(reference, candidate)
+        status = "✓" if rate >= MIN_MATCH_RATE else "✗"
+        print(f"  {status} Frame {i}: torch={len(reference)} boxes, {backend}={len(candidate)} boxes, matched {rate:.0%}")
+        ok = ok and rate >= MIN_MATCH_RATE
+
+    assert ok, f"{backend} boxes do not match torch within tolerance"
+    print(f"✓ {backend} backend matches torch")
+
+
+def test_backend_parity():
+    """pytest: onnx vs torch"""
+    import pytest
+    try:
+        check_backend_parity('onnx')
+    except BackendUnavailable as e:
+        pytest.skip(f"onnx backend unavailable: {e}")
+
+
+def main():
+    print("=" * 60)
+    print("Inference Backend Parity Test")
+    print("=" * 60)
+
+    backends = sys.argv[1:] or ['onnx']
+    skipped = []
+    try:
+        for backend in backends:
+            try:
+                check_backend_parity(backend)
+            except BackendUnavailable as e:
+                print(f"⚠ Skipping {backend} parity test: {e}")
+                skipped.append(backend)
+    except AssertionError as e:
+        print(f"\n❌ {e}")
+        return False
+
+    print("\n" + "=" * 60)
+    if len(skipped) == len(backends):
+        print(f"⚠ Skipped ({', '.join(skipped)}): backends could not be loaded, nothing was compared")
+    elif skipped:
+        print(f"✓ {', '.join(b for b in backends if b not in skipped)} match torch "
+              f"(skipped: {', '.join(skipped)})")
+    else:
+        print("✓ All backends match!")
+    print("=" * 60)
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,175 @@
+"""
+Multi-object tracker for the ESP32-CAM detection system
+
+SORT-style tracking without the Kalman filter: each track keeps its last box
+and a smoothed per-frame velocity, predicted boxes are matched to new
+detections by IoU (Hungarian assignment when SciPy is installed, greedy
+otherwise), and anything left over gets a second chance on centroid distance
+so fast vehicles on skipped frames keep their ID. All track state lives in
+NumPy arrays so one update is a handful of vectorised operations.
+"""
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except Exception:
+    linear_sum_assignment = None
+
+
+def iou_matrix(a, b):
+    """IoU between every box in a (N,4) and every box in b (M,4), as x1,y1,x2,y2"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def match(score, threshold):
+    """
+    Assign rows to columns maximising score, ignoring pairs below threshold
+
+    Returns:
+        (rows, cols) index arrays of matched pairs
+    """
+    if score.size == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(-score)
+    else:
+        # Greedy: best remaining pair first
+        order = np.argsort(-score, axis=None)
+        rows_all, cols_all = np.unravel_index(order, score.shape)
+        used_rows = np.zeros(score.shape[0], dtype=bool)
+        used_cols = np.zeros(score.shape[1], dtype=bool)
+        rows, cols = [], []
+        for r, c in zip(rows_all, cols_all):
+            if score[r, c] < threshold:
+                break
+            if used_rows[r] or used_cols[c]:
+                continue
+            used_rows[r] = used_cols[c] = True
+            rows.append(r)
+            cols.append(c)
+        rows, cols = np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+    keep = score[rows, cols] >= threshold
+    return rows[keep], cols[keep]
+
+
+class VehicleTracker:
+    """
+    Assigns persistent IDs to detections across frames
+
+    Args:
+        iou_threshold: Minimum IoU between a predicted track box and a detection
+        max_age: Number of updates a track survives without a match
+        max_centroid_dist: Fallback match radius, as a fraction of the track's box diagonal
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=10, max_centroid_dist=0.6):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.max_centroid_dist = max_centroid_dist
+        self.next_id = 1
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.velocity = np.empty((0, 4), dtype=np.float32)
+        self.misses = np.empty(0, dtype=np.int32)
+        self.hits = np.empty(0, dtype=np.int32)
+
+        self.removed = []  # IDs dropped by the last update()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def active_ids(self):
+        return set(self.ids.tolist())
+
+    def update(self, boxes):
+        """
+        Match this frame's detections to existing tracks
+
+        Args:
+            boxes: (N,4) array-like of x1,y1,x2,y2 detection boxes
+
+        Returns:
+            (N,) array of track IDs, aligned with the input boxes
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        assigned = np.zeros(len(boxes), dtype=np.int64)
+
+        predicted = self.boxes + self.velocity
+        det_rows = np.arange(len(boxes))
+        trk_rows = np.arange(len(self.ids))
+
+        # Pass 1: IoU against predicted boxes
+        t_idx, d_idx = match(iou_matrix(predicted, boxes), self.iou_threshold)
+
+        # Pass 2: centroid distance for whatever is left
+        free_t = np.setdiff1d(trk_rows, t_idx)
+        free_d = np.setdiff1d(det_rows, d_idx)
+        if len(free_t) and len(free_d):
+            trk_centres = (predicted[free_t, :2] + predicted[free_t, 2:]) / 2
+            det_centres = (boxes[free_d, :2] + boxes[free_d, 2:]) / 2
+            diag = np.hypot(predicted[free_t, 2] - predicted[free_t, 0],
+                            predicted[free_t, 3] - predicted[free_t, 1])
+            dist = np.linalg.norm(trk_centres[:, None, :] - det_centres[None, :, :], axis=2)
+            score = 1.0 - dist / np.maximum(diag[:, None] * self.max_centroid_dist, 1e-9)
+            t2, d2 = match(score, 1e-6)
+            t_idx = np.concatenate([t_idx, free_t[t2]])
+            d_idx = np.concatenate([d_idx, free_d[d2]])
+
+        # Matched tracks: smooth velocity, take the new box
+        if len(t_idx):
+            motion = boxes[d_idx] - self.boxes[t_idx]
+            self.velocity[t_idx] = 0.5 * self.velocity[t_idx] + 0.5 * motion
+            self.boxes[t_idx] = boxes[d_idx]
+            self.misses[t_idx] = 0
+            self.hits[t_idx] += 1
+            assigned[d_idx] = self.ids[t_idx]
+
+        # Unmatched tracks coast on their velocity and age
+        missed = np.ones(len(self.ids), dtype=bool)
+        missed[t_idx] = False
+        self.boxes[missed] = predicted[missed]
+        self.misses[missed] += 1
+
+        # Drop tracks that have been gone too long
+        alive = self.misses <= self.max_age
+        self.removed = self.ids[~alive].tolist()
+        self.ids = self.ids[alive]
+        self.boxes = self.boxes[alive]
+        self.velocity = self.velocity[alive]
+        self.misses = self.misses[alive]
+        self.hits = self.hits[alive]
+
+        # Unmatched detections start new tracks
+        new_d = np.setdiff1d(det_rows, d_idx)
+        if len(new_d):
+            new_ids = np.arange(self.next_id, self.next_id + len(new_d), dtype=np.int64)
+            self.next_id += len(new_d)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.boxes = np.concatenate([self.boxes, boxes[new_d]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((len(new_d), 4), dtype=np.float32)])
+            self.misses = np.concatenate([self.misses, np.zeros(len(new_d), dtype=np.int32)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new_d), dtype=np.int32)])
+            assigned[new_d] = new_ids
+
+        return assigned
+
+    def reset(self):
+        self.removed = self.ids.tolist()
+        self.ids = self.ids[:0]
+        self.boxes = self.boxes[:0]
+        self.velocity = self.velocity[:0]
+        self.misses = self.misses[:0]
+        self.hits = self.hits[:0]